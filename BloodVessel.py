@@ -1,10 +1,9 @@
 from __future__ import annotations
 
 from abc import ABC, abstractmethod
-from math import sqrt, pi
 
 from LinAlg import LineSegment
-from PointSampleHeuristic import PointSampleHeuristic
+from VesselTree import VesselTree
 
 
 def test_for_length_zero(group):
@@ -15,25 +14,49 @@ def test_for_length_zero(group):
     return False
 
 
+def vessel_view(tree: VesselTree, index: int) -> BaseBloodVessel:
+    """:returns the blood vessel object for the vessel at this index of the tree, creating it if it doesn't exist. """
+    v = tree.views.get(index)
+    if v is None:
+        v = Origin.__new__(Origin) if index == VesselTree.ORIGIN else BloodVessel.__new__(BloodVessel)
+        BaseBloodVessel.__init__(v, tree, index)
+    return v
+
+
 class BaseBloodVessel(ABC):
-    """Parent class for the root and daughter blood vessels. """
+    """Parent class for the root and daughter blood vessels.
+    These are thin views onto a single vessel of a VesselTree, which stores the actual data.
+    """
 
-    GAMMA = 3  # Required for Murray's Law
+    GAMMA = VesselTree.GAMMA  # Required for Murray's Law
 
-    def __init__(self, distal_point):
-        self._d = distal_point
-        self._c = []
+    def __init__(self, tree: VesselTree, index: int):
+        self._t = tree
+        self._i = index
+        tree.views[index] = self
 
     def __eq__(self, other):
         """Two subtrees are considered 'equal' if they correspond to the same points in space. """
+        if self is other:
+            return True  # Each vessel only has one view, so there's no need to compare the whole subtree.
         return self.radius == other.radius and \
             self.distal_point == other.distal_point and \
             all(c_self == c_other for c_self, c_other in zip(self.children, other.children))    \
 
     @property
-    @abstractmethod
+    def tree(self) -> VesselTree:
+        """The tree that stores this vessel. """
+        return self._t
+
+    @property
+    def index(self) -> int:
+        """The index of this vessel in its tree. """
+        return self._i
+
+    @property
     def cost(self):
         """The cost of a subtree is the volume of blood that it needs to fill it. """
+        return self._t.cost_of(self._i)
 
     @property
     @abstractmethod
@@ -43,43 +66,41 @@ class BaseBloodVessel(ABC):
     @property
     def distal_point(self):
         """The distal (outflow) point of the blood vessel. """
-        return self._d
+        return self._t.point_of(self._i)
 
     @distal_point.setter
     def distal_point(self, d):
-        self._d = d
+        self._t.set_point(self._i, d)
 
     @property
     def children(self):
         """A list of blood vessels that are fed by this one. """
-        return self._c
+        t = self._t
+        return [vessel_view(t, c) for c in t.children_of(self._i)]
 
     def create_child(self, radius, distal_point):
         """Create and :return a child of this vessel with a given radius and distal point. """
-        child = BloodVessel(radius, self, distal_point)
-        self.children.append(child)
-        return child
+        return vessel_view(self._t, self._t.create_child(self._i, radius, distal_point))
 
     def add_child(self, child):
         """Add a direct descendant to this vessel. """
-        # TODO: Enforce exactly two children.
-        self._c.append(child)
+        self._t.attach_child(self._i, child.index)
 
     def remove_child(self, child):
         """Remove a child from the collection of children. """
-        self._c.remove(child)
+        self._t.detach_child(self._i, child.index)
 
     @property
-    @abstractmethod
     def num_terminals(self):
         """The number of terminals that can be reached from this vessel. """
+        return self._t.num_terminals_of(self._i)
 
     @property
     def resistance(self):
         """The resistance of the blood vessel according to ?????. """
         # TODO: Needs to be in BaseBloodVessel or BloodVessel?
         # TODO: Include actual calculation of resistance.
-        return self._r ** -4
+        return self.radius ** -4
 
     @abstractmethod
     def set_scaling_factor(self, scaling_factor):
@@ -89,9 +110,9 @@ class BaseBloodVessel(ABC):
     def copy_subtree(self):
         """:returns a new vessel that is a copy of this one, and whose descendants are all copies. """
 
-    @abstractmethod
     def copy_whole_tree(self):
         """:returns a new vessel that is a copy of this one in an identical tree that is a copy. """
+        return vessel_view(self._t.copy(), self._i)
 
     @property
     @abstractmethod
@@ -188,37 +209,31 @@ class BaseBloodVessel(ABC):
 class Origin(BaseBloodVessel):
 
     def __init__(self, radius, distal_point) -> None:
-        self._r = radius
-        super().__init__(distal_point)
+        super().__init__(VesselTree(radius, distal_point), VesselTree.ORIGIN)
+
+    @staticmethod
+    def from_tree(tree: VesselTree) -> Origin:
+        """:returns the origin of an existing tree. """
+        return vessel_view(tree, VesselTree.ORIGIN)
 
     @property
     def radius(self):
-        return self._r
+        return self._t.radius
 
     @property
     def root(self):
-        return self._c[0]
-
-    def copy_subtree(self):
-        v = Origin(self.radius, self.distal_point)
-        for c in self.children:
-            new_c = c.copy_subtree()
-            new_c.parent = v
-            v.add_child(new_c)
-        return v
+        return vessel_view(self._t, self._t.root)
 
-    def copy_whole_tree(self):
-        return self.copy_subtree()
+    def vessel(self, index):
+        """:returns the vessel at this index of the tree. """
+        return vessel_view(self._t, index)
 
-    def copy_as_parent(self, old, new):
-        assert self._c[0] == old
-        v = Origin(self.radius, self.distal_point)
-        new.parent = v
-        v.add_child(new)
+    def terminal_index(self):
+        """:returns an index of the terminal points of the tree, for distance queries over many points at once. """
+        return self._t.terminal_index()
 
-    @property
-    def num_terminals(self):
-        return self.root.num_terminals
+    def copy_subtree(self):
+        return self.copy_whole_tree()
 
     @property
     def descendants(self):
@@ -226,11 +241,7 @@ class Origin(BaseBloodVessel):
         return self.root.descendants
 
     def set_scaling_factor(self, scaling_factor):
-        self._r *= scaling_factor
-
-    @property
-    def cost(self):
-        return self.root._cost_from_radius(self.radius)
+        self._t.radius *= scaling_factor
 
     def rescale(self):
         pass
@@ -238,200 +249,71 @@ class Origin(BaseBloodVessel):
 
 class BloodVessel(BaseBloodVessel):
 
-    def __init__(self, scale, parent, distal_point):
-        super().__init__(distal_point)
-        self._p = parent
-        self._s = scale
-        self._k_res = 0  # The resistance of the distal subtree. (Zero if there is no distal subtree)
-        self._n = 0  # The number of terminals in this vessel's subtree. TODO: Use this.
-
     @property
     def radius(self):
-        return self.parent.radius * self._s
+        return self._t.radius_of(self._i)
+
+    @property
+    def scaling_factor(self):
+        """The ratio of the radius of this vessel to the radius of its parent. """
+        return self._t.scaling_factor_of(self._i)
+
+    @property
+    def resistance_coefficient(self):
+        """The resistance of the distal subtree. (Zero if there is no distal subtree) """
+        return self._t.resistance_coefficient_of(self._i)
 
     @property
     def proximal_point(self):
-        return self._p.distal_point
+        return self._t.proximal_point_of(self._i)
 
     @property
     def parent(self):
-        return self._p
-
-    @parent.setter
-    def parent(self, p):
-        self._p = p
+        return vessel_view(self._t, self._t.parent_of(self._i))
 
     @property
     def descendants(self):
-        yield self
-        for c in self.children:
-            for d in c.descendants:
-                yield d
+        t = self._t
+        return (vessel_view(t, i) for i in t.descendants_of(self._i))
 
     @property
     def length(self):
         """The length of the blood vessel. """
         # TODO: Remove references to this.
-        return self.line_seg.length
+        return self._t.length_of(self._i)
 
     def copy_subtree(self):
-        v = BloodVessel(self._s, self.parent, self.distal_point)
-        for c in self.children:
-            new_c = c.copy_subtree()
-            new_c.parent = v
-            v.add_child(new_c)
-        return v
-
-    def copy_whole_tree(self):
-        new_self = self.copy_subtree()
-        self.parent.copy_as_parent(self, new_self)
-        return new_self
-
-    def copy_as_parent(self, old, new):
-        # Don't return a value since we mutate new with a reference to this object
-        v = BloodVessel(self._s, self.parent, self.distal_point)
-        for c in self.children:
-            if c is not old:
-                new_c = c.copy_subtree()
-                new_c.parent = v
-                v.add_child(new_c)
-            else:
-                new.parent = v
-                v.add_child(new)
-        self.parent.copy_as_parent(self, v)
-
-    @property
-    def num_terminals(self):
-        # TODO: Make this a variable that can be looked up.
-        return sum(v.num_terminals for v in self._c) if len(self._c) > 0 else 1
+        # The copy lives in a copy of the whole tree, since a subtree can't be stored without its ancestors.
+        return self.copy_whole_tree()
 
     def bifurcate(self, terminal_point, bifurcation_point=None):
         """Attach a new terminal to the tree by creating a bifurcation point on this blood vessel. """
-        # Get local copies of the variables that we need. (Improves readability in equations)
-        xp = self.proximal_point
-        xd = self.distal_point
-        g = BloodVessel.GAMMA
-        nt = self.num_terminals
-        s = self._s
-        if bifurcation_point is None:
-            bifurcation_point = (xp + xd) * 0.5
-        # Make all the vessels and connect them together. Use dummy values for the scaling factors for now.
-        self.parent.remove_child(self)
-        new_parent = self.parent.create_child(1.0, bifurcation_point)
-        self.parent = new_parent
-        new_parent.add_child(self)
-        new_parent.create_child(1.0, terminal_point)
         # The old vessel is the 0th child
         # The new vessel is the 1st child
-        self.parent.rescale()
+        self._t.bifurcate(self._i, terminal_point, bifurcation_point)
 
-    def geometrically_optimise(self):
+    def evaluate_bifurcation(self, terminal_point, refine=False):
+        """Find the best bifurcation on this vessel for reaching terminal_point, without changing the tree. """
+        return self._t.evaluate_bifurcation(self._i, terminal_point, refine)
+
+    def geometrically_optimise(self, refine=False):
         """Choose the best proximal point for this vessel. """
-        # print("Optimising: ")
-        assert not isinstance(self.parent, Origin)
-        va = self.parent
-        vb = self.parent.children[0]
-        vc = self.parent.children[1]
-        assert vb is self
-        # Find the origin. TODO: Extract to another method
-        origin = self
-        while not isinstance(origin, Origin):
-            origin = origin.parent
-        INTERVALS = 10
-        xa = va.proximal_point
-        xb = vb.distal_point
-        xc = vc.distal_point
-        sample = PointSampleHeuristic(xa, xb, xc, INTERVALS)
-        best_c = origin.cost
-        best_p = va.distal_point
-        for p in sample.points:
-            # We set the bifurcation point to be p, then rescale up to the root
-            va.distal_point = p
-            # Don't consider bifurcations that create zero-length vessels
-            if va.length == 0 or vb.length == 0 or vc.length == 0:
-                # print(f"{p} (rejected)")
-                continue
-            self.parent.rescale()
-            this_c = origin.cost
-            if this_c < best_c:
-                # print("best: ", end="")
-                best_c = this_c
-                best_p = p
-            # print(f"{p}: {this_c}")
-        va.distal_point = best_p
-        self.parent.rescale()
-        # print("Best point: {best_p}")
+        self._t.geometrically_optimise(self._i, refine)
 
     def remove_bifurcation(self):
         """Remove the bifurcation point that is at the root of this vessel. """
-        parent = self.parent
-        new_s = parent._s
-        assert isinstance(parent, BloodVessel)
-        new_parent = parent.parent
-        new_parent.remove_child(parent)
-        new_parent.add_child(self)
-        self.parent = new_parent
-        self.set_scaling_factor(new_s)
-        self.parent.rescale()
+        self._t.remove_bifurcation(self._i)
 
     def set_scaling_factor(self, scaling_factor):
-        self._s = scaling_factor
+        self._t.set_scaling_factor(self._i, scaling_factor)
 
     def rescale(self):
-        assert len(self._c) == 2
-
-        g = BloodVessel.GAMMA
-
-        # Get the vessels
-        v_a = self._c[0]  # After a bifurcation has been added, this will be the original vessel
-        v_b = self._c[1]  # After a bifurcation has been added, this will be the new vessel
-
-        # Get the number of terminals for each vessel
-        nt_a = v_a.num_terminals
-        nt_b = v_b.num_terminals
-
-        # Get the "resistance coefficients" for each distal subtree
-        k_a = v_a._k_res
-        k_b = v_b._k_res
-
-        # Get the lengths of each vessel
-        l_a = v_a.length
-        l_b = v_b.length
-
-        # Compute the full "resistance coefficients" for each vessel
-        res_a = k_a + l_a
-        res_b = k_b + l_b
-
-        # res_ratio = res_b / res_a
-        s_ratio = ((nt_b * res_b) / (nt_a * res_a)) ** (1 / 4)  # = s_b / s_a
-
-        s_a = (1 + s_ratio ** g) ** (-1 / g)
-        s_b = (1 + s_ratio ** -g) ** (-1 / g)
-
-        # We need to update the "resistance coefficients".
-
-        k_new_inv = (s_a ** 4 / res_a) + (s_b ** 4 / res_b)
-        self._k_res = k_new = 1 / k_new_inv
-
-        # An extension to the project could be to further reduce these tolerance values!
-        assert abs(1.0 - s_a ** g - s_b ** g) < 1e-13  # I.e. satisfies Murray's Law
-        assert abs(res_a * nt_a * s_a ** -4 - res_b * nt_b * s_b ** -4) < 1e-9  # I.e. parallel pressures are equal
-        assert abs((self.length + k_new) * (nt_a + nt_b)
-                   - self.length * (nt_a + nt_b)
-                   - res_a * nt_a * s_a ** -4) < 1e-9  # I.e. pressure drops are consistent
-
-        v_a.set_scaling_factor(s_a)
-        v_b.set_scaling_factor(s_b)
-        self.parent.rescale()
+        self._t.rescale(self._i)
 
     @property
     def line_seg(self):
         return LineSegment(self.proximal_point, self.distal_point)
 
-    @property
-    def cost(self):
-        return self._cost_from_radius(self.radius)
-
     @property
     def resistance(self):
         """An approximation for the resistance of the blood vessel. """
@@ -452,14 +334,6 @@ class BloodVessel(BaseBloodVessel):
             else 1 / sum(1 / (v.find_subtree_resistance()) for v in self.children)
         return self.resistance + res_distal
 
-    def _cost_from_radius(self, radius):
-        # For if we already know the radius (to avoid recomputing)
-        r = radius * self._s
-        xp, yp = self.proximal_point
-        xd, yd = self.distal_point
-        length = sqrt((xp - xd) ** 2 + (yp - yd) ** 2)
-        return pi * r ** 2 * length + sum(c._cost_from_radius(r) for c in self._c)
-
 #class VesselGroup:
 #        # TODO: Old Version
 #    """A wrapper for collections of blood vessels so that their total cost can be found easily."""
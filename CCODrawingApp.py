@@ -1,4 +1,3 @@
-import csv
 import logging
 from collections import defaultdict
 from datetime import datetime
@@ -6,8 +5,11 @@ from datetime import datetime
 import matplotlib.pyplot as plt
 import pygame as pg
 
+from BloodVessel import Origin
 from CCONetworkMaker import CCONetworkMaker
 from LinAlg import Vec2D
+from ResultsStream import ResultsWriter
+from TreeIO import TreeIO
 from VascularDomain import CircularVascularDomain
 from utils import write_data_to_file
 
@@ -26,23 +28,29 @@ class CCODrawingApp:
         self.domain = v = CircularVascularDomain(GLOBAL_RADIUS)
         self.maker = m = CCONetworkMaker(CCODrawingApp.RADIUS, Vec2D(400, 0), None, v)
         tree_gen = m.generate_trees(iterations)
-        self.trees = ts = []
-        for i, tr in enumerate(tree_gen):
-            logging.info(f"Starting iteration {i + 1}")
-            self.trees.append(tr)
-            CCODrawingApp.write_pressures_flows_to_file(i, tr)
-        self.vessel_furthest_point = m.greatest_distance_from_vessel(ts[iterations - 1], SAMPLES)
-        self.terminal_furthest_point = m.greatest_distance_from_terminal(ts[iterations - 1], SAMPLES)
-        self.blackbox_counts = m.count_blackboxes(ts[iterations - 1], SAMPLES)
+        # Only the final tree is kept. The others are rebuilt from the growth log when they are drawn.
+        self.final_tree = None
+        # The results of every iteration go into one file, which can be read back with a ResultsReader.
+        with ResultsWriter("results/results.npys") as results:
+            for i, tr in enumerate(tree_gen):
+                logging.info(f"Starting iteration {i + 1}")
+                self.final_tree = tr
+                results.write(tr.tree)
+        self.log = m.growth_log
+        TreeIO.save(self.final_tree, "results/tree.vtree")  # Can be opened again with TreeIO.load.
+        # All the distance metrics come from the same measurements of the final tree over the point grid.
+        self.field = f = m.distance_field(self.final_tree, SAMPLES)
+        self.vessel_furthest_point = f.greatest_distance_from_vessel()
+        self.terminal_furthest_point = f.greatest_distance_from_terminal()
+        self.blackbox_counts = f.blackboxes()
         logging.info(f"Vessel Furthest Point is {self.vessel_furthest_point[0]}")
         logging.info(f"Terminal Furthest Point is {self.terminal_furthest_point[0]}")
-        self.compute_sample_point_distances(list(v.point_grid(SAMPLES)))
+        self.compute_sample_point_distances(f)
 
-    def compute_sample_point_distances(self, sample_points):
-        """For the final tree, record the distances to and from each point in a file"""
-        t = self.trees[-1]  # The final tree
-        vessel_furthest_points = {s: self.maker.distance_from_vessel(t, s) for s in sample_points}
-        terminal_furthest_points = {s: self.maker.distance_from_terminal(t, s) for s in sample_points}
+    def compute_sample_point_distances(self, field):
+        """For the final tree, record the distances to and from each point of the distance field in a file"""
+        vessel_furthest_points = {s: field.nearest_vessel(k) for k, s in enumerate(field.points)}
+        terminal_furthest_points = {s: field.nearest_terminal(k) for k, s in enumerate(field.points)}
         vessel_data = ((a, b, c) for a, (b, c) in vessel_furthest_points.items())
         write_data_to_file("cco/vessel.txt", vessel_data, ("Point", "Distance", "Start and End Point"))
         terminal_data = ((a, b, c) for a, (b, c) in terminal_furthest_points.items())
@@ -50,39 +58,6 @@ class CCODrawingApp:
         write_data_to_file("cco/blackboxes.txt", self.blackbox_counts, ("Point", "Count"))
         return vessel_furthest_points, terminal_furthest_points
 
-    @staticmethod
-    def write_pressures_flows_to_file(identifier, tree):
-        # Store readable identifiers for each vessel
-        vessel_names = {}
-        for i, v in enumerate(tree.descendants):
-            vessel_names[repr(v)] = f"v{i}"
-        # A list of key-value pairs for the construction and reading of vessel dictionaries
-        vessel_maker = [
-            ("id", lambda x: vessel_names[repr(x)]),
-            ("proximal point", lambda x: x.proximal_point),
-            ("distal point", lambda x: x.distal_point),
-            ("length", lambda x: x.length),
-            ("radius", lambda x: x.radius),
-            ("scaling factor", lambda x: x._s),
-            ("resistance constant", lambda x: x._k_res),
-            ("resistance", lambda x: x.resistance),
-            ("pressure drop", lambda x: x.resistance * x.num_terminals),
-            ("parent", lambda x: vessel_names[repr(x.parent)] if x.parent is not tree else None),
-            ("number of terminals", lambda x: x.num_terminals),
-            ("left child", lambda x: vessel_names[repr(x.children[0])] if len(x.children) > 0 else None),
-            ("right child", lambda x: vessel_names[repr(x.children[1])] if len(x.children) > 0 else None),
-        ]
-        vessels = []
-        for v in tree.descendants:
-            this_vessel = {}
-            for k, f in vessel_maker:
-                this_vessel[k] = str(f(v))
-            vessels.append(this_vessel)
-        with open(f"results/results{identifier}.txt", mode="w", newline="") as f:
-            my_writer = csv.DictWriter(f, delimiter="\t", fieldnames=[t[0] for t in vessel_maker])
-            my_writer.writeheader()
-            my_writer.writerows(vessels)
-
     def graph(self):
         # We have pairs of points and counts.
         # We want pairs of counts and frequencies.
@@ -111,22 +86,24 @@ class CCODrawingApp:
         self.surface.fill((0, 0, 0))
         pg.display.flip()
         logging.info(f"Drawing state at iteration {index + 1}")
+        tree = Origin.from_tree(self.log.tree_at(index))
         # Draw micro-circulatory black boxes
-        print(self.domain.characteristic_length(self.trees[index].num_terminals))
-        for v in self.trees[index].descendants:
+        print(self.domain.characteristic_length(tree.num_terminals))
+        for v in tree.descendants:
             if len(v.children) == 0:  # I.e. vessel is a terminal
                 pg.draw.circle(surface=self.surface,
                                color=(127, 0, 127),
-                               radius=round(self.domain.characteristic_length(self.trees[index].num_terminals)),
+                               radius=round(self.domain.characteristic_length(tree.num_terminals)),
                                center=tuple(v.distal_point),
                                )
         # Draw grid sample points
-        self._draw_circles(self.domain.point_grid(SAMPLES),
+        points, inside = self.domain.grid_array(SAMPLES)
+        self._draw_circles(points[inside].tolist(),
                            1,
                            (0, 0, 255)
                            )
         # Draw vessels
-        for v in self.trees[index].descendants:
+        for v in tree.descendants:
             r = round(v.radius) if DRAW_RADII else 1
             pg.draw.line(surface=self.surface,
                          color=(255, 0, 0),
@@ -154,7 +131,7 @@ class CCODrawingApp:
         #self.graph()
         self.draw(i := 0)
         running = True
-        n = len(self.trees) - 1
+        n = len(self.log) - 1
         while running:
             for event in pg.event.get():
                 if event.type == pg.QUIT:
@@ -1,39 +1,102 @@
 import logging
 import math
-from collections import Generator
-from dataclasses import dataclass, field
-from queue import PriorityQueue
-from typing import Any
+import pickle
+from collections.abc import Generator
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
 
 from BloodVessel import BaseBloodVessel, Origin, BloodVessel
-from LinAlg import LineSegment
+from DistanceField import DistanceField
+from GrowthLog import GrowthLog
+from LinAlg import Vec2D, segments_intersect
+from SpatialIndex import SegmentGrid
 from VascularDomain import VascularDomain
+from VesselTree import VesselTree
+
+
+def _score_candidates(tree: VesselTree, terminal_point, candidates, refine=False):
+    """Evaluate the bifurcation of each (depth, distance, vessel index) candidate of the tree.
+    This is module level so that it can be run in a worker process.
+    :returns the (cost, depth, distance, vessel index, bifurcation point) of each valid candidate.
+    """
+    scored = []
+    for depth, distance, i in candidates:
+        e = tree.evaluate_bifurcation(i, terminal_point, refine)
+        # Don't consider the vessel further if it is mis-formed.
+        if e.valid:
+            scored.append((e.cost, depth, distance, i, e.point))
+    return scored
 
 
-def _has_misformed_vessels(vessels):
-    for v in vessels:
-        if v.radius > v.length:
-            # Don't consider bifurcations that create a zero-length vessel.
-            return True
+_shared_tree = None  # The tree most recently read from shared memory by this worker process, and its generation.
+_shared_generation = None
 
 
-@dataclass(order=True)
-class PrioritisedItem:
-    priority: float
-    item: Any = field(compare=False)
+def _score_shared_candidates(name, size, generation, terminal_point, candidates, refine=False):
+    """Evaluate the candidates as _score_candidates does, for the tree pickled into the first size bytes of the shared
+    memory block called name. The tree is only unpickled the first time this worker is given each generation of it.
+    """
+    global _shared_tree, _shared_generation
+    if generation != _shared_generation:
+        block = SharedMemory(name)
+        try:
+            with block.buf[:size] as data:
+                _shared_tree = pickle.loads(data)
+        finally:
+            block.close()
+        _shared_generation = generation
+    return _score_candidates(_shared_tree, terminal_point, candidates, refine)
 
 
 class CCONetworkMaker:
 
-    def __init__(self, radius, initial_point, flow, domain: VascularDomain) -> None:
+    INDEX_CELLS = 32  # The default number of cells across the spatial index.
+    MIN_PARALLEL_CANDIDATES = 64  # Fewer candidates than this are scored in-process, as the workers aren't worth it.
+    TERMINAL_BATCH = 50  # The number of terminal points tried at each distance threshold before it is relaxed.
+
+    def __init__(self, radius, initial_point, flow, domain: VascularDomain, index_cell_size=None,
+                 max_candidates=None, candidate_radius=None, audit_candidates=False, workers=None,
+                 refine_bifurcations=False, seed=None) -> None:
+        """The candidate vessels for each new terminal are tried nearest first. By default every vessel is tried, but
+        the search can be bounded to the nearest max_candidates vessels and/or the vessels within candidate_radius of
+        the terminal. (If none of those can be bifurcated, the search carries on past the bound until one can.)
+        With audit_candidates, every vessel is still tried so that we can record how often the best bifurcation lies
+        outside the bound, but the tree is grown using the best bifurcation inside the bound.
+        With more than one worker, the candidates are scored in a pool of worker processes. The tree is pickled into
+        shared memory once at each iteration, and each worker reads it from there, so only the candidates and the
+        terminal point are sent with each job. The trees grown are exactly the same as with one worker.
+        With refine_bifurcations, the best sampled bifurcation point of each candidate is improved on by a few steps
+        of the Nelder-Mead method. (This needs scipy)
+        The terminal points are drawn from a numpy random Generator made from seed (or seed can be the Generator
+        itself), so the same seed always grows the same trees.
+        """
         self.radius = radius
         self.initial_point = initial_point
         self.flow = flow    #TODO: Never used!
         self.domain = domain
+        self.index_cell_size = index_cell_size
+        self.max_candidates = max_candidates
+        self.candidate_radius = candidate_radius
+        self.audit_candidates = audit_candidates
+        self.workers = workers
+        self.refine_bifurcations = refine_bifurcations
+        self.rng = np.random.default_rng(seed)
+        self._executor = None  # The pool of worker processes, while the trees are being generated.
+        self._block = None  # The shared memory that the tree is sent to the workers in.
+        self._shared = None  # The (generation, size in bytes) of the tree in the shared memory.
+        self._generation = 0  # The number of bifurcations made so far, which identifies the tree's state.
         self._origin = None
+        self._index = None  # A spatial index of the vessel segments of the tree, keyed by vessel index.
+        self.growth_log = None  # The record of each bifurcation made, from which any of the trees can be rebuilt.
         # Prepare some lists for logging purposes
+        # The depth is the position of the winning vessel when the vessels are ordered by distance to the terminal.
+        # When auditing, this is the winner of the unbounded search, so depths past the bound show how often it is
+        # missed. The number of misses is also counted in bound_misses.
         self.iter_num_with_depth = []
         self.iter_num_with_dist = []
+        self.bound_misses = 0
 
     @property
     def perfusion_area(self):
@@ -41,156 +104,237 @@ class CCONetworkMaker:
         return self.domain.area
 
     def _generate_terminal_point(self, k_term):
-        found = False
         # d_thresh = math.sqrt(self.perfusion_area / k_term)
         d_thresh = math.sqrt(self.perfusion_area / (k_term * math.pi))
         logging.debug(f"{d_thresh=}")
-        i = 0
-        while not found:
-            if i == 50:
-                i = 0
-                d_thresh *= 0.9
-                logging.debug(f"Rescaled. {d_thresh=}")
-            p = self.domain.generate_point()
-            d_crit = min((v.line_seg.distance_to(p) for v in self._origin.descendants))
-            if d_crit > d_thresh:
-                found = True
-            i += 1
-        return p
+        while True:
+            # Draw a whole batch of points and test them against the tree together. The first one far enough away from
+            # every vessel is the one we'd have found by trying the points one at a time.
+            points = self.domain.generate_points(CCONetworkMaker.TERMINAL_BATCH, self.rng)
+            far = np.flatnonzero(~self._index.any_within_many(points, d_thresh))
+            if len(far) > 0:
+                x, y = points[far[0]].tolist()
+                return Vec2D(x, y)
+            d_thresh *= 0.9
+            logging.debug(f"Rescaled. {d_thresh=}")
 
     def _make_first_vessel(self) -> None:
         """Make the first vessel of the tree to start. """
         self._origin = Origin(self.radius, self.initial_point)
-        p = self.domain.generate_point()
-        self._origin.create_child(1.0, p)
+        x, y = self.domain.generate_points(1, self.rng)[0].tolist()
+        p = Vec2D(x, y)
+        v = self._origin.create_child(1.0, p)
+        self.growth_log = GrowthLog(self.radius, self.initial_point, p)
+        cell_size = self.index_cell_size
+        if cell_size is None:
+            cell_size = math.sqrt(self.perfusion_area) / CCONetworkMaker.INDEX_CELLS
+        self._index = SegmentGrid(cell_size)
+        self._index_vessel(v)
+
+    def _index_vessel(self, v) -> None:
+        """Add a vessel to the spatial index, or move it if it is already there. """
+        if v.index in self._index:
+            self._index.update(v.index, v.proximal_point, v.distal_point)
+        else:
+            self._index.insert(v.index, v.proximal_point, v.distal_point)
+
+    def _bounded_candidates(self, p):
+        """:returns the (distance, vessel index) pairs of the vessels inside the candidate bound, nearest first. """
+        k = self.max_candidates
+        if self.candidate_radius is not None:
+            first = self._index.within(p, self.candidate_radius)
+            if k is not None:
+                first = first[:k]
+        else:
+            first = self._index.nearest(p, k)
+        return first
+
+    def _score(self, candidates, xd):
+        """Evaluate the bifurcation of each (depth, distance, vessel index) candidate, in the worker processes if
+        there are any.
+        :returns the (cost, depth, distance, vessel index, bifurcation point) of each valid candidate, in no
+        particular order.
+        """
+        tree = self._origin.tree
+        if self._executor is None or len(candidates) < CCONetworkMaker.MIN_PARALLEL_CANDIDATES:
+            return _score_candidates(tree, xd, candidates, self.refine_bifurcations)
+        if self._shared is None or self._shared[0] != self._generation:
+            self._share_tree(tree)
+        n = self.workers
+        _, size = self._shared
+        # Deal the candidates out in turn, so that each worker gets a similar mix of near and far vessels.
+        futures = [self._executor.submit(_score_shared_candidates, self._block.name, size, self._generation, xd,
+                                         candidates[w::n], self.refine_bifurcations) for w in range(n)]
+        return [s for f in futures for s in f.result()]
+
+    def _share_tree(self, tree) -> None:
+        """Pickle the tree into the shared memory for the workers, making the block bigger if it has to be. """
+        data = pickle.dumps(tree, protocol=pickle.HIGHEST_PROTOCOL)
+        if self._block is None or self._block.size < len(data):
+            self._release_block()
+            # Leave room for the tree to grow, so that the block doesn't have to be replaced at every iteration.
+            self._block = SharedMemory(create=True, size=2 * len(data))
+        self._block.buf[:len(data)] = data
+        self._shared = self._generation, len(data)
+
+    def _release_block(self) -> None:
+        if self._block is not None:
+            self._block.close()
+            self._block.unlink()
+            self._block = None
+            self._shared = None
+
+    def _intersects_tree(self, a, b, incident) -> bool:
+        """Test if the line segment from a to b intersects any vessel of the tree, other than those whose indices are
+        in incident. Only the vessels whose bounding boxes overlap the segment's bounding box need the full test.
+        """
+        (ax, ay), (bx, by) = a, b
+        keys = self._index.overlapping((min(ax, bx), min(ay, by)), (max(ax, bx), max(ay, by))) - incident
+        if not keys:
+            return False
+        others = np.array([self._index.segment(key) for key in keys])
+        return bool(segments_intersect(a, b, others[:, 0], others[:, 1]).any())
+
+    def _bifurcation_intersects(self, j, xb, xd) -> bool:
+        """Test if bifurcating vessel j at xb to reach the terminal point xd would make vessels that intersect. """
+        # We check ALL THREE of the vessels involved in bifurcation for intersections with other vessels, stopping at
+        # the first one that intersects something.
+        # Only the vessels incident to each one (itself, parent, siblings and children) are allowed to intersect it.
+        # The new vessels aren't in the index, and vj is in the index where it was before the bifurcation, so vj is
+        # always left out.
+        tree = self._origin.tree
+        g = tree.parent_of(j)
+        xb, xd = tuple(xb), tuple(xd)
+        xg, xj = tuple(tree.points[g].tolist()), tuple(tree.points[j].tolist())
+        new_vessels = (
+            (xg, xb, {g, j, *tree.children_of(g)}),  # The new parent
+            (xb, xj, {j, *tree.children_of(j)}),  # vj
+            (xb, xd, {j}),  # The new terminal
+        )
+        return any(self._intersects_tree(a, b, incident) for a, b, incident in new_vessels)
+
+    def _first_allowed(self, scored, xd, key, checked):
+        """:returns the first of the scored candidates, in the order given by key, that doesn't intersect the tree,
+        or None if they all do. The results of the intersection tests are remembered in checked, keyed by depth.
+        """
+        for s in sorted(scored, key=key):
+            _, depth, _, j, xb = s
+            if depth not in checked:
+                checked[depth] = self._bifurcation_intersects(j, xb, xd)
+            if not checked[depth]:
+                return s
+        return None
+
+    def _choose_bifurcation(self, xd):
+        """Choose the vessel to bifurcate to connect the terminal point xd to the tree.
+        The chosen bifurcation is the cheapest one that is allowed inside the candidate bound, or if there aren't any
+        then the nearest one that is allowed outside it. Ties in cost go to the nearer vessel, so the choice doesn't
+        depend on the order in which the candidates were scored.
+        :returns the (cost, depth, distance, vessel index, bifurcation point) of the chosen bifurcation, and of the
+        cheapest bifurcation overall. (These only differ when auditing)
+        """
+        def by_cost(s):
+            return s[0], s[1]
+
+        def by_depth(s):
+            return s[1]
+
+        first = self._bounded_candidates(xd)
+        scored = self._score([(j, d, key) for j, (d, key) in enumerate(first)], xd)
+        checked = {}
+        chosen = best = self._first_allowed(scored, xd, by_cost, checked)
+        if chosen is not None and not self.audit_candidates or len(first) == len(self._index):
+            return chosen, best
+        rest = [(j, d, key) for j, (d, key) in enumerate(self._index.nearest(xd)[len(first):], start=len(first))]
+        if self.audit_candidates:
+            rest_scored = self._score(rest, xd)
+            if chosen is None:
+                chosen = self._first_allowed(rest_scored, xd, by_depth, checked)
+            best = self._first_allowed(scored + rest_scored, xd, by_cost, checked)
+            return chosen, best
+        # Carry on past the bound a batch at a time until a vessel can be bifurcated.
+        batch = 1 if self._executor is None else self.workers * CCONetworkMaker.MIN_PARALLEL_CANDIDATES
+        for b in range(0, len(rest), batch):
+            chosen = self._first_allowed(self._score(rest[b:b + batch], xd), xd, by_depth, checked)
+            if chosen is not None:
+                break
+        return chosen, chosen
+
+    def _snapshot(self) -> Origin:
+        """:returns the origin of a snapshot of the tree as it is now, which isn't changed as the tree grows. """
+        return Origin.from_tree(self._origin.tree.snapshot())
 
     def generate_trees(self, iterations: int) -> Generator[BaseBloodVessel]:
-        """Make a generator for the trees at each stage, and :return it. """
+        """Make a generator for the trees at each stage, and :return it.
+        Each tree is a snapshot, so the trees from earlier stages stay as they were.
+        """
         self._make_first_vessel()
         if iterations > 0:
-            yield self._origin
-        for i in range(1, iterations):
-            # Rescaling happens here.
-            xd = self._generate_terminal_point(i)  # Randomly select a terminal point to be connected to the tree.
-            self._origin = self._origin.copy_subtree()
-            min_c = None
-            best_vj = None
-            best_distance = None
-            best_index = None
-            line_distances = [PrioritisedItem(v.line_seg.distance_to(xd), v) for v in self._origin.descendants]
-            num_vessels_to_try = len(line_distances)
-            pq = PriorityQueue()
-            for pair in line_distances:
-                pq.put(pair)
-            for j in range(num_vessels_to_try):
-                assert pq.not_empty
-                pair = pq.get()
-                vj = pair.item
-                this_distance = pair.priority
-                # TODO: Here, we should copy the subtree with this vessel.
-                vj.bifurcate(xd)
-                vj.geometrically_optimise()
-                # The bifurcation point has been added and moved to the optimal location
-                bifurcated_vessels = vj.parent.children + [vj.parent]
-                # Don't consider the vessel further if it is mis-formed.
-                if _has_misformed_vessels(bifurcated_vessels):
-                    vj.remove_bifurcation()
-                    continue
-                vt = vj.parent.children[1]
-                assert len(bifurcated_vessels) == 3 and vj is bifurcated_vessels[0] and vt is bifurcated_vessels[1]
-                # Next, we check ALL THREE of the vessels involved in bifurcation for intersections with other vessels
-                intersection_found = False
-                for v in bifurcated_vessels:
-                    # Only these vessels are allowed to intersect with v. (self, parent, siblings and children)
-                    incident_vessels = [v.parent] + v.parent.children + v.children
-                    for w in self._origin.descendants:
-                        if w not in incident_vessels and v.line_seg.intersects_with(w.line_seg):
-                            # Don't consider this bifurcation further as it intersects with other vessels
-                            intersection_found = True
-                if intersection_found:
-                    vj.remove_bifurcation()
-                    continue
-                c = self._origin.root.cost
-                if min_c is None or c < min_c:
-                    min_c = c
-                    best_vj = vj
-                    best_distance = this_distance
-                    best_index = j
-                assert self._origin.root is not vj
-                vj.remove_bifurcation()
-            assert best_vj is not None
-            best_vj.bifurcate(xd)
-            best_vj.geometrically_optimise()
-            self.iter_num_with_depth.append((i, best_index))
-            self.iter_num_with_dist.append((i, best_distance))
-            yield self._origin
+            yield self._snapshot()
+        if self.workers is not None and self.workers > 1:
+            self._executor = ProcessPoolExecutor(self.workers)
+        try:
+            for i in range(1, iterations):
+                # Rescaling happens here.
+                xd = self._generate_terminal_point(i)  # Randomly select a terminal point to be connected to the tree.
+                chosen, best = self._choose_bifurcation(xd)
+                assert chosen is not None
+                _, best_index, best_distance, key, best_p = chosen
+                if self.audit_candidates:
+                    _, best_index, best_distance, _, _ = best
+                    if best[1] != chosen[1]:
+                        self.bound_misses += 1
+                best_vj = self._origin.vessel(key)
+                best_vj.bifurcate(xd, best_p)
+                self._generation += 1
+                self.growth_log.record(key, xd, best_p)
+                for v in best_vj.parent.children + [best_vj.parent]:
+                    self._index_vessel(v)
+                self.iter_num_with_depth.append((i, best_index))
+                self.iter_num_with_dist.append((i, best_distance))
+                yield self._snapshot()
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+            self._release_block()
+
+    def distance_field(self, tree, samples=1000) -> DistanceField:
+        """Measure the distances from each point of the domain's point grid to the vessels and terminals of the tree.
+        :returns the DistanceField, from which all the distance metrics below can be read.
+        """
+        blackbox_radius = self.domain.characteristic_length(tree.num_terminals)
+        points, inside = self.domain.grid_array(samples)
+        return DistanceField(tree, points[inside], blackbox_radius)
 
     def distance_from_vessel(self, tree, point):
         """Approximate the smallest distance from this point to another vessel.
         :returns the distance, and the endpoints of the vessel involved.
         """
-        vessels = list(tree.descendants)
-
-        def make_tuple(v):
-            # Contains the distance to the vessel, and the endpoints of the vessel.
-            d = v.line_seg.distance_to(point)
-            ps = tuple(v.proximal_point), tuple(v.distal_point)
-            return d, ps
-
-        # The distance to the nearest vessel.
-        return min(make_tuple(v) for v in vessels)
+        return DistanceField(tree, (point,)).nearest_vessel(0)
 
     def greatest_distance_from_vessel(self, tree, samples=1000):
         """Approximate the greatest distance from any vessel.
          :returns the greatest distance, and the vessel and point that are involved.
          """
-        vessels = list(tree.descendants)
-
-        def get_smallest_distance(p):
-            def make_tuple(v):
-                # Contains the distance to the vessel, and the endpoints of the vessel.
-                d = v.line_seg.distance_to(p)
-                ps = tuple(v.proximal_point), tuple(v.distal_point)
-                return d, ps
-
-            d, v = min(make_tuple(v) for v in vessels)
-            return d, v, p
-
-        return max(get_smallest_distance(p) for p in self.domain.point_grid(samples))
+        return self.distance_field(tree, samples).greatest_distance_from_vessel()
 
     def distance_from_terminal(self, tree, point):
         """Approximate the smallest distance from this point to a terminal node.
         :returns the smallest distance, and the terminal node involved.
         """
-        vessels = tree.descendants
-        terminals = [v.distal_point for v in vessels if len(v.children) == 0]  # Take the vessels with no children.
-
-        return min((LineSegment(point, t).length, t) for t in terminals)
+        return DistanceField(tree, (point,)).nearest_terminal(0)
 
     def greatest_distance_from_terminal(self, tree, samples=1000):
         """Approximate the greatest distance from any terminal node.
         :returns the greatest distance, and the terminal node involved.
         """
-        vessels = tree.descendants
-        terminals = [v.distal_point for v in vessels if len(v.children) == 0]  # Take the vessels with no children.
-
-        def get_smallest_distance(p):
-            d, t = min((LineSegment(p, t).length, t) for t in terminals)
-            return d, t, p
-
-        return max(get_smallest_distance(p) for p in self.domain.point_grid(samples))
+        return self.distance_field(tree, samples).greatest_distance_from_terminal()
 
     def count_blackboxes(self, tree, samples=1000):
         """Count the number of "micro-circulatory black boxes" reached by each point, and :return it. """
-        vessels = tree.descendants
-        terminals = [v.distal_point for v in vessels if len(v.children) == 0]  # Take the vessels with no children.
-        blackbox_radius = self.domain.characteristic_length(tree.num_terminals)
-
-        def f(p):
-            return sum(1 for t in terminals if LineSegment(p, t).length <= blackbox_radius)
-
-        return ((p, f(p)) for p in self.domain.point_grid(samples))  # Pair each point with the number
-        # of micro-circulatory black boxes it reaches.
+        # Pair each point with the number of micro-circulatory black boxes it reaches.
+        return self.distance_field(tree, samples).blackboxes()
 
     def run(self, terminals: int) -> BaseBloodVessel:
         """Generate the trees, and :return the final one. """
@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+import numpy as np
+
+from BloodVessel import BaseBloodVessel
+from LinAlg import Vec2D, Vec2DArray, distances_to_segments
+
+
+class DistanceField:
+    """The distances from each of a collection of points to the nearest vessel and the nearest terminal of a tree,
+    along with the number of micro-circulatory black boxes that reach each point.
+
+    The vessels are found in one vectorised pass, which works through the points a chunk at a time so that the
+    matrices of distances stay a reasonable size, and the terminals are found with the tree's TerminalIndex.
+    The results are arrays with one entry per point.
+    """
+
+    CHUNK = 1 << 20  # The number of point-to-vessel distances to find at once.
+
+    def __init__(self, origin: BaseBloodVessel, points, blackbox_radius=None) -> None:
+        """Measure the tree of this origin from each point, given as vectors or as an N×2 array.
+        Without blackbox_radius, the black boxes aren't counted.
+        """
+        tree = origin.tree
+        if not isinstance(points, np.ndarray):
+            points = [tuple(q) for q in points]
+        self.points = Vec2DArray(points)
+        p = self.points.arr
+        # The vessels in the same order as the descendants of the origin.
+        self.vessels = np.fromiter(tree.descendants_of(tree.root), dtype=np.int64)
+        a = tree.points[tree.parent_indices[self.vessels]]
+        b = tree.points[self.vessels]
+        self.vessel_ends = [((ax, ay), (bx, by)) for (ax, ay), (bx, by) in zip(a.tolist(), b.tolist())]
+        self.terminal_index = tree.terminal_index()
+        self.terminals = self.terminal_index.terminals
+        self.blackbox_radius = blackbox_radius
+
+        m = len(p)
+        self.vessel_distances = np.empty(m)
+        self.nearest_vessels = np.empty(m, dtype=np.int64)  # Positions in vessels and vessel_ends.
+        step = max(1, DistanceField.CHUNK // max(len(self.vessels), 1))
+        for start in range(0, m, step):
+            self._measure(slice(start, min(start + step, m)), p[start:start + step], a, b)
+        self.terminal_distances, self.nearest_terminals = self.terminal_index.nearest(p)  # Positions in terminals.
+        self.blackbox_counts = None if blackbox_radius is None else self.terminal_index.count_within(p, blackbox_radius)
+
+    def _measure(self, rows, p, a, b) -> None:
+        d = distances_to_segments(p[:, np.newaxis], a, b)
+        nearest = d.argmin(axis=1)
+        closest = d[np.arange(len(p)), nearest]
+        # Points whose nearest point on the tree is a junction are equally close to all the vessels that meet there.
+        # Break ties by the endpoints of the vessels, as comparing (distance, endpoints) tuples would.
+        for r in np.flatnonzero((d == closest[:, np.newaxis]).sum(axis=1) > 1):
+            nearest[r] = min(np.flatnonzero(d[r] == closest[r]), key=lambda j: self.vessel_ends[j])
+        self.vessel_distances[rows] = closest
+        self.nearest_vessels[rows] = nearest
+
+    def __len__(self) -> int:
+        return len(self.points)
+
+    def nearest_vessel(self, k):
+        """:returns the distance from the kth point to the nearest vessel, and the endpoints of the vessel. """
+        return float(self.vessel_distances[k]), self.vessel_ends[self.nearest_vessels[k]]
+
+    def nearest_terminal(self, k):
+        """:returns the distance from the kth point to the nearest terminal, and the terminal point. """
+        return float(self.terminal_distances[k]), Vec2D.from_array(self.terminals[self.nearest_terminals[k]])
+
+    def greatest_distance_from_vessel(self):
+        """:returns the greatest distance from any vessel, and the vessel and point that are involved. """
+        # Ties go to the larger endpoints and then the larger point, as taking the max of (distance, endpoints, point)
+        # tuples would.
+        furthest = np.flatnonzero(self.vessel_distances == self.vessel_distances.max())
+        k = max(furthest.tolist(), key=lambda j: (self.vessel_ends[self.nearest_vessels[j]], self._point_tuple(j)))
+        return (*self.nearest_vessel(k), self.points[k])
+
+    def greatest_distance_from_terminal(self):
+        """:returns the greatest distance from any terminal, and the terminal and point that are involved. """
+        # Ties go to the larger terminal and then the larger point, as taking the max of (distance, terminal, point)
+        # tuples would. (Comparing their coordinates, since vectors aren't ordered)
+        furthest = np.flatnonzero(self.terminal_distances == self.terminal_distances.max())
+        terminals = self.terminals[self.nearest_terminals]
+        k = max(furthest.tolist(), key=lambda j: (tuple(terminals[j].tolist()), self._point_tuple(j)))
+        return (*self.nearest_terminal(k), self.points[k])
+
+    def _point_tuple(self, k):
+        x, y = self.points.arr[k].tolist()
+        return x, y
+
+    def blackboxes(self):
+        """:returns a list that pairs each point with the number of black boxes that it reaches. """
+        assert self.blackbox_counts is not None
+        return list(zip(self.points, self.blackbox_counts.tolist()))
@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+import numpy as np
+
+try:
+    from scipy.ndimage import distance_transform_edt
+except ImportError:  # Without SciPy, the Euclidean distances are found from the distances along each column instead.
+    distance_transform_edt = None
+
+
+def _sweep(distances):
+    """Lower each entry of distances, in place, to at most 1 more than its neighbours along the first axis.
+    :returns distances
+    """
+    # A pass in each direction carries the distance from every source along the axis, however far it is.
+    for k in range(1, len(distances)):
+        np.minimum(distances[k], distances[k - 1] + 1, out=distances[k])
+    for k in range(len(distances) - 2, -1, -1):
+        np.minimum(distances[k], distances[k + 1] + 1, out=distances[k])
+    return distances
+
+
+def _column_distances(mask):
+    """:returns the distance of every cell from the nearest cell in its column where mask is True, or at least the
+    sum of the sides of the grid if there isn't one.
+    """
+    far = mask.shape[0] + mask.shape[1]  # Further away than any two cells of the grid.
+    return _sweep(np.where(mask, 0, far).astype(np.int64))
+
+
+def _euclidean(mask):
+    # The squared distance to a source (a, b) is (i - a)^2 + (j - b)^2, so the nearest source to (i, j) is the best
+    # over b of the nearest source in column b to row i. Each column of the result is found in one step.
+    g = _column_distances(mask).astype(np.float64)
+    g *= g
+    b = np.arange(mask.shape[1])
+    distances = np.empty(mask.shape)
+    for j in range(mask.shape[1]):
+        dj = b - j
+        distances[:, j] = np.sqrt((g + dj * dj).min(axis=1))
+    return distances
+
+
+def distance_transform(mask, metric="manhattan"):
+    """Work out the distance of every cell of a grid from the nearest cell where mask is True, either along the grid
+    ("manhattan") or in a straight line ("euclidean"). The cells are 1 apart.
+    :returns an array of the distances, with the same shape as mask, and the (i, j) of a cell that is furthest from
+    the mask. (The first one, if there is a tie)
+    """
+    mask = np.asarray(mask, dtype=bool)
+    assert mask.ndim == 2
+    assert mask.any(), "There must be at least one cell to measure the distances from"
+    if metric == "manhattan":
+        # The taxicab distance is the distance along the column to some row, then along that row. So sweeping the
+        # distances along the columns and then along the rows finds it for every cell, in O(x*y) time.
+        distances = _sweep(_column_distances(mask).T).T
+    elif metric == "euclidean":
+        # SciPy measures the distance from each nonzero cell to the nearest zero cell, so the mask is inverted.
+        distances = distance_transform_edt(~mask) if distance_transform_edt is not None else _euclidean(mask)
+    else:
+        raise ValueError(f"Unknown metric {metric!r}")
+    i, j = np.unravel_index(np.argmax(distances), distances.shape)
+    return distances, (int(i), int(j))
@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+
+import numpy as np
+
+from VesselTree import VesselTree
+
+
+class GrowthLog:
+    """A compact record of how a tree was grown, from which the tree at any iteration can be rebuilt.
+
+    Iteration 0 is the tree with just its first vessel. Each later iteration adds one event: the index of the vessel
+    that was bifurcated, the new terminal point and the bifurcation point. The scaling factors are not stored, since
+    replaying the bifurcation recomputes them exactly.
+    Rebuilding a tree keeps a copy of the last tree on the way whose iteration is a multiple of checkpoint_interval, so
+    that rebuilding nearby iterations again only needs a copy and a few bifurcations. At most max_checkpoints of these
+    are kept, dropping the least recently used, so the memory they take doesn't grow with the length of the log.
+    """
+
+    EVENT = np.dtype([('vessel', np.int32), ('terminal', np.float64, 2), ('point', np.float64, 2)])
+
+    def __init__(self, radius, origin_point, first_point, checkpoint_interval=50, max_checkpoints=8) -> None:
+        assert checkpoint_interval > 0
+        assert max_checkpoints > 0
+        self.radius = radius
+        self.origin_point = tuple(origin_point)
+        self.first_point = tuple(first_point)
+        self.checkpoint_interval = checkpoint_interval
+        self.max_checkpoints = max_checkpoints
+        self._events = np.zeros(16, dtype=GrowthLog.EVENT)
+        self._size = 0
+        first = VesselTree(radius, self.origin_point)
+        first.create_child(VesselTree.ORIGIN, 1.0, self.first_point)
+        self._first = first  # The tree at iteration 0, which is always kept.
+        self._checkpoints = OrderedDict()  # Replayed trees, keyed by iteration, from least to most recently used.
+
+    def __len__(self) -> int:
+        """The number of iterations that can be rebuilt. """
+        return self._size + 1
+
+    @property
+    def events(self):
+        """The events recorded so far, as a structured array. This is a view, so it must be treated as read-only. """
+        return self._events[:self._size]
+
+    def record(self, vessel, terminal_point, bifurcation_point) -> None:
+        """Record that the next iteration bifurcated this vessel at bifurcation_point to reach terminal_point. """
+        if self._size == len(self._events):
+            self._events = np.concatenate((self._events, np.zeros(len(self._events), dtype=GrowthLog.EVENT)))
+        self._events[self._size] = (vessel, tuple(terminal_point), tuple(bifurcation_point))
+        self._size += 1
+
+    def tree_at(self, iteration) -> VesselTree:
+        """Rebuild the tree as it was at this iteration, and :return it. """
+        assert 0 <= iteration < len(self)
+        # Start from the nearest checkpoint at or before the iteration.
+        k = max((c for c in self._checkpoints if c <= iteration), default=0)
+        if k == 0:
+            tree = self._first.copy()
+        else:
+            self._checkpoints.move_to_end(k)
+            tree = self._checkpoints[k].copy()
+        last = iteration - iteration % self.checkpoint_interval  # The last checkpoint on the way.
+        for vessel, terminal, point in self._events[k:iteration].tolist():
+            tree.bifurcate(vessel, terminal, point)
+            k += 1
+            if k == last:
+                self._checkpoints[k] = tree.copy()
+                if len(self._checkpoints) > self.max_checkpoints:
+                    self._checkpoints.popitem(last=False)
+        return tree
@@ -1,10 +1,14 @@
 from __future__ import annotations
 
-from queue import PriorityQueue, Queue, LifoQueue
+import heapq
+from queue import Queue
 from random import random
 
 import numpy as np
+from scipy.sparse import coo_matrix, diags
+from scipy.sparse.linalg import cg, spsolve
 
+from DistanceTransform import distance_transform
 from utils import concat
 
 
@@ -56,143 +60,177 @@ class Edge:
 
 
 class InvasionPercolationNetwork:
+    """A network grown by invasion percolation on an x by y grid of cells.
+
+    The network is grown and stored in flat NumPy arrays, with cell (i, j) at index i * y + j. The Cell and Edge
+    objects are only made when something asks for them, since they take far longer to make than the network itself.
+    """
+
+    R = 1  # The resistance of a vessel.
+    LEAK = 0.01  # The default conductance from each cell to the tissue, in the leaky model.
 
     def __init__(self, x: int, y: int, occupancy: float):
         assert 0.0 <= occupancy <= 1.0
         self.x = x
         self.y = y
         self.n = round(x * y * occupancy)
-        self._cells = None
+        self._capacities = None  # The capacity of each cell.
+        self._discovered = None  # The time each cell was discovered, or -1.
+        self._reached = None  # The time each cell was reached, or -1.
+        self._edge_a = None  # The index of the cell at each end of each edge, where a was reached after b.
+        self._edge_b = None
+        self._cells = None  # The Cell and Edge views of the network, made when they are first needed.
         self._edges = None
-        self._q = None
         self._make_network()
 
     @property
     def cells(self) -> List[List[Cell]]:
         """A 2D list of the cells in the graph. """
+        if self._cells is None:
+            self._make_views()
         return self._cells
 
     @property
     def nodes(self) -> List[(int, int)]:
-        return concat([c.indices for c in self._cells])
+        return concat([c.indices for c in self.cells])
 
     @property
     def edges(self) -> List[Edge]:
         """A 2D list of the edges in the graph. """
+        if self._edges is None:
+            self._make_views()
         return self._edges
 
+    def _make_views(self):
+        cells = [[Cell(c, i, j) for j, c in enumerate(row)]
+                 for i, row in enumerate(self._capacities.reshape(self.x, self.y).tolist())]
+        flat = concat(cells)
+        for c, discovered, reached in zip(flat, self._discovered.tolist(), self._reached.tolist()):
+            c.discovered = discovered
+            c.reached = reached
+        # Making the edges also fills in the edges of each cell, in the order they were added.
+        self._edges = [Edge(flat[a], flat[b]) for a, b in zip(self._edge_a.tolist(), self._edge_b.tolist())]
+        self._cells = cells
+
+    def _cell(self, k) -> Cell:
+        """:returns the cell at flat index k. """
+        return self.cells[k // self.y][k % self.y]
+
     @property
     def adjacency_list(self):
         """Return an adjacency list in the form of a dictionary. """
-        return {c: [e.a if e.a is not c else e.b for e in c.edges] for c in concat(self._cells)}
+        return {c: [e.a if e.a is not c else e.b for e in c.edges] for c in concat(self.cells)}
 
     def compute_manhattan_distances(self, predicate):
         """Compute and :return the Manhattan distance of each cell from the cells satisfying a given predicate. """
-        q = Queue()
-        distances = [[None for _ in range(self.y)] for _ in range(self.x)]
-        for c in concat(self.cells):
-            if predicate(c):
-                q.put((c, 0))
-        while not q.empty():
-            c, n = q.get()
-            if distances[c.i][c.j] is None:
-                distances[c.i][c.j] = n
-                for d in self._get_cell_neighbours(c):
-                    q.put((d, n + 1))
-        return distances
-
-    def compute_pressures(self, leaky=False):
-        """Compute and :return the pressure at each cell in the network. """
-        return self._compute_pressures_no_leaky() if leaky == False else self._compute_pressures_leaky()
-
-    def _compute_pressures_no_leaky(self):
-        # Do a linear algebra calculation to compute the flows in the system.
-        # By convention, "towards the bottom left corner" is the positive direction.
-        R = 1   # The resistance of a vessel.
-        cells = tuple(c for c in concat(self.cells) if c.is_reached)
-        edges = tuple(self.edges)
-        start = self.top_left
-        end = self.bottom_right
-        cell_indices = {c: i for i, c in enumerate(cells)}  # To quickly look up the index of a cell.
-        edge_indices = {e: i for i, e in enumerate(edges)}  # To quickly look up the index of an edge.
-        matrix = []
-        result = []
-        q_num = len(edges)  # There is a variable for every line segment.
-        p_num = len(cells)  # There is a variable for every cell.
-
-        # some helper functions
-        def q(e: Edge): return edge_indices[e]
-
-        def p(c: Cell): return q_num + cell_indices[c]
-
-        def find_edge(a, b):
-            # Find the edge that connects a and b
-            for e in a.edges:
-                if (e.a is a and e.b is b) or (e.b is a and e.a is b):
-                    return e
-            assert False
-
-        def minmax(e):
-            a = e.a
-            b = e.b
-            return (a, b) if cell_indices[a] < cell_indices[b] else (b, a)
-
-        for i, c in enumerate(cells):
-            # At each cell, we need the input and output flows to add to 0.
-            if c is start:  # We don't count the start cell. This ensures that our matrix is full rank.
-                continue
-            result.append((0 if c is not end else 1,))  # Only the endpoint is allowed to have flow exit the system.
-
-            this_row = [0 for _ in range(q_num + p_num)]
-            for e in c.edges:
-                assert e in edges   # TODO: Remove this since it's expensive!
-                a, b = minmax(e)
-                assert cell_indices[a] < cell_indices[b]  # Check
-                assert (a is c or b is c) and (a is not c or b is not c)
-                this_row[q(e)] = 1 if b is c else -1
-            matrix.append(this_row)
-
-        for i, e in enumerate(edges):
-            result.append((0,))
-            this_row = [0 for _ in range(q_num + p_num)]
-            # At each edge, we want the pressure drop to equal the resistance (1) times the flow.
-            a, b = minmax(e)
-            assert cell_indices[a] < cell_indices[b]  # Check
-            this_row[p(a)] = 1
-            this_row[p(b)] = -1
-            this_row[q(e)] = -R
-            matrix.append(this_row)
-
-        # A final row to fix the output pressure at 0.
-        this_row = [0 for _ in range(q_num + p_num)]
-        this_row[p(end)] = 1
-        matrix.append(this_row)
-        result.append((0,))
-
-        mat = np.array(matrix)
-        res = np.array(result)
-
-        #print("Reached")
-        #print(mat)
-        #print(res)
-        pressures_flows = np.linalg.solve(mat, res)
-        #print(pressures_flows)
-
-        # we have the results. so find the associated cell and edge.
-
-        flow_results = [(e, pressures_flows[q(e), 0]) for e in edges]
-        pressure_results = [(c, pressures_flows[p(c), 0]) for c in cells]
-
-        #print(pressure_results)
-        #print(flow_results)
-
+        mask = [[predicate(c) for c in row] for row in self.cells]
+        if not any(concat(mask)):
+            return [[None for _ in range(self.y)] for _ in range(self.x)]  # There is nothing to measure from.
+        distances, _ = distance_transform(mask)
+        return distances.tolist()
+
+    def compute_pressures(self, leaky=False, solver="spsolve", leak=None):
+        """Compute and :return the pressure at each cell in the network.
+        In the leaky model, each cell loses flow to the tissue through a conductance of leak (by default LEAK).
+        The sparse linear system is solved directly with "spsolve", or iteratively with "cg" (conjugate gradients).
+        """
+        if leaky == False:
+            return self._compute_pressures_no_leaky(solver)
+        return self._compute_pressures_leaky(leak, solver)
+
+    def _reached_positions(self):
+        """Number the reached cells in order of their flat indices.
+        :returns the flat indices of the reached cells, the positions among them of the top left and bottom right
+        cells, and the positions of the cells at each end of each edge.
+        """
+        reached = np.flatnonzero(self._reached != -1)
+        position = np.full(self.x * self.y, -1, dtype=np.int64)  # The position of each cell among the reached cells.
+        position[reached] = np.arange(len(reached))
+        start = position[self._find_corner(top_left=True)[1]]
+        end = position[self._find_corner(top_left=False)[1]]
+        return reached, start, end, position[self._edge_a], position[self._edge_b]
+
+    def _pressure_system(self):
+        """Assemble the sparse linear system for the pressures at the reached cells.
+        :returns the flat indices of the reached cells, the lower and higher positions among them of the cells of each
+        edge, the grounded Laplacian in CSC form, the positions of the cells that it covers, and the right-hand side
+        for those cells.
+        """
+        # The flow along each edge is its pressure drop divided by its resistance, so the flows can be eliminated.
+        # Then conservation of flow at each cell gives a system L p = b for the pressures, where L is the weighted
+        # graph Laplacian. Grounding the end cell (by leaving out its row and column) makes L symmetric positive
+        # definite, and the conservation at the end cell follows from the rest. The only source is the start cell.
+        # By convention, the flow along an edge is positive from its lower-indexed cell to its higher-indexed one.
+        reached, start, end, a, b = self._reached_positions()
+        n = len(reached)
+        lo, hi = np.minimum(a, b), np.maximum(a, b)
+        g = np.full(len(lo), 1 / InvasionPercolationNetwork.R)  # The conductance of each edge.
+        laplacian = coo_matrix((np.concatenate((g, g, -g, -g)),
+                                (np.concatenate((lo, hi, lo, hi)), np.concatenate((lo, hi, hi, lo)))),
+                               shape=(n, n)).tocsr()  # The duplicate entries of the diagonal are summed.
+        keep = np.flatnonzero(np.arange(n) != end)
+        grounded = laplacian[keep][:, keep].tocsc()
+        rhs = np.zeros(n)
+        rhs[start] = 1
+        return reached, lo, hi, grounded, keep, rhs[keep]
+
+    @staticmethod
+    def _solve(matrix, rhs, solver):
+        """Solve a symmetric positive definite sparse system with the given solver, and :return the solution. """
+        if len(rhs) == 0:
+            return rhs
+        if solver == "spsolve":
+            return spsolve(matrix, rhs)
+        if solver == "cg":
+            x, info = cg(matrix, rhs, rtol=1e-12)
+            assert info == 0, "Conjugate gradients didn't converge"
+            return x
+        raise ValueError(f"Unknown solver {solver!r}")
+
+    def _compute_pressures_no_leaky(self, solver="spsolve"):
+        """Work out the flow along each edge and the pressure at each cell, when a unit of flow enters the network at
+        the top left cell and leaves it at the bottom right cell, where the pressure is 0.
+        :returns the list of (edge, flow) pairs, and the list of (cell, pressure) pairs of the reached cells.
+        """
+        reached, lo, hi, grounded, keep, rhs = self._pressure_system()
+        pressures = np.zeros(len(reached))
+        pressures[keep] = self._solve(grounded, rhs, solver)
+        flows = (pressures[lo] - pressures[hi]) / InvasionPercolationNetwork.R
+        flow_results = list(zip(self.edges, flows.tolist()))
+        pressure_results = [(self._cell(k), p) for k, p in zip(reached.tolist(), pressures.tolist())]
         return flow_results, pressure_results
 
-    def _compute_pressures_leaky(self):
-        pass  # TODO: _compute_pressures_leaky
+    def _compute_pressures_leaky(self, leak=None, solver="spsolve"):
+        """Work out the flows and pressures as in _compute_pressures_no_leaky, except that every cell also loses flow
+        to the surrounding tissue, at a rate of leak times its pressure. (The tissue is at pressure 0)
+        :returns the list of (edge, flow) pairs, and the list of (cell, pressure) pairs of the reached cells.
+        """
+        cells, _, pressures, flows = self.sweep_leaks((self.LEAK if leak is None else leak,), solver)
+        return list(zip(self.edges, flows[0].tolist())), \
+            [(self._cell(i * self.y + j), p) for (i, j), p in zip(cells.tolist(), pressures[0].tolist())]
+
+    def sweep_leaks(self, leaks, solver="spsolve"):
+        """Solve the leaky model for each of a sequence of leak conductances. The Laplacian is only assembled once,
+        and each leak just adds to its diagonal.
+        :returns an array of the (i, j) of each reached cell, an array of the positions in it of the two cells of each
+        edge (with the flow positive from the first to the second), and arrays of the pressure at each cell and the
+        flow along each edge, with a row for each leak conductance.
+        """
+        # Leaking at cell c adds leak * p_c to the flow out of it, so the system becomes (L + leak * I) p = b.
+        reached, lo, hi, grounded, keep, rhs = self._pressure_system()
+        identity = diags(np.ones(len(keep)), format="csc")
+        pressures = np.zeros((len(leaks), len(reached)))
+        for k, leak in enumerate(leaks):
+            assert leak >= 0
+            pressures[k, keep] = self._solve(grounded + leak * identity, rhs, solver)
+        flows = (pressures[:, lo] - pressures[:, hi]) / InvasionPercolationNetwork.R
+        cells = np.stack(np.divmod(reached, self.y), axis=1)
+        return cells, np.stack((lo, hi), axis=1), pressures, flows
 
     def _generate_random_capacities(self):
-        return [[random() for _ in range(self.y)] for _ in range(self.x)]
+        # The capacities are drawn in the same order as the cells are indexed, so that a given seed of the random
+        # module gives the same network as it always has.
+        return np.array([random() for _ in range(self.x * self.y)])
 
     def _get_cell_neighbours(self, c):
         i, j = c.i, c.j
@@ -203,50 +241,63 @@ class InvasionPercolationNetwork:
             neighbours.append(self.cells[i + 1][j])
         if j > 0:
             neighbours.append(self.cells[i][j - 1])
-        if j < self.x - 1:
+        if j < self.y - 1:
             neighbours.append(self.cells[i][j + 1])
         return neighbours
 
-    def _discover_cells(self, cs, t):
-        for c in cs:
-            if not c.is_discovered:
-                c.discovered = t
-                self._q.put(c)
-
-    def _add_edges(self, cells, a):
-        assert a.is_reached
-        for b in cells:
-            if b.is_reached:
-                e = Edge(a, b)
-                self._edges.append(e)
-
-    def _initially_discover(self, i, j):
-        c = self._cells[i][j]
-        c.reached = 0
-        c.discovered = 0
-        # Neighbours must be added to the queue properly.
-        ns = self._get_cell_neighbours(c)
-        self._discover_cells(ns, 0)
-
     def _make_network(self):
-        self._q = PriorityQueue()
-        caps = self._generate_random_capacities()
-        # Put in the queue each capacity along with its coordinates.
-        self._cells = [[Cell(v, i, j) for j, v in enumerate(row)] for i, row in enumerate(caps)]
-        self._edges = []
+        x, y = self.x, self.y
+        self._capacities = self._generate_random_capacities()
+        # The growth is a tight loop over single cells, which is faster on lists than on NumPy arrays.
+        capacities = self._capacities.tolist()
+        discovered = [-1] * (x * y)
+        reached = [-1] * (x * y)
+        edge_a = []
+        edge_b = []
+        q = []  # A heap of the (capacity, index) of the discovered cells that haven't been reached.
+
+        def neighbours(k):
+            # The same order as _get_cell_neighbours.
+            i, j = divmod(k, y)
+            ns = []
+            if i > 0:
+                ns.append(k - y)
+            if i < x - 1:
+                ns.append(k + y)
+            if j > 0:
+                ns.append(k - 1)
+            if j < y - 1:
+                ns.append(k + 1)
+            return ns
+
+        def discover(ns, t):
+            for m in ns:
+                if discovered[m] == -1:
+                    discovered[m] = t
+                    heapq.heappush(q, (capacities[m], m))
+
         # Some cells are initially discovered.
-        self._initially_discover(self.x // 2, self.y // 2)
-        # self._initially_discover(cells, self.x-1, self.y-1, q)
+        k = (x // 2) * y + y // 2
+        reached[k] = discovered[k] = 0
+        discover(neighbours(k), 0)
 
         for t in range(1, self.n + 1):
-            cell = self._q.get()
-            assert cell.is_discovered
-            assert not cell.is_reached
-            cell.reached = t
-            assert cell.is_reached
-            neighbours = self._get_cell_neighbours(cell)
-            self._discover_cells(neighbours, t)
-            self._add_edges(neighbours, cell)
+            if not q:
+                break  # Every cell has been reached.
+            _, k = heapq.heappop(q)
+            assert reached[k] == -1
+            reached[k] = t
+            ns = neighbours(k)
+            discover(ns, t)
+            for m in ns:
+                if reached[m] != -1:
+                    edge_a.append(k)
+                    edge_b.append(m)
+
+        self._discovered = np.array(discovered, dtype=np.int64)
+        self._reached = np.array(reached, dtype=np.int64)
+        self._edge_a = np.array(edge_a, dtype=np.int64)
+        self._edge_b = np.array(edge_b, dtype=np.int64)
 
     @property
     def top_left(self):
@@ -255,14 +306,8 @@ class InvasionPercolationNetwork:
         return res
 
     def find_top_left(self):
-        # TODO: Currently only works on square networks!
-        failures = []
-        for i in range(self.x):
-            for j in range(i + 1):
-                c = self._cells[i - j][j]
-                if c.is_reached:
-                    return failures, c
-                failures.append(c)
+        failures, k = self._find_corner(top_left=True)
+        return [self._cell(f) for f in failures], self._cell(k)
 
     @property
     def bottom_right(self):
@@ -271,20 +316,30 @@ class InvasionPercolationNetwork:
         return res
 
     def find_bottom_right(self):
+        failures, k = self._find_corner(top_left=False)
+        return [self._cell(f) for f in failures], self._cell(k)
+
+    def _find_corner(self, top_left):
+        """Search the diagonals from a corner for the nearest reached cell.
+        :returns the flat indices of the cells that were searched before it, and its flat index.
+        """
         # TODO: Currently only works on square networks!
         failures = []
         for i in range(self.x):
             for j in range(i + 1):
-                c = self._cells[self.x - i + j - 1][self.y - j - 1]
-                if c.is_reached:
-                    return failures, c
-                failures.append(c)
+                if top_left:
+                    k = (i - j) * self.y + j
+                else:
+                    k = (self.x - i + j - 1) * self.y + self.y - j - 1
+                if self._reached[k] != -1:
+                    return failures, k
+                failures.append(k)
 
     def bfs(self, start):
         q = Queue()
         adj = self.adjacency_list
-        distances = {c: None for c in concat(self._cells)}
-        backrefs = {c: None for c in concat(self._cells)}
+        distances = {c: None for c in concat(self.cells)}
+        backrefs = {c: None for c in concat(self.cells)}
         distances[start] = 0
         q.put(start)
         while not q.empty():
@@ -297,50 +352,81 @@ class InvasionPercolationNetwork:
         return backrefs
 
     def remove_dead_ends(self):
-        """Remove the dead ends from the network.
-        :returns a list of the edges after the dead ends have been removed.
+        """Remove the dead ends from the network, which are the cells that aren't on any path from the top left cell
+        to the bottom right cell that visits each cell at most once.
+        :returns a list of the cells and a list of the edges after the dead ends have been removed.
         """
-        source = self.top_left
-        sink = self.bottom_right
-        adj = self.adjacency_list
-        deleted = {e: False for e in self._edges}
-        nodes_deleted = {c: False for c in concat(self._cells)}
-
-        def can_find(start, no_visit):
-            # Can we find the source or the sink without ever visiting the node no_visit?
-            s = LifoQueue()
-            discovered = {c: False for c in concat(self._cells)}
-            discovered[start] = True
-            s.put(start)
-            while not s.empty():
-                u = s.get()
-                if u is source or u is sink:
-                    return True
-                for v in adj[u]:
-                    if v is not no_visit and not discovered[v]:
-                        discovered[v] = True
-                        s.put(v)
-            return False
-
-        def delete_scc_conditional(start, no_visit):
-            if not can_find(start, no_visit):
-                s = LifoQueue()
-                nodes_deleted[start] = True
-                s.put(start)
-                while not s.empty():
-                    u = s.get()
-                    for v in adj[u]:
-                        if v is not no_visit and not nodes_deleted[v]:
-                            nodes_deleted[v] = True
-                            s.put(v)
-
-        for e in self._edges:
-            if not deleted[e]:
-                delete_scc_conditional(e.a, e.b)
-                delete_scc_conditional(e.b, e.a)
-        # Return the nodes and the edges.
-        return [v for v in concat(self._cells) if v.is_reached and not nodes_deleted[v]], \
-               [e for e in self._edges if not nodes_deleted[e.a] and not nodes_deleted[e.b]]
+        # Those paths go through the same chain of blocks (biconnected components) of the graph, and cover every cell
+        # of those blocks. Any one of them will do to find the chain, so use the path in the depth-first search tree
+        # that finds the blocks. The blocks are found with Tarjan's algorithm, which is iterative here so that big
+        # networks don't run out of stack, and takes O(V+E) time.
+        reached, source, sink, a, b = self._reached_positions()
+        n = len(reached)
+        # The adjacency lists of the cells in CSR form, with the edge along which each neighbour is found.
+        ends = np.concatenate((a, b))
+        order = np.argsort(ends, kind="stable")
+        neighbours = np.concatenate((b, a))[order].tolist()
+        via = (order % len(a)).tolist() if len(a) > 0 else []
+        start = np.searchsorted(ends[order], np.arange(n + 1)).tolist()
+        a, b = a.tolist(), b.tolist()
+
+        discovered = [-1] * n
+        low = [0] * n
+        tree_edge = [-1] * n  # The edge from each cell to its parent in the depth-first search tree.
+        block = [-1] * len(a)  # The block of each edge.
+        blocks = 0
+        edge_stack = []
+        next_neighbour = start[:-1]
+        discovered[source] = low[source] = 0
+        time = 1
+        stack = [source]
+        while stack:
+            u = stack[-1]
+            k = next_neighbour[u]
+            if k < start[u + 1]:
+                next_neighbour[u] = k + 1
+                v, e = neighbours[k], via[k]
+                if e == tree_edge[u]:
+                    continue
+                if discovered[v] == -1:
+                    tree_edge[v] = e
+                    discovered[v] = low[v] = time
+                    time += 1
+                    edge_stack.append(e)
+                    stack.append(v)
+                elif discovered[v] < discovered[u]:  # A back edge. (The other way, it has already been seen from v)
+                    low[u] = min(low[u], discovered[v])
+                    edge_stack.append(e)
+            else:
+                stack.pop()
+                if stack:
+                    p = stack[-1]
+                    low[p] = min(low[p], low[u])
+                    if low[u] >= discovered[p]:
+                        # p separates u from the root, so the edges since the one to u make up a block.
+                        while True:
+                            e = edge_stack.pop()
+                            block[e] = blocks
+                            if e == tree_edge[u]:
+                                break
+                        blocks += 1
+        assert all(d != -1 for d in discovered), "The network should be connected"
+
+        # The blocks along the path from the sink up to the source in the search tree.
+        on_path = [False] * blocks
+        v = sink
+        while v != source:
+            e = tree_edge[v]
+            on_path[block[e]] = True
+            v = a[e] + b[e] - v
+        kept = [False] * n
+        kept[source] = True
+        edges = []
+        for e, view in enumerate(self.edges):
+            if on_path[block[e]]:
+                kept[a[e]] = kept[b[e]] = True
+                edges.append(view)
+        return [self._cell(c) for c, k in zip(reached.tolist(), kept) if k], edges
 
     @property
     def shortest_path_edges(self):
@@ -377,26 +463,19 @@ class InvasionPercolationNetwork:
     #    return not_dead_end
 
     def find_most_distant_point(self, cells):
-        pq = PriorityQueue()
-        added = [[False for _ in row] for row in cells]
-
-        def add_cell_neighbours(distance, cell):
-            for next_cell in self._get_cell_neighbours(cell):
-                if not added[next_cell.i][next_cell.j]:
-                    pq.put((distance + 1, next_cell))
-                    added[next_cell.i][next_cell.j] = True
-
-        furthest = None
-        for row in cells:
-            for c in row:
-                if c.is_reached:
-                    added[c.i][c.j] = True
-                    add_cell_neighbours(0, c)
-        while not pq.empty():
-            d, c = pq.get()
-            furthest = d, c
-            add_cell_neighbours(d, c)
-        return furthest
+        """:returns the Manhattan distance of the cell in the 2D list cells that is furthest from the reached cells in
+        it, and that cell, or None if there isn't one. A tie goes to the cell with the greatest capacity.
+        """
+        flat = concat(cells)
+        mask = np.array([c.is_reached for c in flat], dtype=bool)
+        assert len(cells) == self.x and len(mask) == self.x * self.y and all(len(row) == self.y for row in cells), \
+            "The cells should make up a grid the size of this network"
+        if mask.all() or not mask.any():
+            return None
+        distances, _ = distance_transform(mask.reshape(self.x, self.y))
+        furthest = np.flatnonzero(distances == distances.max())
+        k = furthest[np.argmax([flat[f].c for f in furthest.tolist()])]
+        return int(distances.flat[k]), flat[k]
 
 
 def main():
@@ -10,14 +10,23 @@ class LineSegment:
     def __init__(self, a, b) -> None:
         self.a = a
         self.b = b
-        self.eqn = Line(a, (b - a))
+        self._eqn = None
+
+    @property
+    def eqn(self) -> Line:
+        """The line through the segment. (Only made when it is needed)"""
+        if self._eqn is None:
+            self._eqn = Line(self.a, self.b - self.a)
+        return self._eqn
 
     @property
     def length(self) -> float:
         """The length of the line segment."""
         a = self.a
         b = self.b
-        return math.sqrt((a.x - b.x) ** 2 + (a.y - b.y) ** 2)
+        # Squared by multiplying, like the array versions, since Python's ** 2 doesn't always round the same way.
+        dx, dy = b.x - a.x, b.y - a.y
+        return math.sqrt(dx * dx + dy * dy)
 
     @property
     def vector(self) -> Vec2D:
@@ -28,20 +37,23 @@ class LineSegment:
 
     # TODO: Improve tolerances?
     def distance_to(self, p: Vec2D) -> float:
-        ab = self.vector.arr
-        ap = p.arr - self.a.arr
+        ax, ay = self.a.x, self.a.y
+        abx, aby = self.b.x - ax, self.b.y - ay
+        apx, apy = p.x - ax, p.y - ay
 
-        dot = np.dot(ab, ap)
-        len_sq = self.length ** 2
+        dot = abx * apx + aby * apy
+        # Squares are multiplied out so that this agrees exactly with distances_to_segments.
+        len_sq = abx * abx + aby * aby
         param = dot/len_sq if len_sq != 0 else -1
 
         if param < 0:
-            res = self.a.arr
+            rx, ry = ax, ay
         elif param > 1:
-            res = self.b.arr
+            rx, ry = self.b.x, self.b.y
         else:
-            res = self.a.arr + param*ab
-        return np.linalg.norm(p.arr - res)
+            rx, ry = ax + param*abx, ay + param*aby
+        dx, dy = p.x - rx, p.y - ry
+        return math.sqrt(dx * dx + dy * dy)
 
     @staticmethod
     def on_segment(p, q, r) -> bool:
@@ -94,7 +106,13 @@ class LineSegment:
 
 
 class Vec2D:
-    """Wrapper for 2D Numpy arrays."""
+    """A 2D vector of two floats.
+    The coordinates are plain attributes, so that the many small vectors of the geometry code don't pay for NumPy.
+    Vectors are hashable, so they must not be changed after they have been made.
+    """
+
+    __slots__ = ('x', 'y')
+    __array_ufunc__ = None  # Stop NumPy from treating arithmetic with a vector as arithmetic on an array.
 
     @staticmethod
     def from_array(array) -> Vec2D:
@@ -107,7 +125,16 @@ class Vec2D:
         return Vec2D(t[0], t[1])
 
     def __init__(self, x, y) -> None:
-        self.arr = np.array([x, y])
+        self.x = float(x)
+        self.y = float(y)
+
+    @property
+    def arr(self) -> np.ndarray:
+        """A new Numpy array of the coordinates."""
+        return np.array((self.x, self.y))
+
+    def __array__(self, dtype=None, copy=None):
+        return np.array((self.x, self.y), dtype=dtype)
 
     def __repr__(self) -> str:
         return f"({self.x}, {self.y})"
@@ -116,45 +143,133 @@ class Vec2D:
         return iter((self.x, self.y))
 
     def __eq__(self, other) -> bool:
-        return (self.arr == other.arr).all()
+        if not isinstance(other, Vec2D):
+            return NotImplemented
+        return self.x == other.x and self.y == other.y
 
     def __abs__(self) -> float:
-        return np.linalg.norm(self.arr)
+        return math.sqrt(self.x * self.x + self.y * self.y)
 
     def __hash__(self):
-        # Numpy arrays are mutable and therefore not hashable, so we hash the tuple of it instead.
-        # This now means we must be careful not to mutate the array.
-        # TODO: Fix this problem or figure out that hashing these values is not something we need to do.
-        return hash(tuple(self.arr))
-
-    @property
-    def x(self) -> float:
-        """The x value of this vector."""
-        return self.arr[0]
-
-    @property
-    def y(self) -> float:
-        """The y value of this vector."""
-        return self.arr[1]
+        return hash((self.x, self.y))
 
     def __add__(self, other: Vec2D) -> Vec2D:
-        return Vec2D.from_array(self.arr + other.arr)
+        return Vec2D(self.x + other.x, self.y + other.y)
 
     def __sub__(self, other: Vec2D) -> Vec2D:
-        return Vec2D.from_array(self.arr - other.arr)
+        return Vec2D(self.x - other.x, self.y - other.y)
 
     def __mul__(self, other: float) -> Vec2D:
         x = self.x * other
         y = self.y * other
         return Vec2D(x, y)
 
+    __rmul__ = __mul__
+
+    def __neg__(self) -> Vec2D:
+        return Vec2D(-self.x, -self.y)
+
+
+class Vec2DArray:
+    """A batch of 2D vectors, stored as a Numpy array with one vector per row."""
+
+    @staticmethod
+    def from_vectors(vectors) -> Vec2DArray:
+        """Alternative constructor to build from an iterable of vectors."""
+        return Vec2DArray([(v.x, v.y) for v in vectors])
+
+    def __init__(self, array) -> None:
+        self.arr = np.asarray(array, dtype=np.float64).reshape(-1, 2)
+
+    def __len__(self) -> int:
+        return len(self.arr)
+
+    def __getitem__(self, i) -> Vec2D:
+        x, y = self.arr[i].tolist()
+        return Vec2D(x, y)
+
+    def __iter__(self):
+        return (Vec2D(x, y) for x, y in self.arr.tolist())
+
+    def __array__(self, dtype=None, copy=None):
+        return self.arr if dtype is None else self.arr.astype(dtype)
+
+    @property
+    def x(self) -> np.ndarray:
+        """The x values of the vectors."""
+        return self.arr[:, 0]
+
+    @property
+    def y(self) -> np.ndarray:
+        """The y values of the vectors."""
+        return self.arr[:, 1]
+
+    def norms(self) -> np.ndarray:
+        """The length of each vector."""
+        x, y = self.x, self.y
+        return np.sqrt(x * x + y * y)
+
+
+def distances_to_segments(p, a, b) -> np.ndarray:
+    """Find the distance from each point p to the line segment from a to b, in the same way as
+    LineSegment.distance_to. p, a and b are arrays of points, with the coordinates in the last axis, and they are
+    broadcast against each other. E.g. a single point and N segments give N distances.
+    :returns an array of the distances.
+    """
+    p, a, b = (np.asarray(x, dtype=np.float64) for x in (p, a, b))
+    px, py = p[..., 0], p[..., 1]
+    ax, ay = a[..., 0], a[..., 1]
+    bx, by = b[..., 0], b[..., 1]
+    abx, aby = bx - ax, by - ay
+    apx, apy = px - ax, py - ay
+
+    dot = abx * apx + aby * apy
+    len_sq = abx * abx + aby * aby
+    with np.errstate(divide='ignore', invalid='ignore'):
+        param = np.where(len_sq != 0, dot / len_sq, -1)
+
+    rx = np.where(param < 0, ax, np.where(param > 1, bx, ax + param*abx))
+    ry = np.where(param < 0, ay, np.where(param > 1, by, ay + param*aby))
+    dx, dy = px - rx, py - ry
+    return np.sqrt(dx * dx + dy * dy)
+
+
+def _orientations(p, q, r) -> np.ndarray:
+    """The array version of LineSegment._orientation. """
+    val = (q[..., 1] - p[..., 1]) * (r[..., 0] - q[..., 0]) - (q[..., 0] - p[..., 0]) * (r[..., 1] - q[..., 1])
+    return np.sign(val)
+
+
+def _on_segments(p, q, r) -> np.ndarray:
+    """The array version of LineSegment.on_segment. """
+    return (q[..., 0] <= np.maximum(p[..., 0], r[..., 0])) & (q[..., 0] >= np.minimum(p[..., 0], r[..., 0])) & \
+        (q[..., 1] <= np.maximum(p[..., 1], r[..., 1])) & (q[..., 1] >= np.minimum(p[..., 1], r[..., 1]))
+
+
+def segments_intersect(p1, q1, p2, q2) -> np.ndarray:
+    """Test if each line segment from p1 to q1 intersects the line segment from p2 to q2, in the same way as
+    LineSegment.intersects_with. The arguments are broadcast against each other as in distances_to_segments.
+    :returns an array of the results.
+    """
+    p1, q1, p2, q2 = (np.asarray(x, dtype=np.float64) for x in (p1, q1, p2, q2))
+    o1 = _orientations(p1, q1, p2)
+    o2 = _orientations(p1, q1, q2)
+    o3 = _orientations(p2, q2, p1)
+    o4 = _orientations(p2, q2, q1)
+
+    return ((o1 != o2) & (o3 != o4)) | \
+        ((o1 == 0) & _on_segments(p1, p2, q1)) | \
+        ((o2 == 0) & _on_segments(p1, q2, q1)) | \
+        ((o3 == 0) & _on_segments(p2, p1, q2)) | \
+        ((o4 == 0) & _on_segments(p2, q1, q2))
+
 
 # TODO: Improve the tolerance.
 def parallel(a, b, tolerance=3e-10) -> bool:
     """Test if a and b are parallel vectors.
     :returns True if a and b are parallel, False otherwise.
     """
-    dot = abs(np.dot(a.arr, b.arr))
+    dot = abs(a.x * b.x + a.y * b.y)
     lengths = abs(a) * abs(b)
     return dot - lengths < tolerance
 
@@ -1,5 +1,7 @@
 from typing import List
 
+import numpy as np
+
 from LinAlg import Vec2D, LineSegment
 
 
@@ -29,3 +31,17 @@ class PointSampleHeuristic:
                 current_component_pr += unit_pr
             current_component_pq += unit_pq
         return sampled_points
+
+    @property
+    def point_array(self) -> np.ndarray:
+        """Get the points to sample as an array with one point per row, in the same order as points. """
+        p, q, r, n = self.p, self.q, self.r, self.n
+        unit_pq = LineSegment(p, q).vector * (1/(n-1))
+        unit_pr = LineSegment(p, r).vector * (1/(n-1))
+        # The components are accumulated one step at a time, as in points, so that the points are exactly the same.
+        steps = np.zeros((2, n, 2))
+        steps[0, 1:] = unit_pq.arr
+        steps[1, 1:] = unit_pr.arr
+        components_pq, components_pr = np.cumsum(steps, axis=1)
+        i, j = np.array([(i, j) for i in range(n) for j in range(n-i)]).T
+        return p.arr + components_pq[i] + components_pr[j]
@@ -0,0 +1,172 @@
+from __future__ import annotations
+
+import queue
+import threading
+
+import numpy as np
+
+from VesselTree import VesselTree
+
+
+class ResultsWriter:
+    """Appends the state of a growing tree to a single results file after each iteration.
+
+    The file is a sequence of .npy arrays, two for each iteration: a header, and the rows of the vessels that have
+    changed since the last iteration. Every checkpoint_interval iterations, all the rows are written instead, so that
+    a reader doesn't have to go back to the start. Only the state of each vessel is stored, and the derived values
+    such as the radii are worked out by the ResultsReader.
+
+    The rows are taken from the tree on the calling thread, but comparing them and writing them out is done on a
+    background thread, so growing the tree doesn't wait for the disk.
+    """
+
+    HEADER = np.dtype([('size', np.int64), ('full', np.bool_), ('radius', np.float64)])
+    ROW = np.dtype([('index', np.int64), ('parent', np.int64), ('children', np.int64, 2), ('scale', np.float64),
+                    ('k_res', np.float64), ('point', np.float64, 2)])
+
+    def __init__(self, path, checkpoint_interval=50) -> None:
+        assert checkpoint_interval > 0
+        self.checkpoint_interval = checkpoint_interval
+        self._file = open(path, 'wb')
+        self._queue = queue.Queue()
+        self._error = None  # An exception raised on the writing thread, to be raised again by close.
+        self._iterations = 0
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def __enter__(self) -> ResultsWriter:
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    @staticmethod
+    def _rows(tree: VesselTree) -> np.ndarray:
+        """:returns the row of every vessel of the tree, including the origin. """
+        n = len(tree.parent_indices)
+        rows = np.empty(n, dtype=ResultsWriter.ROW)
+        rows['index'] = np.arange(n)
+        rows['parent'] = tree.parent_indices
+        rows['children'] = tree.child_indices
+        rows['scale'] = tree.scaling_factors
+        rows['k_res'] = tree.resistance_coefficients
+        rows['point'] = tree.points
+        return rows
+
+    def write(self, tree: VesselTree) -> None:
+        """Record the tree as the next iteration. """
+        assert self._thread.is_alive(), "The writer has been closed"
+        self._queue.put((tree.radius, self._rows(tree)))
+
+    def _run(self) -> None:
+        previous = None
+        while (item := self._queue.get()) is not None:
+            if self._error is not None:
+                continue  # Something has already gone wrong, so just empty the queue.
+            try:
+                radius, rows = item
+                full = previous is None or self._iterations % self.checkpoint_interval == 0
+                if full:
+                    changed = rows
+                else:
+                    m = min(len(previous), len(rows))
+                    changed = np.concatenate((rows[:m][rows[:m] != previous[:m]], rows[m:]))
+                np.save(self._file, np.array((len(rows), full, radius), dtype=ResultsWriter.HEADER))
+                np.save(self._file, changed)
+                previous = rows
+                self._iterations += 1
+            except Exception as e:
+                self._error = e
+
+    def close(self) -> None:
+        """Wait for everything to be written, and close the file. """
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+            self._file.close()
+        if self._error is not None:
+            raise self._error
+
+
+class ResultsReader:
+    """Reads a file written by a ResultsWriter, and rebuilds the table of results for any iteration. """
+
+    def __init__(self, path) -> None:
+        self._headers = []
+        self._rows = []
+        with open(path, 'rb') as f:
+            end = f.seek(0, 2)
+            f.seek(0)
+            while f.tell() < end:
+                self._headers.append(np.load(f))
+                self._rows.append(np.load(f))
+
+    def __len__(self) -> int:
+        """The number of iterations recorded. """
+        return len(self._headers)
+
+    def rows_at(self, iteration) -> np.ndarray:
+        """:returns the row of every vessel, including the origin, at this iteration. """
+        assert 0 <= iteration < len(self)
+        k = iteration
+        while not self._headers[k]['full']:
+            k -= 1
+        rows = self._rows[k].copy()
+        for k in range(k + 1, iteration + 1):
+            size = int(self._headers[k]['size'])
+            if size > len(rows):
+                rows = np.concatenate((rows, np.zeros(size - len(rows), dtype=ResultsWriter.ROW)))
+            changed = self._rows[k]
+            rows[changed['index']] = changed
+        return rows
+
+    def table(self, iteration):
+        """Work out the results for each vessel at this iteration, with the vessels in pre-order.
+        :returns a dict that maps the name of each column to an array with a value for each vessel. The vessels are
+        identified by their position in the table (-1 for none), as in the names v0, v1, ... of the old text files.
+        """
+        rows = self.rows_at(iteration)
+        parent, children, scale = rows['parent'], rows['children'], rows['scale']
+        # Put the vessels in pre-order, and work out the radii on the way down.
+        order = []
+        radius = np.zeros(len(rows))
+        radius[VesselTree.ORIGIN] = self._headers[iteration]['radius']
+        stack = [int(children[VesselTree.ORIGIN, 0])]
+        while stack:
+            j = stack.pop()
+            order.append(j)
+            radius[j] = radius[parent[j]] * scale[j]
+            c0, c1 = children[j].tolist()
+            if c1 >= 0:
+                stack.append(c1)
+            if c0 >= 0:
+                stack.append(c0)
+        # The numbers of terminals are added up on the way back up.
+        num_terminals = np.zeros(len(rows), dtype=np.int64)
+        for j in reversed(order):
+            c0, c1 = children[j].tolist()
+            num_terminals[j] = 1 if c0 < 0 else num_terminals[c0] + (num_terminals[c1] if c1 >= 0 else 0)
+        order = np.array(order, dtype=np.int64)
+        position = np.full(len(rows), -1, dtype=np.int64)
+        position[order] = np.arange(len(order))
+        position = np.append(position, -1)  # So that NO_VESSEL (-1) maps to -1 as well.
+        distal = rows['point'][order]
+        proximal = rows['point'][parent[order]]
+        d = proximal - distal
+        length = np.sqrt(d[:, 0] * d[:, 0] + d[:, 1] * d[:, 1])
+        resistance = length / radius[order] ** 4
+        return {
+            "id": np.arange(len(order)),
+            "proximal point": proximal,
+            "distal point": distal,
+            "length": length,
+            "radius": radius[order],
+            "scaling factor": scale[order],
+            "resistance constant": rows['k_res'][order],
+            "resistance": resistance,
+            "pressure drop": resistance * num_terminals[order],
+            "parent": position[np.where(parent[order] == VesselTree.ORIGIN, VesselTree.NO_VESSEL, parent[order])],
+            "number of terminals": num_terminals[order],
+            "left child": position[children[order, 0]],
+            "right child": position[children[order, 1]],
+        }
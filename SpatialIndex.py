@@ -0,0 +1,194 @@
+from __future__ import annotations
+
+import heapq
+from collections import defaultdict
+from math import floor, sqrt
+
+import numpy as np
+
+from LinAlg import distances_to_segments
+
+
+def point_segment_distance(px, py, ax, ay, bx, by) -> float:
+    """The distance from the point p to the line segment ab. (Same as LineSegment.distance_to) """
+    abx = bx - ax
+    aby = by - ay
+    len_sq = abx * abx + aby * aby
+    param = ((px - ax) * abx + (py - ay) * aby) / len_sq if len_sq != 0 else -1
+    if param < 0:
+        rx, ry = ax, ay
+    elif param > 1:
+        rx, ry = bx, by
+    else:
+        rx, ry = ax + param * abx, ay + param * aby
+    dx, dy = px - rx, py - ry
+    return sqrt(dx * dx + dy * dy)
+
+
+class SegmentGrid:
+    """A uniform grid of buckets over a collection of line segments, for fast spatial queries.
+
+    Each segment is stored under a key (for vessels, the index of the vessel in its tree) and is put in every cell
+    that its bounding box overlaps. Queries then only need to look at the segments in nearby cells.
+    """
+
+    def __init__(self, cell_size) -> None:
+        assert cell_size > 0
+        self.cell_size = cell_size
+        self._cells = defaultdict(set)  # Maps the coordinates of a cell to the keys of the segments in it.
+        self._segments = {}  # Maps each key to the endpoints (ax, ay, bx, by) of its segment.
+        # The range of cells that have ever been occupied, so that searches know where to stop.
+        self._lo = None
+        self._hi = None
+
+    def __len__(self) -> int:
+        return len(self._segments)
+
+    def __contains__(self, key) -> bool:
+        return key in self._segments
+
+    def _cell(self, x, y):
+        return floor(x / self.cell_size), floor(y / self.cell_size)
+
+    def _cells_in_box(self, x0, y0, x1, y1):
+        (i0, j0), (i1, j1) = self._cell(x0, y0), self._cell(x1, y1)
+        return ((i, j) for i in range(i0, i1 + 1) for j in range(j0, j1 + 1))
+
+    def _box_cell_count(self, x0, y0, x1, y1) -> int:
+        (i0, j0), (i1, j1) = self._cell(x0, y0), self._cell(x1, y1)
+        return (i1 - i0 + 1) * (j1 - j0 + 1)
+
+    @staticmethod
+    def _bounding_box(s):
+        ax, ay, bx, by = s
+        return min(ax, bx), min(ay, by), max(ax, bx), max(ay, by)
+
+    def segment(self, key):
+        """:returns the endpoints of the segment stored under this key. """
+        ax, ay, bx, by = self._segments[key]
+        return (ax, ay), (bx, by)
+
+    def insert(self, key, a, b) -> None:
+        """Add the segment from a to b under this key. """
+        assert key not in self._segments
+        (ax, ay), (bx, by) = a, b
+        s = self._segments[key] = (float(ax), float(ay), float(bx), float(by))
+        box = self._bounding_box(s)
+        for c in self._cells_in_box(*box):
+            self._cells[c].add(key)
+        lo, hi = self._cell(box[0], box[1]), self._cell(box[2], box[3])
+        if self._lo is None:
+            self._lo, self._hi = lo, hi
+        else:
+            self._lo = min(self._lo[0], lo[0]), min(self._lo[1], lo[1])
+            self._hi = max(self._hi[0], hi[0]), max(self._hi[1], hi[1])
+
+    def remove(self, key) -> None:
+        """Remove the segment stored under this key. """
+        s = self._segments.pop(key)
+        for c in self._cells_in_box(*self._bounding_box(s)):
+            bucket = self._cells[c]
+            bucket.discard(key)
+            if not bucket:
+                del self._cells[c]
+
+    def update(self, key, a, b) -> None:
+        """Move the segment stored under this key so that it goes from a to b. """
+        self.remove(key)
+        self.insert(key, a, b)
+
+    def _keys_in_box(self, x0, y0, x1, y1):
+        if self._box_cell_count(x0, y0, x1, y1) > len(self._segments):
+            return set(self._segments)  # Cheaper to look at everything than to visit the cells.
+        keys = set()
+        cells = self._cells
+        for c in self._cells_in_box(x0, y0, x1, y1):
+            if c in cells:
+                keys |= cells[c]
+        return keys
+
+    def overlapping(self, lo, hi):
+        """:returns the keys of the segments whose bounding boxes overlap the box with corners lo and hi. """
+        (x0, y0), (x1, y1) = lo, hi
+        result = set()
+        for key in self._keys_in_box(x0, y0, x1, y1):
+            bx0, by0, bx1, by1 = self._bounding_box(self._segments[key])
+            if bx0 <= x1 and x0 <= bx1 and by0 <= y1 and y0 <= by1:
+                result.add(key)
+        return result
+
+    def distance_to(self, key, p) -> float:
+        """The distance from p to the segment stored under this key. """
+        px, py = p
+        return point_segment_distance(px, py, *self._segments[key])
+
+    def any_within(self, p, d) -> bool:
+        """Test if any segment is at a distance of at most d from p. """
+        px, py = p
+        segments = self._segments
+        for key in self._keys_in_box(px - d, py - d, px + d, py + d):
+            if point_segment_distance(px, py, *segments[key]) <= d:
+                return True
+        return False
+
+    def any_within_many(self, points, d) -> np.ndarray:
+        """Test any_within(p, d) for each row p of an N×2 array of points, and :return the results as a mask.
+        The distances to the nearby segments of all the points are found in one vectorised call.
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        rows = []
+        keys = []
+        for n, (px, py) in enumerate(points.tolist()):
+            nearby = self._keys_in_box(px - d, py - d, px + d, py + d)
+            rows.extend([n] * len(nearby))
+            keys.extend(nearby)
+        result = np.zeros(len(points), dtype=bool)
+        if keys:
+            s = np.array([self._segments[key] for key in keys])
+            near = distances_to_segments(points[rows], s[:, :2], s[:, 2:]) <= d
+            result[np.asarray(rows)[near]] = True
+        return result
+
+    def within(self, p, d):
+        """:returns the (distance, key) pairs of all segments at a distance of at most d from p, nearest first. """
+        px, py = p
+        segments = self._segments
+        pairs = ((point_segment_distance(px, py, *segments[key]), key)
+                 for key in self._keys_in_box(px - d, py - d, px + d, py + d))
+        return sorted(pair for pair in pairs if pair[0] <= d)
+
+    def nearest(self, p, k=None):
+        """:returns the (distance, key) pairs of the k segments nearest to p, nearest first.
+        If k is None, every segment is returned.
+        """
+        px, py = p
+        segments = self._segments
+        if k is None or k >= len(segments):
+            return sorted((point_segment_distance(px, py, *s), key) for key, s in segments.items())
+        # Search outwards in square rings of cells. Any segment that hasn't been seen after searching ring r only
+        # passes through cells in ring r+1 or further out, so it is at least r * cell_size away.
+        ci, cj = self._cell(px, py)
+        max_r = max(abs(ci - self._lo[0]), abs(ci - self._hi[0]), abs(cj - self._lo[1]), abs(cj - self._hi[1]))
+        seen = set()
+        best = []  # A max-heap (by negated distance) of the k nearest segments found so far.
+        r = 0
+        while r <= max_r:
+            if r == 0:
+                ring = ((ci, cj),)
+            else:
+                ring = [(ci + di, cj + dj) for di in range(-r, r + 1) for dj in (-r, r)] + \
+                       [(ci + di, cj + dj) for di in (-r, r) for dj in range(-r + 1, r)]
+            for c in ring:
+                for key in self._cells.get(c, ()):
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                    item = (-point_segment_distance(px, py, *segments[key]), -key)
+                    if len(best) < k:
+                        heapq.heappush(best, item)
+                    elif item > best[0]:
+                        heapq.heapreplace(best, item)
+            if len(best) == k and -best[0][0] <= r * self.cell_size:
+                break
+            r += 1
+        return sorted((-d, -key) for d, key in best)
@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+from collections import defaultdict
+
+import numpy as np
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:  # Without SciPy, the terminals are bucketed in a grid instead.
+    cKDTree = None
+
+
+class TerminalIndex:
+    """An index of the terminal points of a tree, for answering distance queries about many points at once.
+
+    The terminals are stored in a KD-tree when SciPy is available, and otherwise queries are answered by bucketing
+    the terminals in a grid of cells. The index describes the terminals as they were when it was built, so it has to
+    be rebuilt if the tree changes.
+    """
+
+    CHUNK = 1 << 20  # The number of point-to-terminal distances to find at once when there is no KD-tree.
+
+    def __init__(self, terminals) -> None:
+        self.terminals = np.asarray(terminals, dtype=np.float64).reshape(-1, 2)
+        self._kd = cKDTree(self.terminals) if cKDTree is not None and len(self.terminals) > 0 else None
+
+    def __len__(self) -> int:
+        return len(self.terminals)
+
+    @staticmethod
+    def _distances(p, t) -> np.ndarray:
+        """:returns the matrix of distances from each point of p to each point of t. """
+        dx = p[:, np.newaxis, 0] - t[:, 0]
+        dy = p[:, np.newaxis, 1] - t[:, 1]
+        return np.sqrt(dx * dx + dy * dy)
+
+    def nearest(self, points):
+        """:returns the distance from each point to the nearest terminal, and the index of that terminal. """
+        assert len(self) > 0
+        p = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        if self._kd is not None:
+            d, k = self._kd.query(p)
+            return d, k.astype(np.int64)
+        distances = np.empty(len(p))
+        nearest = np.empty(len(p), dtype=np.int64)
+        step = max(1, TerminalIndex.CHUNK // len(self))
+        for start in range(0, len(p), step):
+            e = self._distances(p[start:start + step], self.terminals)
+            k = e.argmin(axis=1)
+            nearest[start:start + step] = k
+            distances[start:start + step] = e[np.arange(len(k)), k]
+        return distances, nearest
+
+    def count_within(self, points, r) -> np.ndarray:
+        """:returns the number of terminals at a distance of at most r from each point. """
+        assert r > 0
+        p = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        if self._kd is not None:
+            return np.asarray(self._kd.query_ball_point(p, r, return_length=True), dtype=np.int64)
+        counts = np.zeros(len(p), dtype=np.int64)
+        if len(self) == 0 or len(p) == 0:
+            return counts
+        # With cells of side r, every terminal within r of a point is in the point's cell or one of its neighbours.
+        buckets = defaultdict(list)
+        for k, c in enumerate(np.floor(self.terminals / r).astype(np.int64).tolist()):
+            buckets[tuple(c)].append(k)
+        # Deal with the points one cell at a time, so that each cell only gathers its neighbouring terminals once.
+        cells, inverse = np.unique(np.floor(p / r).astype(np.int64), axis=0, return_inverse=True)
+        order = np.argsort(inverse.reshape(-1), kind='stable')
+        bounds = np.searchsorted(inverse.reshape(-1)[order], np.arange(len(cells) + 1))
+        for u, (i, j) in enumerate(cells.tolist()):
+            near = [k for di in (-1, 0, 1) for dj in (-1, 0, 1) for k in buckets.get((i + di, j + dj), ())]
+            if near:
+                rows = order[bounds[u]:bounds[u + 1]]
+                counts[rows] = (self._distances(p[rows], self.terminals[near]) <= r).sum(axis=1)
+        return counts
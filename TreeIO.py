@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+import struct
+
+import numpy as np
+
+from VesselTree import VesselTree
+
+
+class TreeIO:
+    """Saving and loading VesselTrees in a compact binary format.
+
+    A file starts with a fixed header: the magic bytes, the format version, the number of rows in the arrays, the
+    length of the free list, the generation of the cached radii and the radius of the origin. The arrays of the tree
+    follow in a fixed order, each one starting on a 64-byte boundary, with the free list last. All the values are
+    little-endian 64-bit integers and floats, with one row per vessel. (The origin is row 0)
+
+    The cached volumes, numbers of terminals and radii are saved too, so a loaded tree doesn't have to recompute
+    anything. Loading memory-maps the arrays rather than reading them, so even a huge tree opens straight away, and
+    only the parts that are used are read from the disk.
+    """
+
+    MAGIC = b'VESTREE\x00'
+    VERSION = 1
+    HEADER = struct.Struct('<8sIIqqqd')  # Magic, version, (reserved), rows, free list length, generation, radius.
+    ALIGNMENT = 64
+    # The arrays of a VesselTree, with the type and the shape of the rest of each row.
+    LAYOUT = (
+        ('_parent', '<i8', ()),
+        ('_children', '<i8', (2,)),
+        ('_scale', '<f8', ()),
+        ('_k_res', '<f8', ()),
+        ('_points', '<f8', (2,)),
+        ('_volume', '<f8', ()),
+        ('_num_terminals', '<i8', ()),
+        ('_radius', '<f8', ()),
+        ('_radius_generation', '<i8', ()),
+    )
+
+    @staticmethod
+    def _padding(offset) -> int:
+        return -offset % TreeIO.ALIGNMENT
+
+    @staticmethod
+    def save(tree, path) -> None:
+        """Write a VesselTree, or the tree of a blood vessel such as an Origin, to the file at path. """
+        tree = getattr(tree, 'tree', tree)
+        assert {name for name, _, _ in TreeIO.LAYOUT} == set(VesselTree._ARRAYS)
+        # Fill in every cached radius, so that a read-only tree never needs to write to its cache.
+        for i in tree.descendants_of(tree.root):
+            tree.radius_of(i)
+        n = tree._size
+        with open(path, 'wb') as f:
+            f.write(TreeIO.HEADER.pack(TreeIO.MAGIC, TreeIO.VERSION, 0, n, len(tree._free), tree._generation,
+                                       tree.radius))
+            arrays = [np.ascontiguousarray(getattr(tree, name)[:n], dtype=dtype) for name, dtype, _ in TreeIO.LAYOUT]
+            arrays.append(np.array(tree._free, dtype='<i8'))
+            for a in arrays:
+                f.write(b'\x00' * TreeIO._padding(f.tell()))
+                f.write(a.tobytes())
+
+    @staticmethod
+    def load(path, mode='r') -> VesselTree:
+        """Load the tree in the file at path, with its arrays memory-mapped, and :return it.
+        With mode 'r' the tree is read-only, and changing it raises an error. With mode 'c' it can be changed, but the
+        changes are only made in memory. (These are the modes of numpy.memmap)
+        """
+        with open(path, 'rb') as f:
+            magic, version, _, n, free, generation, radius = TreeIO.HEADER.unpack(f.read(TreeIO.HEADER.size))
+        if magic != TreeIO.MAGIC:
+            raise ValueError(f"{path} is not a vessel tree file")
+        if version != TreeIO.VERSION:
+            raise ValueError(f"{path} is version {version} of the vessel tree format, not {TreeIO.VERSION}")
+        tree = VesselTree.__new__(VesselTree)
+        state = {'_generation': generation, '_origin_radius': radius, '_size': n, '_journal': None}
+        offset = TreeIO.HEADER.size
+        for name, dtype, shape in (*TreeIO.LAYOUT, ('_free', '<i8', ())):
+            rows = free if name == '_free' else n
+            offset += TreeIO._padding(offset)
+            if rows > 0:
+                state[name] = np.memmap(path, dtype=dtype, mode=mode, offset=offset, shape=(rows, *shape))
+            else:
+                state[name] = np.zeros((0, *shape), dtype=dtype)
+            offset += state[name].nbytes
+        state['_free'] = state['_free'].tolist()
+        tree.__setstate__(state)
+        return tree
@@ -3,7 +3,9 @@ import random
 from abc import ABC
 from math import pi, sqrt
 
-from LinAlg import LineSegment, Vec2D
+import numpy as np
+
+from LinAlg import LineSegment, Vec2D, Vec2DArray
 
 
 class VascularDomain(ABC):
@@ -16,18 +18,34 @@ class VascularDomain(ABC):
     def characteristic_length(self, number_of_terminals):
         return sqrt(self.area / (number_of_terminals * pi))
 
-    @abc.abstractmethod
-    def point_grid(self, intervals):
+    def point_grid(self, intervals=1000):
         """Generate a uniform grid of points within the domain. """
+        points, inside = self.grid_array(intervals)
+        return (Vec2D(x, y) for x, y in points[inside].tolist())
+
+    @abc.abstractmethod
+    def grid_array(self, intervals=1000):
+        """Lay a uniform grid of points over the domain, in the same order as point_grid.
+        :returns an N×2 array of all the points of the grid, and a mask of the ones that are inside the domain.
+        """
 
     @abc.abstractmethod
     def generate_point(self) -> Vec2D:
         """Generate a random point in the domain. """
 
+    @abc.abstractmethod
+    def generate_points(self, n, rng: np.random.Generator) -> np.ndarray:
+        """Generate n independent, uniformly random points in the domain using rng, and :return them as an n×2 array.
+        """
+
     @abc.abstractmethod
     def contains(self, p) -> bool:
         """Test that the domain contains p. """
 
+    @abc.abstractmethod
+    def contains_many(self, points) -> np.ndarray:
+        """Test that the domain contains each row of an N×2 array of points, and :return the mask. """
+
 
 class RectangularVascularDomain(VascularDomain):
 
@@ -39,21 +57,26 @@ class RectangularVascularDomain(VascularDomain):
     def area(self):
         return self.x * self.y
 
-    def point_grid(self, s=1000):
-        for i in range(0, s):
-            for j in range(0, s):
-                x = self.x * (i / s)
-                y = self.y * (j / s)
-                yield Vec2D(x, y)
+    def grid_array(self, s=1000):
+        i, j = np.meshgrid(np.arange(s) / s, np.arange(s) / s, indexing='ij')
+        points = np.column_stack((self.x * i.ravel(), self.y * j.ravel()))
+        return points, np.ones(len(points), dtype=bool)
 
     def generate_point(self) -> Vec2D:
         i = random.uniform(0, self.x)
         j = random.uniform(0, self.y)
         return Vec2D(i, j)
 
+    def generate_points(self, n, rng: np.random.Generator) -> np.ndarray:
+        return rng.uniform((0.0, 0.0), (self.x, self.y), size=(n, 2))
+
     def contains(self, p) -> bool:
         return self.x >= p.x >= 0 and self.y >= p.y >= 0
 
+    def contains_many(self, points) -> np.ndarray:
+        x, y = np.asarray(points, dtype=np.float64).T
+        return (self.x >= x) & (x >= 0) & (self.y >= y) & (y >= 0)
+
 
 class CircularVascularDomain(VascularDomain):
 
@@ -65,8 +88,9 @@ class CircularVascularDomain(VascularDomain):
     def area(self):
         return pi * self.radius**2
 
-    def point_grid(self, intervals=1000):
-        return (p for p in self.enclosure.point_grid(intervals) if self.contains(p))
+    def grid_array(self, intervals=1000):
+        points, _ = self.enclosure.grid_array(intervals)
+        return points, self.contains_many(points)
 
     def generate_point(self) -> Vec2D:
         p = self.enclosure.generate_point()
@@ -74,5 +98,179 @@ class CircularVascularDomain(VascularDomain):
             p = self.enclosure.generate_point()
         return p
 
+    def generate_points(self, n, rng: np.random.Generator) -> np.ndarray:
+        # Sample in polar coordinates rather than rejecting points of the enclosure. Taking the square root of the
+        # radius spreads the points evenly over the area, instead of bunching them up near the centre.
+        points = np.empty((0, 2))
+        while len(points) < n:
+            m = n - len(points)
+            r = self.radius * np.sqrt(rng.random(m))
+            theta = 2 * pi * rng.random(m)
+            p = np.column_stack((self.radius + r * np.cos(theta), self.radius + r * np.sin(theta)))
+            # Rounding can put the odd point right on the boundary, so those are drawn again.
+            points = np.concatenate((points, p[self.contains_many(p)]))
+        return points
+
     def contains(self, p) -> bool:
         return abs(p - Vec2D(self.radius, self.radius)) < self.radius
+
+    def contains_many(self, points) -> np.ndarray:
+        return Vec2DArray(np.asarray(points, dtype=np.float64) - self.radius).norms() < self.radius
+
+
+class PolygonVascularDomain(VascularDomain):
+    """A domain bounded by a polygon, which may have polygonal holes in it.
+
+    A point is inside if a ray from it crosses the edges of the outline and the holes an odd number of times. To avoid
+    looking at every edge, the bounding box is cut into horizontal slabs and each slab keeps a list of the edges that
+    span part of it. A horizontal ray from a point can only cross the edges in the point's slab.
+    The slabs are at least as tall as the mean height of the edges, and there are never more slabs than edges. An edge
+    is in at most two more slabs than its height in slabs, so the lists hold at most three entries per edge in all,
+    however long some of the edges are.
+    """
+
+    def __init__(self, outline, holes=()):
+        rings = [np.array([tuple(p) for p in ring], dtype=np.float64) for ring in (outline, *holes)]
+        assert all(len(ring) >= 3 for ring in rings)
+        self.outline = rings[0]
+        self.holes = rings[1:]
+        # The area of each ring by the shoelace formula.
+        self._area = abs(self._ring_area(rings[0])) - sum(abs(self._ring_area(ring)) for ring in rings[1:])
+        assert self._area > 0
+        self.x0, self.y0 = self.outline.min(axis=0).tolist()
+        self.x1, self.y1 = self.outline.max(axis=0).tolist()
+        # The edges, as the rows (ax, ay, bx, by). Horizontal edges are never crossed by a horizontal ray, so they are
+        # left out.
+        edges = np.concatenate([np.hstack((ring, np.roll(ring, -1, axis=0))) for ring in rings])
+        self._edges = edges = edges[edges[:, 1] != edges[:, 3]]
+        heights = np.abs(edges[:, 3] - edges[:, 1])
+        self._slab_count = n = max(1, min(len(edges), int((self.y1 - self.y0) / heights.mean())))
+        self._slab_height = (self.y1 - self.y0) / n
+        lo = self._slab_of(np.minimum(edges[:, 1], edges[:, 3]))
+        hi = self._slab_of(np.maximum(edges[:, 1], edges[:, 3]))
+        # List the (slab, edge) pairs: edge e is in the slabs lo[e] to hi[e].
+        spans = hi - lo + 1
+        ends = np.cumsum(spans)
+        edge = np.repeat(np.arange(len(edges)), spans)
+        slab = np.repeat(lo, spans) + np.arange(ends[-1]) - np.repeat(ends - spans, spans)
+        # The edges of slab s are _slab_edges[_slab_starts[s]:_slab_starts[s + 1]].
+        self._slab_edges = edge[np.argsort(slab, kind='stable')]
+        self._slab_starts = np.concatenate(([0], np.cumsum(np.bincount(slab, minlength=n))))
+
+    @staticmethod
+    def _ring_area(ring) -> float:
+        x, y = ring.T
+        return float(np.dot(x, np.roll(y, -1)) - np.dot(np.roll(x, -1), y)) / 2
+
+    def _slab_of(self, y) -> np.ndarray:
+        return np.clip(np.floor((y - self.y0) / self._slab_height), 0, self._slab_count - 1).astype(np.int64)
+
+    @property
+    def area(self):
+        return self._area
+
+    def grid_array(self, intervals=1000):
+        i, j = np.meshgrid(np.arange(intervals) / intervals, np.arange(intervals) / intervals, indexing='ij')
+        points = np.column_stack((self.x0 + (self.x1 - self.x0) * i.ravel(), self.y0 + (self.y1 - self.y0) * j.ravel()))
+        return points, self.contains_many(points)
+
+    def generate_point(self) -> Vec2D:
+        p = Vec2D(random.uniform(self.x0, self.x1), random.uniform(self.y0, self.y1))
+        while not self.contains(p):
+            p = Vec2D(random.uniform(self.x0, self.x1), random.uniform(self.y0, self.y1))
+        return p
+
+    def generate_points(self, n, rng: np.random.Generator) -> np.ndarray:
+        # Rejection sampling from the bounding box, drawing enough points each time to expect to fill the rest.
+        box = (self.x1 - self.x0) * (self.y1 - self.y0)
+        points = np.empty((0, 2))
+        while len(points) < n:
+            m = int((n - len(points)) * box / self._area * 1.1) + 1
+            p = rng.uniform((self.x0, self.y0), (self.x1, self.y1), size=(m, 2))
+            points = np.concatenate((points, p[self.contains_many(p)]))
+        return points[:n]
+
+    def contains(self, p) -> bool:
+        return bool(self.contains_many(np.array([tuple(p)]))[0])
+
+    def contains_many(self, points) -> np.ndarray:
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        x, y = points.T
+        inside = np.zeros(len(points), dtype=bool)
+        candidates = np.flatnonzero((self.x0 <= x) & (x <= self.x1) & (self.y0 <= y) & (y <= self.y1))
+        slab = self._slab_of(y[candidates])
+        order = np.argsort(slab, kind='stable')
+        bounds = np.searchsorted(slab[order], np.arange(self._slab_count + 1))
+        # Deal with the points one slab at a time, counting the crossings of that slab's edges.
+        for s in np.flatnonzero(np.diff(bounds)).tolist():
+            rows = candidates[order[bounds[s]:bounds[s + 1]]]
+            ax, ay, bx, by = self._edges[self._slab_edges[self._slab_starts[s]:self._slab_starts[s + 1]]].T
+            px, py = x[rows, np.newaxis], y[rows, np.newaxis]
+            crosses = ((ay > py) != (by > py)) & (px < ax + (py - ay) * (bx - ax) / (by - ay))
+            inside[rows] = crosses.sum(axis=1) % 2 == 1
+        return inside
+
+
+class MaskVascularDomain(VascularDomain):
+    """A domain given by a 2D occupancy bitmap, such as a segmented image of an organ.
+
+    Pixel [i, j] of the mask is the square of side cell_size whose lower corner is at origin + cell_size * (i, j), so
+    the first axis of the mask runs along x. The domain is the union of the pixels that are set. A prefix sum of the
+    pixels that are set lets random points be drawn without any rejection, by picking a pixel with a binary search.
+    """
+
+    def __init__(self, mask, cell_size=1.0, origin=(0.0, 0.0)):
+        self.mask = np.asarray(mask, dtype=bool)
+        assert self.mask.ndim == 2 and self.mask.any()
+        self.cell_size = cell_size
+        self.x0, self.y0 = (float(c) for c in origin)
+        self._cumulative = np.cumsum(self.mask.ravel())  # The number of pixels set up to each pixel.
+
+    @property
+    def area(self):
+        return int(self._cumulative[-1]) * self.cell_size * self.cell_size
+
+    def _pixels(self, points):
+        """:returns the pixel coordinates of each row of an N×2 array of points. """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        i = np.floor((points[:, 0] - self.x0) / self.cell_size).astype(np.int64)
+        j = np.floor((points[:, 1] - self.y0) / self.cell_size).astype(np.int64)
+        return i, j
+
+    def grid_array(self, intervals=1000):
+        i, j = np.meshgrid(np.arange(intervals) / intervals, np.arange(intervals) / intervals, indexing='ij')
+        w, h = (n * self.cell_size for n in self.mask.shape)
+        points = np.column_stack((self.x0 + w * i.ravel(), self.y0 + h * j.ravel()))
+        return points, self.contains_many(points)
+
+    def _points_in_pixels(self, k, u, v) -> np.ndarray:
+        """:returns the points at the fractions (u, v) of the way across the kth pixels that are set. """
+        i, j = np.unravel_index(np.searchsorted(self._cumulative, k, side='right'), self.mask.shape)
+        return np.column_stack((self.x0 + (i + u) * self.cell_size, self.y0 + (j + v) * self.cell_size))
+
+    def generate_point(self) -> Vec2D:
+        p = None
+        while p is None or not self.contains(p):
+            k = random.randrange(int(self._cumulative[-1]))
+            x, y = self._points_in_pixels(np.array([k]), random.random(), random.random())[0].tolist()
+            p = Vec2D(x, y)
+        return p
+
+    def generate_points(self, n, rng: np.random.Generator) -> np.ndarray:
+        points = np.empty((0, 2))
+        while len(points) < n:
+            m = n - len(points)
+            p = self._points_in_pixels(rng.integers(int(self._cumulative[-1]), size=m), rng.random(m), rng.random(m))
+            # Rounding can put the odd point on the far edge of its pixel, so those are drawn again.
+            points = np.concatenate((points, p[self.contains_many(p)]))
+        return points
+
+    def contains(self, p) -> bool:
+        return bool(self.contains_many(np.array([tuple(p)]))[0])
+
+    def contains_many(self, points) -> np.ndarray:
+        i, j = self._pixels(points)
+        nx, ny = self.mask.shape
+        inside = (0 <= i) & (i < nx) & (0 <= j) & (j < ny)
+        inside[inside] = self.mask[i[inside], j[inside]]
+        return inside
@@ -0,0 +1,718 @@
+from __future__ import annotations
+
+import weakref
+from dataclasses import dataclass
+from math import sqrt, pi, inf
+
+import numpy as np
+
+from LinAlg import Vec2D
+from PointSampleHeuristic import PointSampleHeuristic
+from TerminalIndex import TerminalIndex
+
+
+@dataclass(frozen=True)
+class BifurcationEvaluation:
+    """The outcome of connecting a terminal to the tree by bifurcating a vessel at the best point. """
+    cost: float  # The cost of the whole tree after the bifurcation.
+    point: Vec2D  # The bifurcation point.
+    valid: bool  # False if one of the three vessels at the bifurcation is wider than it is long.
+
+
+class VesselTree:
+    """A binary tree of blood vessels stored as a structure of arrays.
+
+    Every vessel is identified by an integer index. Index 0 is the origin, the fixed inflow point of the tree, and its
+    only child is the root vessel. For each index we store the index of the parent, the pair of child indices (-1 for
+    an empty slot), the scaling factor of the radius relative to the parent's radius, the "resistance coefficient" of
+    the distal subtree and the coordinates of the distal point.
+
+    To make the cost of the tree cheap to find, we also cache the volume of each subtree per unit of squared radius,
+        V_i = pi * L_i + sum(s_c^2 * V_c for each child c).
+    The cost of the subtree of vessel i is then r_i^2 * V_i. Changing a vessel only changes V along the path from that
+    vessel to the root, so keeping it up to date costs O(depth).
+
+    The number of terminals in each subtree is cached in the same way. The radius of a vessel depends on every scaling
+    factor above it, and a rescale changes scaling factors all the way up to the root, so cached radii are instead
+    stamped with a generation number that is bumped whenever any scaling factor changes. A stale radius is recomputed
+    from the nearest ancestor whose radius is still valid.
+    """
+
+    GAMMA = 3  # Required for Murray's Law
+    ORIGIN = 0
+    NO_VESSEL = -1
+    DEBUG = False  # Check the cached values against a full recomputation after every change. (Very slow!)
+    INTERVALS = 10  # The number of points sampled along each side of the triangle of possible bifurcation points.
+    REFINE_ITERATIONS = 20  # The number of Nelder-Mead steps taken when refining a bifurcation point.
+
+    def __init__(self, radius, origin_point, capacity=16) -> None:
+        self._generation = 0
+        self.radius = radius  # The radius of the origin.
+        self._parent = np.full(capacity, VesselTree.NO_VESSEL, dtype=np.int64)
+        self._children = np.full((capacity, 2), VesselTree.NO_VESSEL, dtype=np.int64)
+        self._scale = np.ones(capacity)
+        self._k_res = np.zeros(capacity)
+        self._points = np.zeros((capacity, 2))
+        self._points[VesselTree.ORIGIN] = tuple(origin_point)
+        self._volume = np.zeros(capacity)  # The cached subtree volume per unit of squared radius.
+        self._num_terminals = np.zeros(capacity, dtype=np.int64)
+        self._radius = np.zeros(capacity)
+        self._radius_generation = np.full(capacity, -1, dtype=np.int64)
+        self._size = 1
+        self._free = []  # Indices of vessels that have been removed, so that they can be reused.
+        self._init_journal()
+        # The objects that give each vessel the BloodVessel interface, keyed by index. They only hold the tree and the
+        # index, so they are held weakly: otherwise a tree and its views would keep each other alive until the garbage
+        # collector found the cycle, and so would every snapshot (and its claim on the journal) that had been used.
+        self.views = weakref.WeakValueDictionary()
+
+    def __len__(self) -> int:
+        """The number of vessels in the tree, not including the origin. """
+        return self._size - len(self._free) - 1
+
+    @property
+    def radius(self) -> float:
+        """The radius of the origin. """
+        return self._origin_radius
+
+    @radius.setter
+    def radius(self, r) -> None:
+        self._origin_radius = r
+        self._generation += 1
+
+    # Whole-tree array access. These are views, so they must be treated as read-only.
+
+    @property
+    def parent_indices(self):
+        return self._parent[:self._size]
+
+    @property
+    def child_indices(self):
+        return self._children[:self._size]
+
+    @property
+    def scaling_factors(self):
+        return self._scale[:self._size]
+
+    @property
+    def resistance_coefficients(self):
+        return self._k_res[:self._size]
+
+    @property
+    def points(self):
+        return self._points[:self._size]
+
+    # Per-vessel queries
+
+    @property
+    def root(self) -> int:
+        return int(self._children[VesselTree.ORIGIN, 0])
+
+    def parent_of(self, i) -> int:
+        return int(self._parent[i])
+
+    def children_of(self, i):
+        """:returns a tuple of the indices of the children of vessel i. """
+        c0, c1 = self._children[i].tolist()
+        if c0 < 0:
+            return ()
+        if c1 < 0:
+            return c0,
+        return c0, c1
+
+    def is_terminal(self, i) -> bool:
+        return self._children[i, 0] < 0
+
+    def point_of(self, i) -> Vec2D:
+        """The distal point of vessel i. """
+        x, y = self._points[i].tolist()
+        return Vec2D(x, y)
+
+    def proximal_point_of(self, i) -> Vec2D:
+        x, y = self._points[self._parent[i]].tolist()
+        return Vec2D(x, y)
+
+    def scaling_factor_of(self, i) -> float:
+        return float(self._scale[i])
+
+    def resistance_coefficient_of(self, i) -> float:
+        return float(self._k_res[i])
+
+    def length_of(self, i) -> float:
+        xd, yd = self._points[i].tolist()
+        xp, yp = self._points[self._parent[i]].tolist()
+        # Squares are multiplied out, as Python's ** 2 doesn't always round the same as NumPy's, which the array
+        # versions of these calculations use.
+        dx, dy = xp - xd, yp - yd
+        return sqrt(dx * dx + dy * dy)
+
+    def radius_of(self, i) -> float:
+        """The radius of vessel i, found from the radius of the origin and the scaling factors on the way. """
+        if i == VesselTree.ORIGIN:
+            return self._origin_radius
+        generation = self._generation
+        if self._radius_generation[i] == generation:
+            return float(self._radius[i])
+        # Find the stale part of the path up to the origin, then fill it in from the top.
+        path = []
+        j = i
+        while j != VesselTree.ORIGIN and self._radius_generation[j] != generation:
+            path.append(j)
+            j = self._parent[j]
+        r = self._origin_radius if j == VesselTree.ORIGIN else self._radius[j]
+        for k in reversed(path):
+            r *= self._scale[k]
+            self._radius[k] = r
+            self._radius_generation[k] = generation
+        return float(r)
+
+    def descendants_of(self, i):
+        """Generate the indices of vessel i and all of its descendants, in pre-order. """
+        stack = [i]
+        while stack:
+            j = stack.pop()
+            yield j
+            c0, c1 = self._children[j].tolist()
+            if c1 >= 0:
+                stack.append(c1)
+            if c0 >= 0:
+                stack.append(c0)
+
+    def num_terminals_of(self, i) -> int:
+        """The number of terminals that can be reached from vessel i. """
+        if i == VesselTree.ORIGIN:
+            i = self.root
+        return int(self._num_terminals[i])
+
+    def terminal_index(self) -> TerminalIndex:
+        """:returns an index of the terminal points, in pre-order, for distance queries over many points at once.
+        The index isn't kept up to date, so it should be rebuilt after the tree changes.
+        """
+        vessels = np.fromiter(self.descendants_of(self.root), dtype=np.int64)
+        return TerminalIndex(self._points[vessels[self._children[vessels, 0] < 0]])
+
+    def _update_terminals(self, i) -> None:
+        """Recompute the cached number of terminals of vessel i and the vessels above it. """
+        while i != VesselTree.ORIGIN:
+            c0, c1 = self._children[i].tolist()
+            n = 1 if c0 < 0 else self._num_terminals[c0] + (self._num_terminals[c1] if c1 >= 0 else 0)
+            if n == self._num_terminals[i]:
+                break  # Nothing above here changes either.
+            self._save(i)
+            self._num_terminals[i] = n
+            i = self._parent[i]
+
+    def cost_of(self, i) -> float:
+        """The volume of blood needed to fill the subtree of vessel i. For the origin, this is the whole tree. """
+        if i == VesselTree.ORIGIN:
+            i = self.root
+        r = self.radius_of(i)
+        return r * r * float(self._volume[i])
+
+    def _compute_volume(self, i) -> float:
+        """Find the subtree volume per unit of squared radius of vessel i from the cached values of its children. """
+        v = pi * self.length_of(i)
+        for c in self._children[i].tolist():
+            if c >= 0:
+                s = self._scale[c]
+                v += s * s * self._volume[c]
+        return v
+
+    def _update_volumes(self, i) -> None:
+        """Recompute the cached volumes of vessel i and every vessel above it. """
+        while i != VesselTree.ORIGIN:
+            self._save(i)
+            self._volume[i] = self._compute_volume(i)
+            i = self._parent[i]
+
+    # Mutation
+
+    def _init_journal(self) -> None:
+        # Once a snapshot has been taken, a list with a dict for each snapshot that maps the index of each vessel
+        # changed since then to its row of values from before the change. (See snapshot) The snapshots are numbered
+        # in the order they were taken, and the first dict is for snapshot number _journal_start.
+        self._journal = None
+        self._journal_start = 0
+        self._num_snapshots = 0
+        # The snapshots that haven't been filled in yet, by number. These are weak references, so that a snapshot
+        # that is thrown away stops holding on to the journal.
+        self._snapshots = weakref.WeakValueDictionary()
+
+    def _trim_journal(self) -> None:
+        """Drop the dicts of the journal from before the oldest snapshot that hasn't been filled in yet, or the whole
+        journal if there aren't any.
+        """
+        if self._journal is None:
+            return
+        numbers = list(self._snapshots.keys())
+        if not numbers:
+            self._journal = None
+            return
+        oldest = min(numbers)
+        del self._journal[:oldest - self._journal_start]
+        self._journal_start = oldest
+
+    def _save(self, i) -> None:
+        """Record the values of vessel i in the journal, if this is its first change since the last snapshot. """
+        if self._journal is not None:
+            if len(self._snapshots) == 0:
+                self._journal = None  # Every snapshot has been filled in or thrown away, so nothing needs it.
+                return
+            changes = self._journal[-1]
+            if i not in changes:
+                c0, c1 = self._children[i].tolist()
+                x, y = self._points[i].tolist()
+                changes[i] = (int(self._parent[i]), c0, c1, float(self._scale[i]), float(self._k_res[i]), x, y,
+                              float(self._volume[i]), int(self._num_terminals[i]))
+
+    def _grow(self) -> None:
+        old = len(self._parent)
+        new = 2 * old
+        self._parent = np.concatenate((self._parent, np.full(old, VesselTree.NO_VESSEL, dtype=np.int64)))
+        self._children = np.concatenate((self._children, np.full((old, 2), VesselTree.NO_VESSEL, dtype=np.int64)))
+        self._scale = np.concatenate((self._scale, np.ones(old)))
+        self._k_res = np.concatenate((self._k_res, np.zeros(old)))
+        self._points = np.concatenate((self._points, np.zeros((old, 2))))
+        self._volume = np.concatenate((self._volume, np.zeros(old)))
+        self._num_terminals = np.concatenate((self._num_terminals, np.zeros(old, dtype=np.int64)))
+        self._radius = np.concatenate((self._radius, np.zeros(old)))
+        self._radius_generation = np.concatenate((self._radius_generation, np.full(old, -1, dtype=np.int64)))
+        assert len(self._parent) == new
+
+    def _allocate(self, parent, scale, point) -> int:
+        if self._free:
+            i = self._free.pop()
+        else:
+            if self._size == len(self._parent):
+                self._grow()
+            i = self._size
+            self._size += 1
+        self._save(i)
+        self._parent[i] = parent
+        self._children[i] = VesselTree.NO_VESSEL
+        self._scale[i] = scale
+        self._k_res[i] = 0.0
+        self._points[i] = tuple(point)
+        self._volume[i] = 0.0
+        self._num_terminals[i] = 1
+        self._radius_generation[i] = -1
+        return i
+
+    def _release(self, i) -> None:
+        for j in list(self.descendants_of(i)):
+            self._save(j)
+            self._parent[j] = VesselTree.NO_VESSEL
+            self._children[j] = VesselTree.NO_VESSEL
+            self.views.pop(j, None)
+            self._free.append(j)
+
+    def _link(self, i, c) -> None:
+        # Each vessel has at most two children.
+        slot = 0 if self._children[i, 0] < 0 else 1
+        assert self._children[i, slot] < 0
+        self._save(i)
+        self._save(c)
+        self._children[i, slot] = c
+        self._parent[c] = i
+
+    def attach_child(self, i, c) -> None:
+        """Make c a child of vessel i. """
+        self._link(i, c)
+        self._generation += 1
+        self._update_terminals(i)
+        self._update_volumes(c)
+        self._check()
+
+    def detach_child(self, i, c) -> None:
+        """Remove c from the children of vessel i, keeping the remaining child in the first slot. """
+        c0, c1 = self._children[i].tolist()
+        self._save(i)
+        if c0 == c:
+            self._children[i] = (c1, VesselTree.NO_VESSEL)
+        else:
+            assert c1 == c
+            self._children[i, 1] = VesselTree.NO_VESSEL
+        self._update_terminals(i)
+        self._update_volumes(i)
+        self._check()
+
+    def _replace_child(self, i, old, new) -> None:
+        slot = 0 if self._children[i, 0] == old else 1
+        assert self._children[i, slot] == old
+        self._save(i)
+        self._save(new)
+        self._children[i, slot] = new
+        self._parent[new] = i
+
+    def create_child(self, i, scale, point) -> int:
+        """Create a child of vessel i with a given scaling factor and distal point, and :return its index. """
+        c = self._allocate(i, scale, point)
+        self.attach_child(i, c)
+        return c
+
+    def _move(self, i, point) -> None:
+        # Moving a point changes the length of the vessel and of its children.
+        self._save(i)
+        self._points[i] = tuple(point)
+        for c in self.children_of(i):
+            self._save(c)
+            self._volume[c] = self._compute_volume(c)
+
+    def set_point(self, i, point) -> None:
+        self._move(i, point)
+        self._update_volumes(i)
+        self._check()
+
+    def set_scaling_factor(self, i, scaling_factor) -> None:
+        self._save(i)
+        self._scale[i] = scaling_factor
+        self._generation += 1
+        self._update_volumes(self._parent[i])
+        self._check()
+
+    def bifurcate(self, i, terminal_point, bifurcation_point=None):
+        """Attach a new terminal to the tree by creating a bifurcation point on vessel i.
+        :returns the indices of the new parent of vessel i and of the new terminal vessel.
+        """
+        g = self.parent_of(i)
+        if bifurcation_point is None:
+            bifurcation_point = (self._points[g] + self._points[i]) * 0.5
+        # The new parent takes over the place of i in the tree, so it inherits the scaling factor.
+        a = self._allocate(g, self._scale[i], bifurcation_point)
+        self._replace_child(g, i, a)
+        self._link(a, i)  # The old vessel is the 0th child
+        t = self._allocate(a, 1.0, terminal_point)
+        self._link(a, t)  # The new vessel is the 1st child
+        self._num_terminals[a] = self._num_terminals[i]
+        self._update_terminals(a)
+        self._save(i)
+        self._volume[i] = self._compute_volume(i)
+        self._volume[t] = self._compute_volume(t)
+        self.rescale(a)
+        return a, t
+
+    def remove_bifurcation(self, i) -> None:
+        """Remove the bifurcation point at the proximal end of vessel i, along with the vessel's sibling. """
+        a = self.parent_of(i)
+        assert a != VesselTree.ORIGIN
+        g = self.parent_of(a)
+        sibling, = (c for c in self.children_of(a) if c != i)
+        self._save(i)
+        self._save(a)
+        self._scale[i] = self._scale[a]
+        self._replace_child(g, a, i)
+        self._children[a] = (sibling, VesselTree.NO_VESSEL)
+        self._release(a)
+        self._generation += 1
+        self._update_terminals(g)
+        self._volume[i] = self._compute_volume(i)
+        self.rescale(g)
+
+    @staticmethod
+    def _murray(nt_a, res_a, nt_b, res_b):
+        """Find the scaling factors of two sibling vessels and the resistance coefficient of their parent.
+        res_a and res_b are the full "resistance coefficients" of each vessel and its distal subtree.
+        These can be scalars or arrays. Powers are always taken with np.power, since it rounds differently from the **
+        of Python and NumPy scalars, and the results must not depend on which of these is used.
+        """
+        g = VesselTree.GAMMA
+        s_ratio = np.power((nt_b * res_b) / (nt_a * res_a), 1 / 4)  # = s_b / s_a
+        s_a = np.power(1 + np.power(s_ratio, g), -1 / g)
+        s_b = np.power(1 + np.power(s_ratio, -g), -1 / g)
+        k_new_inv = (np.power(s_a, 4) / res_a) + (np.power(s_b, 4) / res_b)
+        return s_a, s_b, 1 / k_new_inv
+
+    def rescale(self, i) -> None:
+        """Recompute the scaling factors for the radii of the children of vessel i and of every vessel above it.
+        The cached volumes of the children of vessel i must be up to date.
+        """
+        g = VesselTree.GAMMA
+        if i != VesselTree.ORIGIN:
+            self._generation += 1
+        while i != VesselTree.ORIGIN:
+            a, b = self._children[i].tolist()
+            assert a >= 0 and b >= 0
+            nt_a = self._num_terminals[a]
+            nt_b = self._num_terminals[b]
+            res_a = self._k_res[a] + self.length_of(a)
+            res_b = self._k_res[b] + self.length_of(b)
+            s_a, s_b, k_new = self._murray(nt_a, res_a, nt_b, res_b)
+            self._save(i)
+            self._k_res[i] = k_new
+
+            # An extension to the project could be to further reduce these tolerance values!
+            length = self.length_of(i)
+            assert abs(1.0 - s_a ** g - s_b ** g) < 1e-13  # I.e. satisfies Murray's Law
+            assert abs(res_a * nt_a * s_a ** -4 - res_b * nt_b * s_b ** -4) < 1e-9  # I.e. parallel pressures are equal
+            assert abs((length + k_new) * (nt_a + nt_b)
+                       - length * (nt_a + nt_b)
+                       - res_a * nt_a * s_a ** -4) < 1e-9  # I.e. pressure drops are consistent
+
+            self._save(a)
+            self._save(b)
+            self._scale[a] = s_a
+            self._scale[b] = s_b
+            self._volume[i] = self._compute_volume(i)
+            i = self.parent_of(i)
+        self._check()
+
+    def _check(self) -> None:
+        if VesselTree.DEBUG:
+            self.check_caches()
+
+    def check_caches(self) -> None:
+        """Check that every cached value agrees with a full recomputation from the tree. """
+        for i in self.descendants_of(self.root):
+            n = sum(1 for j in self.descendants_of(i) if self._children[j, 0] < 0)
+            assert self._num_terminals[i] == n, f"Vessel {i} has {self._num_terminals[i]} terminals cached, not {n}"
+            j = i
+            scales = []
+            while j != VesselTree.ORIGIN:
+                scales.append(self._scale[j])
+                j = self._parent[j]
+            r = self._origin_radius
+            for s in reversed(scales):
+                r *= s
+            assert self.radius_of(i) == r, f"Vessel {i} has radius {self.radius_of(i)} cached, not {r}"
+            volume = sum(pi * self.radius_of(j) ** 2 * self.length_of(j) for j in self.descendants_of(i)) / r ** 2
+            assert abs(self._volume[i] - volume) <= 1e-9 * volume, \
+                f"Vessel {i} has volume {self._volume[i]} cached, not {volume}"
+
+    def _slot(self, j):
+        """Describe vessel j as a child of a junction for _junction_costs. """
+        terms = tuple(self._scale[c] * self._scale[c] * self._volume[c]
+                      for c in self._children[j].tolist() if c >= 0)
+        return self._num_terminals[j], self._k_res[j], terms, tuple(self._points[j].tolist())
+
+    def _junction_costs(self, g, path, slots, points):
+        """Find the cost of the tree for each of the given positions of a junction, without changing the tree.
+        The junction is the distal point of a vessel that takes the place of vessel path as a child of vessel g.
+        For each of the two children of the junction, slots gives the number of terminals, the resistance coefficient,
+        the volume terms s_c^2 * V_c of its own children and its distal point. This follows the same steps as rescale
+        and cost_of, but only along the path from the junction to the root, and for all the points at once.
+        :returns arrays of the costs, and of the radii and lengths of the junction vessel and its two children, with
+        a row for each point. The cost is inf wherever one of those vessels would have zero length.
+        """
+        xb, yb = points[:, 0], points[:, 1]
+        xg, yg = self._points[g].tolist()
+        dx, dy = xg - xb, yg - yb
+        lengths = [np.sqrt(dx * dx + dy * dy)]
+        volumes = []
+        for _, _, terms, (x, y) in slots:
+            dx, dy = xb - x, yb - y
+            length = np.sqrt(dx * dx + dy * dy)
+            v = pi * length
+            for term in terms:
+                v = v + term
+            lengths.append(length)
+            volumes.append(v)
+        (nt_0, k_0, _, _), (nt_1, k_1, _, _) = slots
+        with np.errstate(divide='ignore', invalid='ignore'):
+            s_0, s_1, k = self._murray(nt_0, k_0 + lengths[1], nt_1, k_1 + lengths[2])
+            v = pi * lengths[0] + s_0 * s_0 * volumes[0] + s_1 * s_1 * volumes[1]
+            n = nt_0 + nt_1
+            length = lengths[0]
+            # Walk up to the root, standing in the new values for the vessel on the path.
+            scales = []  # The new scaling factors of the vessels on the path, from the junction upwards.
+            child = path
+            node = g
+            while node != VesselTree.ORIGIN:
+                c0, c1 = self._children[node].tolist()
+                other = c1 if c0 == child else c0
+                res_other = self._k_res[other] + self.length_of(other)
+                if c0 == child:
+                    s_path, s_other, k = self._murray(n, k + length, self._num_terminals[other], res_other)
+                    length = self.length_of(node)
+                    v = pi * length + s_path * s_path * v + s_other * s_other * self._volume[other]
+                else:
+                    s_other, s_path, k = self._murray(self._num_terminals[other], res_other, n, k + length)
+                    length = self.length_of(node)
+                    v = pi * length + s_other * s_other * self._volume[other] + s_path * s_path * v
+                n = n + self._num_terminals[other]
+                scales.append(s_path)
+                child = node
+                node = self._parent[node]
+            # The root keeps its scaling factor. (If the junction replaced the root, it takes its place)
+            r = self._origin_radius * self._scale[child]
+            cost = float(r) * float(r) * v
+            r = np.full(len(points), r)
+            for s in reversed(scales):
+                r = r * s
+            radii = np.stack((r, r * s_0, r * s_1), axis=1)
+        lengths = np.stack(lengths, axis=1)
+        cost = np.where((lengths == 0).any(axis=1), inf, np.broadcast_to(cost, len(points)))
+        return cost, radii, lengths
+
+    def _best_junction(self, g, path, slots, points, triangle, refine):
+        """Find the cheapest of the given positions of a junction (see _junction_costs). Ties go to the first point.
+        With refine, a valid best point is then improved on by a few steps of the Nelder-Mead method, keeping the
+        junction valid and inside the triangle of its proximal point and the distal points of its children. (Otherwise
+        the cost can always be lowered by shrinking one of the vessels towards nothing)
+        :returns the cost, the point, and whether the vessels at the junction are at least as long as they are wide.
+        """
+        cost, radii, lengths = self._junction_costs(g, path, slots, points)
+        best = int(np.argmin(cost))
+        best_c, best_p = float(cost[best]), points[best]
+        valid = np.isfinite(cost[best]) and (radii[best] <= lengths[best]).all()
+        if refine and valid:
+            from scipy.optimize import minimize
+
+            # Search over the coordinates (u, v) of the point p + u * (q - p) + v * (r - p) of the triangle.
+            p, q, r = (np.array(tuple(x)) for x in triangle)
+            basis = np.stack((q - p, r - p), axis=1)
+
+            def to_point(uv):
+                return p + basis @ uv
+
+            def objective(uv):
+                if uv[0] < 0 or uv[1] < 0 or uv[0] + uv[1] > 1:
+                    return inf
+                c, rs, ls = self._junction_costs(g, path, slots, to_point(uv)[np.newaxis])
+                return c[0] if (rs[0] <= ls[0]).all() else inf
+
+            start = np.linalg.lstsq(basis, best_p - p, rcond=None)[0]
+            step = 1 / (VesselTree.INTERVALS - 1)  # The spacing of the sampled points.
+            simplex = np.array((start, start + (step, 0), start + (0, step)))
+            with np.errstate(invalid='ignore'):  # The points that aren't allowed cost inf.
+                result = minimize(objective, start, method='Nelder-Mead',
+                                  options=dict(maxiter=VesselTree.REFINE_ITERATIONS, initial_simplex=simplex))
+            if result.fun < best_c:
+                best_c, best_p = float(result.fun), to_point(result.x)
+        return best_c, tuple(best_p.tolist()), bool(valid)
+
+    def geometrically_optimise(self, i, refine=False) -> None:
+        """Choose the best proximal point for vessel i, which must have just been bifurcated. """
+        a = self.parent_of(i)
+        assert a != VesselTree.ORIGIN
+        b, c = self.children_of(a)
+        assert b == i
+        g = self.parent_of(a)
+        triangle = self.proximal_point_of(a), self.point_of(b), self.point_of(c)
+        # The current bifurcation point is kept unless one of the sampled points is cheaper.
+        points = np.vstack((self._points[a], PointSampleHeuristic(*triangle, VesselTree.INTERVALS).point_array))
+        _, best_p, _ = self._best_junction(g, a, (self._slot(b), self._slot(c)), points, triangle, refine)
+        self._move(a, best_p)
+        self.rescale(a)
+
+    def evaluate_bifurcation(self, i, terminal_point, refine=False) -> BifurcationEvaluation:
+        """Find the best bifurcation point on vessel i for connecting terminal_point to the tree, and the cost of the
+        resulting tree, without changing the tree. This gives the same result as bifurcate followed by
+        geometrically_optimise.
+        """
+        g = self._parent[i]
+        terminal_point = tuple(terminal_point)
+        triangle = self.point_of(g), self.point_of(i), Vec2D.from_tuple(terminal_point)
+        # bifurcate puts the bifurcation point half way along vessel i to start with.
+        midpoint = (self._points[g] + self._points[i]) * 0.5
+        points = np.vstack((midpoint, PointSampleHeuristic(*triangle, VesselTree.INTERVALS).point_array))
+        slots = self._slot(i), (1, 0.0, (), terminal_point)
+        cost, point, valid = self._best_junction(g, i, slots, points, triangle, refine)
+        return BifurcationEvaluation(cost, Vec2D.from_tuple(point), valid)
+
+    def copy(self) -> VesselTree:
+        """:returns an independent copy of the tree. """
+        t = VesselTree.__new__(VesselTree)
+        t._generation = self._generation
+        t._origin_radius = self._origin_radius
+        t._parent = self._parent.copy()
+        t._children = self._children.copy()
+        t._scale = self._scale.copy()
+        t._k_res = self._k_res.copy()
+        t._points = self._points.copy()
+        t._volume = self._volume.copy()
+        t._num_terminals = self._num_terminals.copy()
+        t._radius = self._radius.copy()
+        t._radius_generation = self._radius_generation.copy()
+        t._size = self._size
+        t._free = list(self._free)
+        t._init_journal()
+        t.views = weakref.WeakValueDictionary()
+        return t
+
+    def snapshot(self) -> VesselTreeSnapshot:
+        """:returns a copy of the tree as it is now, which costs almost nothing to take.
+        From the first snapshot on, the tree records the old values of each vessel in a journal when the vessel is
+        first changed after a snapshot. A snapshot is only filled in when it is first used, by taking the current
+        arrays and undoing the changes recorded since. The journal only keeps the changes made since the oldest
+        snapshot that hasn't been filled in yet (or thrown away), so the memory it takes is proportional to the number
+        of changes made since then, rather than to the number of snapshots times the size of the tree.
+        """
+        self._trim_journal()
+        if self._journal is None:
+            self._journal = []
+            self._journal_start = self._num_snapshots
+        s = VesselTreeSnapshot(self, self._num_snapshots)
+        self._snapshots[self._num_snapshots] = s
+        self._num_snapshots += 1
+        self._journal.append({})
+        return s
+
+    _ARRAYS = ('_parent', '_children', '_scale', '_k_res', '_points', '_volume', '_num_terminals', '_radius',
+               '_radius_generation')
+
+    def __getstate__(self):
+        # Pickle a compact snapshot for sending to other processes: the views belong to this process, and the unused
+        # capacity at the end of the arrays doesn't need to be sent.
+        # The journal is only needed for the snapshots of this tree.
+        arrays = {name: getattr(self, name)[:self._size] for name in VesselTree._ARRAYS}
+        state = self.__dict__.copy()
+        del state['views']
+        del state['_snapshots']
+        state['_journal'] = None
+        state.update(arrays)
+        return state
+
+    def __setstate__(self, state) -> None:
+        self.__dict__.update(state)
+        self._init_journal()
+        self.views = weakref.WeakValueDictionary()
+
+
+class VesselTreeSnapshot(VesselTree):
+    """The state of a VesselTree at the moment that its snapshot method was called.
+    Until one of its arrays is first used, a snapshot only holds on to the source tree. After that, it is an ordinary
+    tree that is independent of the source.
+    """
+
+    # The arrays that the journal records. The cached radii don't need to be recorded, as they can be recomputed.
+    _JOURNALLED = ('_parent', '_children', '_scale', '_k_res', '_points', '_volume', '_num_terminals')
+
+    def __init__(self, source: VesselTree, number) -> None:
+        # The arrays are not set here, so that using them calls __getattr__.
+        self._source = source
+        self._number = number  # The number of the snapshot, which is also the number of its dict in the journal.
+        self._generation = source._generation
+        self._origin_radius = source._origin_radius
+        self._size = source._size
+        self._free = list(source._free)
+        self._init_journal()
+        self.views = weakref.WeakValueDictionary()
+
+    def __getattr__(self, name):
+        # This is only called for attributes that aren't set, so the arrays are filled in when they are first used.
+        if name in VesselTree._ARRAYS and '_source' in self.__dict__:
+            self._materialise()
+            return getattr(self, name)
+        raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+
+    def _materialise(self) -> None:
+        source = self.__dict__.pop('_source')
+        n = self._size
+        for name in VesselTreeSnapshot._JOURNALLED:
+            setattr(self, name, getattr(source, name)[:n].copy())
+        # Undo the changes made since the snapshot, most recent first.
+        for changes in reversed(source._journal[self._number - source._journal_start:]):
+            for i, (parent, c0, c1, scale, k_res, x, y, volume, num_terminals) in changes.items():
+                if i < n:
+                    self._parent[i] = parent
+                    self._children[i] = (c0, c1)
+                    self._scale[i] = scale
+                    self._k_res[i] = k_res
+                    self._points[i] = (x, y)
+                    self._volume[i] = volume
+                    self._num_terminals[i] = num_terminals
+        self._radius = np.zeros(n)
+        self._radius_generation = np.full(n, -1, dtype=np.int64)
+        # This snapshot doesn't need the journal any more.
+        source._snapshots.pop(self._number, None)
+        source._trim_journal()
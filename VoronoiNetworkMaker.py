@@ -1,10 +1,11 @@
 import random
 from math import sqrt
 
+import numpy as np
 from scipy.spatial import Voronoi, voronoi_plot_2d
 import matplotlib.pyplot as plt
 
-from LinAlg import LineSegment, Vec2D
+from LinAlg import distances_to_segments
 
 
 def edge_length(e):
@@ -135,17 +136,11 @@ class VoronoiNetworkMaker:
         :returns the distance, and the vessel involved.
         """
         vessels = list(self.network_edges)
-        p = Vec2D.from_tuple(point)
-
-        def make_tuple(v):
-            # Contains the distance to the vessel, and the endpoints of the vessel.
-            a = Vec2D.from_tuple(v[0])
-            b = Vec2D.from_tuple(v[1])
-            s = LineSegment(a, b)
-            d = s.distance_to(p)
-            return d, v
-        # The distance to the nearest vessel.
-        return min(make_tuple(v) for v in vessels)
+        a, b = np.array(vessels, dtype=np.float64).transpose(1, 0, 2)
+        d = distances_to_segments(point, a, b)
+        # The distance to the nearest vessel. (Ties go to the smaller vessel, as with min)
+        m = d.min()
+        return float(m), min(vessels[j] for j in np.flatnonzero(d == m))
 
     def greatest_distance_from_vessel(self, interval, x_border, y_border):
         points = []
@@ -1,6 +1,7 @@
 import unittest
+from unittest import mock
 
-from BloodVessel import Origin, BloodVessel
+from BloodVessel import BaseBloodVessel, Origin, BloodVessel
 from LinAlg import Vec2D
 
 
@@ -143,6 +144,23 @@ class TestBloodVessel(unittest.TestCase):
         self.assertEqual(vp.distal_point, vb
                          .proximal_point)
 
+    def test_eq_of_the_same_vessel(self):
+        r = Origin(0.5, Vec2D(1.0, 2.0))
+        v1 = r.create_child(0.5, Vec2D(3.0, 4.0))
+        v2 = v1.create_child(0.25, Vec2D(3.5, 3.6))
+        v2.create_child(0.2, Vec2D(9.9, 8.8))
+        v1.create_child(0.3, Vec2D(4.5, 3.9))
+        walked = []
+        children = BaseBloodVessel.children
+        with mock.patch.object(BaseBloodVessel, 'children', property(lambda v: walked.append(v) or children.fget(v))):
+            # Comparing a vessel with itself doesn't walk the subtree.
+            self.assertTrue(v1 == v1)
+            self.assertTrue(r == r)
+            self.assertEqual(walked, [])
+            # Comparing it with a copy still does.
+            self.assertTrue(v1 == v1.copy_whole_tree())
+            self.assertGreater(len(walked), 0)
+
 
 if __name__ == '__main__':
     unittest.main()
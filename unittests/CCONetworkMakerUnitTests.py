@@ -0,0 +1,123 @@
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from BloodVessel import Origin
+from CCONetworkMaker import CCONetworkMaker
+from VascularDomain import CircularVascularDomain
+from LinAlg import LineSegment, Vec2D
+from SampleTrees import SEED, grow
+from VesselTree import VesselTree
+
+
+def final_tree(seed=SEED, iterations=12, **options):
+    _, (*_, tree) = grow(iterations, seed, **options)
+    return tree.tree
+
+
+def intersects_any(index, a, b, incident):
+    """Test the segment from a to b against every segment in the index, other than those in incident. """
+    s = LineSegment(Vec2D(*a), Vec2D(*b))
+    return any(s.intersects_with(LineSegment(Vec2D(*p), Vec2D(*q)))
+               for key, (p, q) in ((key, index.segment(key)) for key in index._segments) if key not in incident)
+
+
+def bifurcation_intersects(tree, j, xb, xd):
+    """Bifurcate vessel j of a copy of the tree at xb to reach xd, and test if any of the three vessels involved
+    intersects a vessel that isn't incident to it, by checking them against every vessel as the original maker did.
+    """
+    origin = Origin.from_tree(tree.copy())
+    vj = origin.vessel(j)
+    vj.bifurcate(Vec2D(*xd), Vec2D(*xb))
+    for v in vj.parent.children + [vj.parent]:
+        # Only these vessels are allowed to intersect with v. (self, parent, siblings and children)
+        incident_vessels = [v.parent] + v.parent.children + v.children
+        for w in origin.descendants:
+            if w not in incident_vessels and v.line_seg.intersects_with(w.line_seg):
+                return True
+    return False
+
+
+def same_tree(t1, t2):
+    return list(t1.descendants_of(VesselTree.ORIGIN)) == list(t2.descendants_of(VesselTree.ORIGIN)) \
+        and (t1.points == t2.points).all() and t1.cost_of(VesselTree.ORIGIN) == t2.cost_of(VesselTree.ORIGIN)
+
+
+class TestCCONetworkMaker(unittest.TestCase):
+
+    def test_seed(self):
+        t1, t2, t3 = final_tree(), final_tree(), final_tree(SEED + 1)
+        self.assertTrue(same_tree(t1, t2))
+        self.assertNotEqual(t1.cost_of(VesselTree.ORIGIN), t3.cost_of(VesselTree.ORIGIN))
+
+    def test_terminals_inside_domain(self):
+        t = final_tree()
+        domain = CircularVascularDomain(400)
+        terminals = [i for i in t.descendants_of(t.root) if t.is_terminal(i)]
+        self.assertEqual(len(terminals), t.num_terminals_of(VesselTree.ORIGIN))
+        self.assertTrue(domain.contains_many(t.points[terminals]).all())
+
+    def test_loose_bounds_change_nothing(self):
+        # A bound that takes in every vessel grows the same tree as the unbounded search.
+        t = final_tree()
+        self.assertTrue(same_tree(final_tree(max_candidates=1000), t))
+        self.assertTrue(same_tree(final_tree(candidate_radius=1e6), t))
+        self.assertTrue(same_tree(final_tree(max_candidates=1000, candidate_radius=1e6), t))
+
+    def test_audit(self):
+        m, trees = grow(20, max_candidates=1, audit_candidates=True)
+        # Auditing doesn't change the tree that is grown, it only records how often the bound misses the best vessel.
+        self.assertTrue(same_tree(trees[-1].tree, final_tree(iterations=20, max_candidates=1)))
+        self.assertGreater(m.bound_misses, 0)
+        self.assertEqual(len(m.iter_num_with_depth), 19)
+        self.assertGreaterEqual(sum(1 for _, depth in m.iter_num_with_depth if depth > 0), m.bound_misses)
+        m, _ = grow(20, audit_candidates=True)
+        self.assertEqual(m.bound_misses, 0)
+
+    def test_empty_radius_falls_back(self):
+        # With no vessels inside the radius, the nearest vessel that can be bifurcated is used, as with a bound of one.
+        m, trees = grow(15, candidate_radius=1e-9)
+        t = trees[-1].tree
+        self.assertEqual(t.num_terminals_of(VesselTree.ORIGIN), 15)
+        self.assertTrue(same_tree(t, final_tree(iterations=15, max_candidates=1)))
+
+    def test_workers(self):
+        # Make sure that the candidates really are scored in the workers, even in a small tree.
+        with mock.patch.object(CCONetworkMaker, "MIN_PARALLEL_CANDIDATES", 1):
+            m, trees = grow(15, workers=2)
+            parallel = trees[-1].tree
+            _, audited = grow(15, workers=2, max_candidates=2, audit_candidates=True)
+        self.assertTrue(same_tree(parallel, final_tree(iterations=15)))
+        self.assertTrue(same_tree(audited[-1].tree, final_tree(iterations=15, max_candidates=2)))
+        self.assertIsNone(m._block)  # The shared memory has been released.
+
+    def test_intersections(self):
+        m, _ = grow(25)
+        keys = list(m._index._segments)
+        rng = np.random.default_rng(SEED)
+        # Only the segments with overlapping bounding boxes are tested, which finds the same as testing them all.
+        hits = 0
+        for a, b in rng.uniform(0.0, 800.0, size=(300, 2, 2)).tolist():
+            incident = set(rng.choice(keys, 2).tolist())
+            expected = intersects_any(m._index, a, b, incident)
+            self.assertEqual(m._intersects_tree(tuple(a), tuple(b), incident), expected)
+            hits += expected
+        self.assertTrue(0 < hits < 300)
+        # Testing the new vessels of a bifurcation against the nearby vessels in the index, and stopping at the first
+        # one that intersects something, gives the same answer as bifurcating and testing against every vessel.
+        tree = m._origin.tree
+        hits = 0
+        for j in tree.descendants_of(tree.root):
+            g = tree.parent_of(j)
+            for xd in rng.uniform(0.0, 800.0, size=(5, 2)).tolist():
+                xd = tuple(xd)
+                xb = tuple(((tree.points[g] + tree.points[j] + np.array(xd)) / 3).tolist())
+                expected = bifurcation_intersects(tree, j, xb, xd)
+                self.assertEqual(m._bifurcation_intersects(j, xb, xd), expected)
+                hits += expected
+        self.assertTrue(0 < hits < 5 * len(list(tree.descendants_of(tree.root))))
+
+
+if __name__ == '__main__':
+    unittest.main()
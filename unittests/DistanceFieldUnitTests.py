@@ -0,0 +1,60 @@
+import unittest
+
+from BloodVessel import Origin
+from DistanceField import DistanceField
+from LinAlg import LineSegment, Vec2D
+from SampleTrees import grow
+
+
+class TestDistanceField(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.maker, (*_, cls.tree) = grow(15)
+
+    def test_matches_point_by_point(self):
+        tree = self.tree
+        ends = [(tuple(v.proximal_point), tuple(v.distal_point)) for v in tree.descendants]
+        terminals = [v.distal_point for v in tree.descendants if len(v.children) == 0]
+        radius = 150.0
+        points = list(self.maker.domain.point_grid(30))
+        DistanceField.CHUNK = 100  # Make sure that the points are measured in several chunks.
+        try:
+            field = DistanceField(tree, points, radius)
+        finally:
+            DistanceField.CHUNK = 1 << 20
+        self.assertEqual(len(field), len(points))
+        for k, p in enumerate(points):
+            d, v = min((LineSegment(Vec2D(*a), Vec2D(*b)).distance_to(p), (a, b)) for a, b in ends)
+            self.assertEqual(field.nearest_vessel(k), (d, v))
+            lengths = [LineSegment(p, t).length for t in terminals]
+            d, t = field.nearest_terminal(k)
+            self.assertAlmostEqual(d, min(lengths))
+            self.assertEqual(t, terminals[lengths.index(min(lengths))])
+            self.assertEqual(field.blackbox_counts[k], sum(1 for x in lengths if x <= radius))
+
+    def test_greatest_distances(self):
+        m, tree = self.maker, self.tree
+        field = m.distance_field(tree, 30)
+        d, v, p = field.greatest_distance_from_vessel()
+        self.assertEqual(d, field.vessel_distances.max())
+        self.assertEqual((d, v), m.distance_from_vessel(tree, p))
+        d, t, p = field.greatest_distance_from_terminal()
+        self.assertEqual(d, field.terminal_distances.max())
+        self.assertEqual((d, t), m.distance_from_terminal(tree, p))
+        self.assertEqual([n for _, n in m.count_blackboxes(tree, 30)], field.blackbox_counts.tolist())
+
+    def test_greatest_distance_ties(self):
+        # Ties go to the larger point, as taking the max of the tuples would, wherever the point is in the list.
+        origin = Origin(1.0, Vec2D(0.0, 0.0))
+        origin.create_child(1.0, Vec2D(10.0, 0.0))
+        for points in ([(5.0, -3.0), (5.0, 3.0)], [(5.0, 3.0), (5.0, -3.0)]):
+            d, v, p = DistanceField(origin, [Vec2D(*q) for q in points]).greatest_distance_from_vessel()
+            self.assertEqual((d, v, p), (3.0, ((0.0, 0.0), (10.0, 0.0)), Vec2D(5.0, 3.0)))
+        for points in ([(10.0, -5.0), (10.0, 5.0)], [(10.0, 5.0), (10.0, -5.0)]):
+            d, t, p = DistanceField(origin, [Vec2D(*q) for q in points]).greatest_distance_from_terminal()
+            self.assertEqual((d, t, p), (5.0, Vec2D(10.0, 0.0), Vec2D(10.0, 5.0)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import math
+import unittest
+
+import numpy as np
+
+import DistanceTransform as distance_transform_module
+from DistanceTransform import distance_transform
+
+
+def brute_force(mask, distance):
+    sources = list(zip(*np.nonzero(mask)))
+    return np.array([[min(distance(i - a, j - b) for a, b in sources) for j in range(mask.shape[1])]
+                     for i in range(mask.shape[0])])
+
+
+class TestDistanceTransform(unittest.TestCase):
+
+    def test_matches_brute_force(self):
+        rng = np.random.default_rng(1637682164)
+        for shape, density in (((1, 1), 1.0), ((7, 13), 0.05), ((20, 20), 0.2), ((30, 11), 0.01)):
+            mask = rng.random(shape) < density
+            mask[rng.integers(shape[0]), rng.integers(shape[1])] = True
+            for metric, distance in (("manhattan", lambda di, dj: abs(di) + abs(dj)), ("euclidean", math.hypot)):
+                distances, (i, j) = distance_transform(mask, metric)
+                expected = brute_force(mask, distance)
+                self.assertEqual(distances.shape, mask.shape)
+                self.assertTrue(np.allclose(distances, expected))
+                self.assertEqual(distances[i, j], distances.max())
+                self.assertEqual((i, j), np.unravel_index(np.argmax(expected), expected.shape))
+        self.assertEqual(distance_transform(mask)[0].dtype, np.int64)
+
+    def test_euclidean_without_scipy(self):
+        rng = np.random.default_rng(1637682167)
+        edt = distance_transform_module.distance_transform_edt
+        distance_transform_module.distance_transform_edt = None
+        try:
+            for shape, density in (((1, 1), 1.0), ((9, 4), 0.1), ((25, 40), 0.02)):
+                mask = rng.random(shape) < density
+                mask[rng.integers(shape[0]), rng.integers(shape[1])] = True
+                distances, (i, j) = distance_transform(mask, "euclidean")
+                expected = brute_force(mask, math.hypot)
+                self.assertTrue(np.allclose(distances, expected))
+                self.assertEqual((i, j), np.unravel_index(np.argmax(expected), expected.shape))
+        finally:
+            distance_transform_module.distance_transform_edt = edt
+
+    def test_bad_arguments(self):
+        with self.assertRaises(ValueError):
+            distance_transform([[True, False]], "chebyshev")
+        with self.assertRaises(AssertionError):
+            distance_transform([[False, False]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import random
+import unittest
+
+from GrowthLog import GrowthLog
+from LinAlg import Vec2D
+from SampleTrees import SEED, grow
+from VesselTree import VesselTree
+
+
+class TestGrowthLog(unittest.TestCase):
+
+    def test_replay(self):
+        random.seed(SEED)
+        m, trees = grow(25)
+        trees = [tr.tree for tr in trees]
+        log = m.growth_log
+        log.checkpoint_interval = 4
+        self.assertEqual(len(log), len(trees))
+        self.assertEqual(len(log.events), len(trees) - 1)
+        order = list(range(len(trees)))
+        random.shuffle(order)
+        for i in order:
+            t, r = trees[i], log.tree_at(i)
+            # The replayed tree is exactly the same as the one that was grown.
+            self.assertEqual(list(r.descendants_of(VesselTree.ORIGIN)), list(t.descendants_of(VesselTree.ORIGIN)))
+            self.assertTrue((r.points == t.points).all())
+            self.assertTrue((r.scaling_factors == t.scaling_factors).all())
+            self.assertEqual(r.cost_of(VesselTree.ORIGIN), t.cost_of(VesselTree.ORIGIN))
+
+    def test_checkpoints_are_bounded(self):
+        log = GrowthLog(1.0, Vec2D(0.0, 0.0), Vec2D(100.0, 0.0), checkpoint_interval=3, max_checkpoints=4)
+        for i in range(60):
+            log.record(1, Vec2D(float(i), 10.0 + i), Vec2D(50.0 + i / 100.0, 1.0))
+        expected = [log.tree_at(i).cost_of(VesselTree.ORIGIN) for i in range(len(log))]
+        self.assertLessEqual(len(log._checkpoints), 4)
+        # Going back over the history any number of times keeps the checkpoints bounded, and rebuilds the same trees.
+        random.seed(SEED)
+        order = list(range(len(log))) * 3
+        random.shuffle(order)
+        for i in order:
+            self.assertEqual(log.tree_at(i).cost_of(VesselTree.ORIGIN), expected[i])
+            self.assertLessEqual(len(log._checkpoints), 4)
+            self.assertTrue(all(k % 3 == 0 for k in log._checkpoints))
+        # Rebuilding a tree starts from the checkpoint before it, if there is one.
+        log.tree_at(40)
+        self.assertIn(39, log._checkpoints)
+
+    def test_replayed_trees_are_independent(self):
+        log = GrowthLog(1.0, Vec2D(0.0, 0.0), Vec2D(10.0, 0.0), checkpoint_interval=2)
+        log.record(1, Vec2D(5.0, 5.0), Vec2D(5.0, 1.0))
+        log.record(1, Vec2D(9.0, -3.0), Vec2D(8.0, -1.0))
+        t = log.tree_at(2)
+        self.assertEqual(t.num_terminals_of(VesselTree.ORIGIN), 3)
+        t.bifurcate(1, Vec2D(1.0, 1.0))
+        self.assertEqual(log.tree_at(2).num_terminals_of(VesselTree.ORIGIN), 3)
+        self.assertEqual(log.tree_at(0).num_terminals_of(VesselTree.ORIGIN), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,264 @@
+import random
+import unittest
+from queue import LifoQueue
+
+import numpy as np
+
+from InvasionPercolationNetwork import InvasionPercolationNetwork
+from utils import concat
+
+
+def dense_flows_and_pressures(net):
+    """The original dense version of compute_pressures, which solves for the flows and the pressures together. It
+    takes O((E+C)^3) time, so it's only used to check the sparse version against.
+    :returns the list of (edge, flow) pairs, and the list of (cell, pressure) pairs of the reached cells.
+    """
+    # By convention, "towards the bottom left corner" is the positive direction.
+    R = 1   # The resistance of a vessel.
+    cells = tuple(c for c in concat(net.cells) if c.is_reached)
+    edges = tuple(net.edges)
+    start = net.top_left
+    end = net.bottom_right
+    cell_indices = {c: i for i, c in enumerate(cells)}  # To quickly look up the index of a cell.
+    edge_indices = {e: i for i, e in enumerate(edges)}  # To quickly look up the index of an edge.
+    matrix = []
+    result = []
+    q_num = len(edges)  # There is a variable for every line segment.
+    p_num = len(cells)  # There is a variable for every cell.
+
+    def q(e): return edge_indices[e]
+
+    def p(c): return q_num + cell_indices[c]
+
+    def minmax(e):
+        a = e.a
+        b = e.b
+        return (a, b) if cell_indices[a] < cell_indices[b] else (b, a)
+
+    for c in cells:
+        # At each cell, we need the input and output flows to add to 0.
+        if c is start:  # We don't count the start cell. This ensures that our matrix is full rank.
+            continue
+        result.append((0 if c is not end else 1,))  # Only the endpoint is allowed to have flow exit the system.
+
+        this_row = [0 for _ in range(q_num + p_num)]
+        for e in c.edges:
+            a, b = minmax(e)
+            assert (a is c or b is c) and (a is not c or b is not c)
+            this_row[q(e)] = 1 if b is c else -1
+        matrix.append(this_row)
+
+    for e in edges:
+        result.append((0,))
+        this_row = [0 for _ in range(q_num + p_num)]
+        # At each edge, we want the pressure drop to equal the resistance (1) times the flow.
+        a, b = minmax(e)
+        this_row[p(a)] = 1
+        this_row[p(b)] = -1
+        this_row[q(e)] = -R
+        matrix.append(this_row)
+
+    # A final row to fix the output pressure at 0.
+    this_row = [0 for _ in range(q_num + p_num)]
+    this_row[p(end)] = 1
+    matrix.append(this_row)
+    result.append((0,))
+
+    pressures_flows = np.linalg.solve(np.array(matrix), np.array(result))
+    return [(e, pressures_flows[q(e), 0]) for e in edges], [(c, pressures_flows[p(c), 0]) for c in cells]
+
+
+def remove_dead_ends_by_search(net):
+    """The original version of remove_dead_ends, which searches the network from both ends of every edge. It takes
+    O(V*E) time, so it's only used to check the faster version against.
+    """
+    source = net.top_left
+    sink = net.bottom_right
+    adj = net.adjacency_list
+    deleted = {e: False for e in net.edges}
+    nodes_deleted = {c: False for c in concat(net.cells)}
+
+    def can_find(start, no_visit):
+        # Can we find the source or the sink without ever visiting the node no_visit?
+        s = LifoQueue()
+        discovered = {c: False for c in concat(net.cells)}
+        discovered[start] = True
+        s.put(start)
+        while not s.empty():
+            u = s.get()
+            if u is source or u is sink:
+                return True
+            for v in adj[u]:
+                if v is not no_visit and not discovered[v]:
+                    discovered[v] = True
+                    s.put(v)
+        return False
+
+    def delete_scc_conditional(start, no_visit):
+        if not can_find(start, no_visit):
+            s = LifoQueue()
+            nodes_deleted[start] = True
+            s.put(start)
+            while not s.empty():
+                u = s.get()
+                for v in adj[u]:
+                    if v is not no_visit and not nodes_deleted[v]:
+                        nodes_deleted[v] = True
+                        s.put(v)
+
+    for e in net.edges:
+        if not deleted[e]:
+            delete_scc_conditional(e.a, e.b)
+            delete_scc_conditional(e.b, e.a)
+    # Return the nodes and the edges.
+    return [v for v in concat(net.cells) if v.is_reached and not nodes_deleted[v]], \
+           [e for e in net.edges if not nodes_deleted[e.a] and not nodes_deleted[e.b]]
+
+
+class TestInvasionPercolationNetwork(unittest.TestCase):
+
+    def test_growth(self):
+        random.seed(1637682157)
+        net = InvasionPercolationNetwork(12, 12, 0.45)
+        cells = concat(net.cells)
+        reached = sorted((c for c in cells if c.is_reached), key=lambda c: c.reached)
+        self.assertEqual([c.reached for c in reached], list(range(net.n + 1)))
+        self.assertEqual(reached[0].indices, (6, 6))
+        # Each cell that is reached has the least capacity of the cells that have been discovered but not reached.
+        for t, c in enumerate(reached[1:], 1):
+            frontier = [d for d in cells if 0 <= d.discovered < t and not 0 <= d.reached < t]
+            self.assertIs(min(frontier), c)
+        # There is an edge between each pair of neighbouring reached cells, from the later one to the earlier one.
+        expected = {(a.indices, b.indices) for a in reached for b in net._get_cell_neighbours(a)
+                    if b.is_reached and b.reached < a.reached}
+        self.assertEqual({(e.a.indices, e.b.indices) for e in net.edges}, expected)
+        self.assertEqual(len(net.edges), len(expected))
+        for c in cells:
+            self.assertTrue(all(e.touches(c) for e in c.edges))
+            self.assertEqual(c.is_discovered, c.is_reached or any(d.is_reached for d in net._get_cell_neighbours(c)))
+
+    def test_sparse_pressures_match_dense(self):
+        random.seed(1637682158)
+        for size, occupancy in ((8, 0.4), (15, 0.3), (20, 0.5)):
+            net = InvasionPercolationNetwork(size, size, occupancy)
+            dense_flows, dense_pressures = dense_flows_and_pressures(net)
+            for solver in ("spsolve", "cg"):
+                flows, pressures = net.compute_pressures(solver=solver)
+                self.assertEqual([e for e, _ in flows], [e for e, _ in dense_flows])
+                self.assertEqual([c for c, _ in pressures], [c for c, _ in dense_pressures])
+                for (_, q1), (_, q2) in zip(flows, dense_flows):
+                    self.assertAlmostEqual(q1, q2, places=9)
+                for (_, p1), (_, p2) in zip(pressures, dense_pressures):
+                    self.assertAlmostEqual(p1, p2, places=9)
+
+    def test_conservation(self):
+        random.seed(1637682159)
+        net = InvasionPercolationNetwork(40, 40, 0.3)
+        flows, pressures = net.compute_pressures()
+        start, end = net.top_left, net.bottom_right
+        pressure = dict(pressures)
+        self.assertEqual(pressure[end], 0.0)
+        # The net flow out of each cell is 1 at the start, -1 at the end and 0 everywhere else.
+        index = {c: i for i, (c, _) in enumerate(pressures)}
+        out = {c: 0.0 for c in pressure}
+        for e, q in flows:
+            a, b = (e.a, e.b) if index[e.a] < index[e.b] else (e.b, e.a)
+            out[a] += q
+            out[b] -= q
+        for c, q in out.items():
+            self.assertAlmostEqual(q, 1.0 if c is start else -1.0 if c is end else 0.0)
+
+    def test_leaky(self):
+        random.seed(1637682160)
+        net = InvasionPercolationNetwork(30, 30, 0.4)
+        # Without any leak, the model is the same as the one that isn't leaky.
+        flows, pressures = net.compute_pressures(leaky=True, leak=0.0)
+        self.assertEqual(flows, net.compute_pressures()[0])
+        self.assertEqual(pressures, net.compute_pressures()[1])
+        flows, pressures = net.compute_pressures(leaky=True, leak=0.05, solver="cg")
+        start, end = net.top_left, net.bottom_right
+        # The flow out of each cell along the edges and into the tissue adds up to the flow into the network.
+        index = {c: i for i, (c, _) in enumerate(pressures)}
+        out = {c: 0.05 * p for c, p in pressures}
+        for e, q in flows:
+            a, b = (e.a, e.b) if index[e.a] < index[e.b] else (e.b, e.a)
+            out[a] += q
+            out[b] -= q
+        for c, q in out.items():
+            if c is not end:
+                self.assertAlmostEqual(q, 1.0 if c is start else 0.0)
+
+    def test_sweep_leaks(self):
+        random.seed(1637682161)
+        net = InvasionPercolationNetwork(25, 25, 0.4)
+        leaks = (0.0, 0.01, 0.1, 1.0)
+        cells, edges, pressures, flows = net.sweep_leaks(leaks)
+        self.assertEqual(pressures.shape, (len(leaks), len(cells)))
+        self.assertEqual(flows.shape, (len(leaks), len(edges)))
+        self.assertEqual([tuple(c) for c in cells], [c.indices for c, _ in net.compute_pressures()[1]])
+        for k, leak in enumerate(leaks):
+            f, p = net.compute_pressures(leaky=True, leak=leak)
+            self.assertEqual([q for _, q in f], flows[k].tolist())
+            self.assertEqual([x for _, x in p], pressures[k].tolist())
+        # The more that leaks out, the less pressure is needed to drive the flow.
+        start = cells.tolist().index(list(net.top_left.indices))
+        self.assertTrue((pressures[1:, start] < pressures[:-1, start]).all())
+
+    def test_remove_dead_ends_matches_search(self):
+        random.seed(1637682162)
+        for _ in range(40):
+            size = random.randint(2, 20)
+            net = InvasionPercolationNetwork(size, size, random.uniform(0.2, 0.7))
+            if net._find_corner(top_left=True) is None or net._find_corner(top_left=False) is None:
+                continue  # The corners are only searched for on one side of the diagonal.
+            self.assertEqual(net.remove_dead_ends(), remove_dead_ends_by_search(net))
+
+    def test_remove_dead_ends(self):
+        random.seed(1637682163)
+        net = InvasionPercolationNetwork(30, 30, 0.5)
+        cells, edges = net.remove_dead_ends()
+        self.assertIn(net.top_left, cells)
+        self.assertIn(net.bottom_right, cells)
+        self.assertLess(len(cells), len([c for c in concat(net.cells) if c.is_reached]))
+        # Without the dead ends, every cell other than the top left and bottom right has at least two edges.
+        degree = {c: 0 for c in cells}
+        for e in edges:
+            degree[e.a] += 1
+            degree[e.b] += 1
+        for c in cells:
+            if c is not net.top_left and c is not net.bottom_right:
+                self.assertGreaterEqual(degree[c], 2)
+
+    def test_distances(self):
+        random.seed(1637682165)
+        net = InvasionPercolationNetwork(20, 20, 0.3)
+        reached = [c for c in concat(net.cells) if c.is_reached]
+        distances = net.compute_manhattan_distances(lambda c: c.is_reached)
+        for c in concat(net.cells):
+            self.assertEqual(distances[c.i][c.j], min(abs(c.i - d.i) + abs(c.j - d.j) for d in reached))
+        self.assertEqual(net.compute_manhattan_distances(lambda c: False), [[None] * 20] * 20)
+        d, c = net.find_most_distant_point(net.cells)
+        self.assertFalse(c.is_reached)
+        self.assertEqual(d, max(concat(distances)))
+        self.assertEqual(d, distances[c.i][c.j])
+
+    def test_most_distant_point_of_other_cells(self):
+        # Everything should come from the cells that are passed in, even when they aren't the network's own cells.
+        random.seed(1637682166)
+        net = InvasionPercolationNetwork(20, 20, 0.3)
+        other = InvasionPercolationNetwork(20, 20, 0.3)
+        d, c = net.find_most_distant_point(other.cells)
+        self.assertIs(c, other.cells[c.i][c.j])
+        self.assertEqual((d, c), other.find_most_distant_point(other.cells))
+        reached = [e for e in concat(other.cells) if e.is_reached]
+        furthest = [e for e in concat(other.cells)
+                    if min(abs(e.i - r.i) + abs(e.j - r.j) for r in reached) == d]
+        self.assertIs(c, max(furthest, key=lambda e: e.c))
+        with self.assertRaises(AssertionError):
+            net.find_most_distant_point(InvasionPercolationNetwork(10, 10, 0.3).cells)
+        with self.assertRaises(AssertionError):
+            net.find_most_distant_point([row[:-1] for row in other.cells])
+
+
+if __name__ == '__main__':
+    unittest.main()
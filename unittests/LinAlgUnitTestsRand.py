@@ -4,7 +4,7 @@ import unittest
 
 import numpy as np
 
-from LinAlg import Vec2D, parallel, LineSegment
+from LinAlg import Vec2D, Vec2DArray, parallel, LineSegment, distances_to_segments, segments_intersect
 
 
 def rn(): return random.uniform(0.0, 100.0)
@@ -107,6 +107,43 @@ class TestVec2D(unittest.TestCase):
             # TODO: Better tolerance value
             self.assertLess(abs(res), TOL)
 
+    def test_hash_rand(self):
+        for x, y in points:
+            v1 = Vec2D(x, y)
+            v2 = Vec2D.from_array(np.array((x, y)))
+            self.assertEqual(hash(v1), hash(v2))
+            self.assertEqual({v1: 1}[v2], 1)
+
+    def test_neg_rand(self):
+        for x, y in points:
+            v = Vec2D(x, y)
+            self.assertEqual(-v, Vec2D(-x, -y))
+            self.assertEqual(v + -v, Vec2D(0.0, 0.0))
+
+    def test_array_rand(self):
+        for x, y in points:
+            v = Vec2D(x, y)
+            self.assertTrue((np.array(v) == (x, y)).all())
+            self.assertTrue((v.arr == (x, y)).all())
+            # Multiplying by a NumPy scalar still gives a vector.
+            self.assertEqual(np.float64(2.0) * v, v * 2.0)
+
+
+class TestVec2DArray(unittest.TestCase):
+
+    def test_round_trip_rand(self):
+        batch = Vec2DArray.from_vectors(vecs)
+        self.assertEqual(len(batch), len(vecs))
+        self.assertEqual(list(batch), vecs)
+        self.assertEqual(batch[7], vecs[7])
+        self.assertTrue((batch.x == [v.x for v in vecs]).all())
+        self.assertTrue((batch.y == [v.y for v in vecs]).all())
+
+    def test_norms_rand(self):
+        batch = Vec2DArray.from_vectors(vecs)
+        for n, v in zip(batch.norms(), vecs):
+            self.assertEqual(n, abs(v))
+
 
 class TestLineSegment(unittest.TestCase):
 
@@ -115,7 +152,15 @@ class TestLineSegment(unittest.TestCase):
             seg = LineSegment(v1, v2)
             v3 = v2 - v1
             length = math.sqrt(v3.x ** 2 + v3.y ** 2)
-            self.assertEqual(seg.length, length)
+            # x ** 2 and x * x can round differently, and length multiplies the squares out.
+            self.assertAlmostEqual(seg.length, length)
+
+    def test_length_matches_arrays_rand(self):
+        # The lengths agree exactly with the array versions.
+        a, b = np.array(vecs), np.array(vecs2)
+        lengths = [LineSegment(v1, v2).length for v1, v2 in zip(vecs, vecs2)]
+        self.assertEqual(lengths, Vec2DArray(b - a).norms().tolist())
+        self.assertEqual(lengths, distances_to_segments(b, a, a).tolist())
 
     def test_vector_rand(self):
         for v1, v2 in zip(vecs, vecs2):
@@ -156,5 +201,31 @@ class TestLineSegment(unittest.TestCase):
             self.assertLess(abs(seg.distance_to(v) - d), TOL)
 
 
+class TestBatchedKernels(unittest.TestCase):
+
+    def test_distances_to_segments_rand(self):
+        ps = np.array(points[:500])
+        a = np.array([tuple(v) for v in vecs])
+        b = np.array([tuple(v) for v in vecs2])
+        # Including segments of length zero.
+        b[::50] = a[::50]
+        expected = [LineSegment(Vec2D(*s), Vec2D(*e)).distance_to(Vec2D(*p)) for p, s, e in zip(ps, a, b)]
+        self.assertEqual(distances_to_segments(ps, a, b).tolist(), expected)
+        # A single point against every segment.
+        expected = [LineSegment(Vec2D(*s), Vec2D(*e)).distance_to(vecs[0]) for s, e in zip(a, b)]
+        self.assertEqual(distances_to_segments(tuple(vecs[0]), a, b).tolist(), expected)
+
+    def test_segments_intersect_rand(self):
+        # Points on a small grid give plenty of collinear and touching segments.
+        ends = np.array([[(random.randint(0, 4), random.randint(0, 4)) for _ in range(4)] for _ in range(2000)],
+                        dtype=np.float64)
+        ends = np.concatenate((ends, np.array([[p1, p2, p1, p2] for p1, p2 in zip(points, points2)])))
+        segs = [[Vec2D(*p) for p in e] for e in ends]
+        expected = [LineSegment(p1, q1).intersects_with(LineSegment(p2, q2)) for p1, q1, p2, q2 in segs]
+        result = segments_intersect(ends[:, 0], ends[:, 1], ends[:, 2], ends[:, 3])
+        self.assertEqual(result.tolist(), expected)
+        self.assertTrue(any(expected) and not all(expected))
+
+
 if __name__ == '__main__':
     unittest.main()
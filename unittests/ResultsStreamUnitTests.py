@@ -0,0 +1,59 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from ResultsStream import ResultsReader, ResultsWriter
+from SampleTrees import make_maker
+
+
+def expected_table(tree):
+    """The values that used to be written to each results file, worked out one vessel at a time. """
+    vessels = list(tree.descendants)
+    names = {v.index: k for k, v in enumerate(vessels)}
+    return {
+        "id": [names[v.index] for v in vessels],
+        "proximal point": [tuple(v.proximal_point) for v in vessels],
+        "distal point": [tuple(v.distal_point) for v in vessels],
+        "length": [v.length for v in vessels],
+        "radius": [v.radius for v in vessels],
+        "scaling factor": [v.scaling_factor for v in vessels],
+        "resistance constant": [v.resistance_coefficient for v in vessels],
+        "resistance": [v.resistance for v in vessels],
+        "pressure drop": [v.resistance * v.num_terminals for v in vessels],
+        "parent": [names[v.parent.index] if v.parent is not tree else -1 for v in vessels],
+        "number of terminals": [v.num_terminals for v in vessels],
+        "left child": [names[v.children[0].index] if len(v.children) > 0 else -1 for v in vessels],
+        "right child": [names[v.children[1].index] if len(v.children) > 0 else -1 for v in vessels],
+    }
+
+
+class TestResultsStream(unittest.TestCase):
+
+    def test_round_trip(self):
+        m = make_maker()
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "results.npys")
+            trees = []
+            with ResultsWriter(path, checkpoint_interval=4) as results:
+                for tree in m.generate_trees(15):
+                    trees.append(tree)
+                    results.write(tree.tree)
+            reader = ResultsReader(path)
+            self.assertEqual(len(reader), len(trees))
+            for i in reversed(range(len(trees))):
+                table = reader.table(i)
+                for column, values in expected_table(trees[i]).items():
+                    if column in ("resistance", "pressure drop"):
+                        # radius ** 4 doesn't always round the same way in Python and NumPy.
+                        self.assertTrue(np.allclose(table[column], values, rtol=1e-12, atol=0), column)
+                    else:
+                        self.assertEqual([tuple(x) if np.ndim(x) else x for x in table[column].tolist()],
+                                         values, column)
+            # Only the changes are stored between the checkpoints.
+            self.assertLess(len(reader._rows[-1]), len(trees[-1].tree.points))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,19 @@
+from CCONetworkMaker import CCONetworkMaker
+from LinAlg import Vec2D
+from VascularDomain import CircularVascularDomain
+
+# The trees that the tests grow all come from the same maker and seed, unless a test needs different trees.
+SEED = 1637682146
+
+
+def make_maker(seed=SEED, **options) -> CCONetworkMaker:
+    """:returns a CCONetworkMaker for a circular domain, with the origin on its edge. """
+    return CCONetworkMaker(20.0, Vec2D(400, 0), None, CircularVascularDomain(400), seed=seed, **options)
+
+
+def grow(iterations, seed=SEED, **options):
+    """Grow a tree with a maker from make_maker.
+    :returns the maker, and the tree after each iteration.
+    """
+    m = make_maker(seed, **options)
+    return m, list(m.generate_trees(iterations))
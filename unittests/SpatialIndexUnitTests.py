@@ -0,0 +1,76 @@
+import random
+import unittest
+
+import numpy as np
+
+from LinAlg import LineSegment, Vec2D
+from SpatialIndex import SegmentGrid
+
+
+def rn(): return random.uniform(0.0, 100.0)
+
+
+random.seed(1637682142)
+
+segments = {i: (Vec2D(rn(), rn()), Vec2D(rn(), rn())) for i in range(200)}
+points = [Vec2D(rn(), rn()) for _ in range(100)]
+
+
+def make_grid():
+    grid = SegmentGrid(7.5)
+    for key, (a, b) in segments.items():
+        grid.insert(key, a, b)
+    return grid
+
+
+def brute_force(p):
+    return sorted((LineSegment(a, b).distance_to(p), key) for key, (a, b) in segments.items())
+
+
+class TestSegmentGrid(unittest.TestCase):
+
+    def test_nearest(self):
+        grid = make_grid()
+        for p in points:
+            expected = brute_force(p)
+            for k in (1, 5, 20):
+                found = grid.nearest(p, k)
+                self.assertEqual([key for _, key in found], [key for _, key in expected[:k]])
+                for (d1, _), (d2, _) in zip(found, expected):
+                    self.assertAlmostEqual(d1, d2)
+            self.assertEqual(len(grid.nearest(p)), len(segments))
+
+    def test_within(self):
+        grid = make_grid()
+        for p in points:
+            expected = [key for d, key in brute_force(p) if d <= 10.0]
+            self.assertEqual([key for _, key in grid.within(p, 10.0)], expected)
+            self.assertEqual(grid.any_within(p, 10.0), len(expected) > 0)
+        for d in (0.5, 3.0, 10.0):
+            self.assertEqual(grid.any_within_many(np.array([tuple(p) for p in points]), d).tolist(),
+                             [grid.any_within(p, d) for p in points])
+
+    def test_overlapping(self):
+        grid = make_grid()
+        lo, hi = (20.0, 30.0), (45.0, 50.0)
+        expected = {key for key, (a, b) in segments.items()
+                    if min(a.x, b.x) <= hi[0] and lo[0] <= max(a.x, b.x)
+                    and min(a.y, b.y) <= hi[1] and lo[1] <= max(a.y, b.y)}
+        self.assertEqual(grid.overlapping(lo, hi), expected)
+
+    def test_remove_and_update(self):
+        grid = make_grid()
+        p = points[0]
+        _, nearest = grid.nearest(p, 1)[0]
+        grid.remove(nearest)
+        self.assertNotIn(nearest, grid)
+        self.assertNotEqual(grid.nearest(p, 1)[0][1], nearest)
+        grid.insert(nearest, p, p + Vec2D(1.0, 1.0))
+        self.assertEqual(grid.nearest(p, 1), [(0.0, nearest)])
+        grid.update(nearest, Vec2D(200.0, 200.0), Vec2D(201.0, 201.0))
+        self.assertNotEqual(grid.nearest(p, 1)[0][1], nearest)
+        self.assertEqual(len(grid), len(segments))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import random
+import unittest
+
+import numpy as np
+
+import TerminalIndex as terminal_index_module
+from LinAlg import LineSegment, Vec2D
+from TerminalIndex import TerminalIndex
+from VesselTree import VesselTree
+
+
+def rn(): return random.uniform(0.0, 100.0)
+
+
+random.seed(1637682148)
+
+terminals = [Vec2D(rn(), rn()) for _ in range(150)]
+points = [Vec2D(rn(), rn()) for _ in range(300)]
+
+
+class TestTerminalIndex(unittest.TestCase):
+
+    def check(self, index):
+        distances, nearest = index.nearest(points)
+        for p, d, k in zip(points, distances, nearest):
+            lengths = [LineSegment(p, t).length for t in terminals]
+            self.assertAlmostEqual(d, min(lengths))
+            self.assertEqual(k, lengths.index(min(lengths)))
+        for r in (0.5, 4.0, 15.0):
+            expected = [sum(1 for t in terminals if LineSegment(p, t).length <= r) for p in points]
+            self.assertEqual(index.count_within(points, r).tolist(), expected)
+
+    def test_kd_tree(self):
+        self.check(TerminalIndex(terminals))
+
+    def test_grid_fallback(self):
+        kd = terminal_index_module.cKDTree
+        terminal_index_module.cKDTree = None
+        TerminalIndex.CHUNK = 1000  # Make sure that the points are measured in several chunks.
+        try:
+            index = TerminalIndex(terminals)
+            self.check(index)
+            self.assertEqual(TerminalIndex([]).count_within(points, 1.0).tolist(), [0] * len(points))
+        finally:
+            terminal_index_module.cKDTree = kd
+            TerminalIndex.CHUNK = 1 << 20
+
+    def test_tree(self):
+        t = VesselTree(1.0, Vec2D(0.0, 0.0))
+        root = t.create_child(VesselTree.ORIGIN, 1.0, Vec2D(10.0, 0.0))
+        t.bifurcate(root, Vec2D(5.0, 5.0))
+        t.bifurcate(root, Vec2D(9.0, -3.0))
+        index = t.terminal_index()
+        self.assertEqual(len(index), t.num_terminals_of(VesselTree.ORIGIN))
+        self.assertEqual(index.count_within(np.array([[9.0, -2.0]]), 2.5).tolist(), [2])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import os
+import tempfile
+import unittest
+
+from BloodVessel import Origin
+from LinAlg import Vec2D
+from SampleTrees import grow
+from TreeIO import TreeIO
+from VesselTree import VesselTree
+
+
+class TestTreeIO(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        _, (*_, cls.origin) = grow(20)
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "tree.vtree")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def assertSameTree(self, t, c):
+        vessels = list(t.descendants_of(VesselTree.ORIGIN))
+        self.assertEqual(list(c.descendants_of(VesselTree.ORIGIN)), vessels)
+        self.assertTrue((c.points == t.points).all())
+        self.assertTrue((c.scaling_factors == t.scaling_factors).all())
+        self.assertTrue((c.resistance_coefficients == t.resistance_coefficients).all())
+        self.assertEqual(c.cost_of(VesselTree.ORIGIN), t.cost_of(VesselTree.ORIGIN))
+        self.assertEqual([c.radius_of(i) for i in vessels], [t.radius_of(i) for i in vessels])
+        self.assertEqual(c.num_terminals_of(VesselTree.ORIGIN), t.num_terminals_of(VesselTree.ORIGIN))
+
+    def test_read_only(self):
+        t = self.origin.tree
+        TreeIO.save(self.origin, self.path)
+        c = TreeIO.load(self.path)
+        self.assertSameTree(t, c)
+        self.assertEqual(len(c), len(t))
+        # The loaded tree works as an ordinary tree for analysis.
+        self.assertEqual(Origin.from_tree(c).root.length, t.length_of(t.root))
+        self.assertRaises(ValueError, c.set_point, t.root, Vec2D(1.0, 1.0))
+
+    def test_copy_on_write(self):
+        t = self.origin.tree
+        TreeIO.save(t, self.path)
+        c = TreeIO.load(self.path, mode='c')
+        c.bifurcate(t.root, Vec2D(300.0, 300.0))
+        self.assertEqual(c.num_terminals_of(VesselTree.ORIGIN), t.num_terminals_of(VesselTree.ORIGIN) + 1)
+        # The file hasn't changed.
+        self.assertSameTree(t, TreeIO.load(self.path))
+
+    def test_removed_vessels(self):
+        t = self.origin.tree.copy()
+        t.remove_bifurcation(t.children_of(t.root)[0])
+        TreeIO.save(t, self.path)
+        c = TreeIO.load(self.path, mode='c')
+        self.assertSameTree(t, c)
+        self.assertEqual(c._free, t._free)
+        c.bifurcate(c.root, Vec2D(300.0, 300.0))
+        self.assertEqual(len(c), len(t) + 2)
+
+    def test_not_a_tree(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'\x00' * 100)
+        self.assertRaises(ValueError, TreeIO.load, self.path)
+
+
+if __name__ == '__main__':
+    unittest.main()
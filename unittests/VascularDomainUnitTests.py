@@ -0,0 +1,128 @@
+import random
+import unittest
+
+import numpy as np
+
+from LinAlg import Vec2D
+from VascularDomain import CircularVascularDomain, MaskVascularDomain, PolygonVascularDomain, \
+    RectangularVascularDomain
+
+
+class TestVascularDomain(unittest.TestCase):
+
+    def test_grid_array(self):
+        rectangle = RectangularVascularDomain(3.7, 11.0)
+        points, inside = rectangle.grid_array(37)
+        # The same points, in the same order, as a loop over the rows and columns.
+        expected = [(3.7 * (i / 37), 11.0 * (j / 37)) for i in range(37) for j in range(37)]
+        self.assertEqual([tuple(p) for p in points.tolist()], expected)
+        self.assertTrue(inside.all())
+        circle = CircularVascularDomain(400)
+        points, inside = circle.grid_array(37)
+        self.assertEqual(inside.tolist(), [circle.contains(Vec2D(x, y)) for x, y in points.tolist()])
+        self.assertEqual([tuple(p) for p in circle.point_grid(37)], [tuple(p) for p in points[inside].tolist()])
+
+    def test_contains_many(self):
+        random.seed(1637682149)
+        for domain in (RectangularVascularDomain(80.0, 50.0), CircularVascularDomain(40.0)):
+            points = np.array([(random.uniform(-10.0, 90.0), random.uniform(-10.0, 90.0)) for _ in range(500)])
+            self.assertEqual(domain.contains_many(points).tolist(),
+                             [domain.contains(Vec2D(x, y)) for x, y in points.tolist()])
+
+    def test_generate_points(self):
+        for domain in (RectangularVascularDomain(80.0, 50.0), CircularVascularDomain(40.0)):
+            points = domain.generate_points(2000, np.random.default_rng(1637682150))
+            self.assertEqual(points.shape, (2000, 2))
+            self.assertTrue(domain.contains_many(points).all())
+            # The same generator gives the same points.
+            self.assertTrue((points == domain.generate_points(2000, np.random.default_rng(1637682150))).all())
+        # The points of the circle are spread evenly over its area, so about a quarter are in the middle half.
+        middle = np.hypot(*(points - 40.0).T) < 20.0
+        self.assertAlmostEqual(middle.mean(), 0.25, delta=0.03)
+
+
+def star(n, holes=()):
+    theta = np.linspace(0.0, 2 * np.pi, n, endpoint=False)
+    r = 100.0 + 30.0 * np.sin(7 * theta)
+    return PolygonVascularDomain(np.column_stack((200.0 + r * np.cos(theta), 200.0 + r * np.sin(theta))), holes)
+
+
+def crossings(edges, x, y):
+    """Count the edges that a ray from (x, y) towards +x crosses, one edge at a time. """
+    return sum(1 for (ax, ay), (bx, by) in edges if (ay > y) != (by > y) and x < ax + (y - ay) * (bx - ax) / (by - ay))
+
+
+class TestPolygonVascularDomain(unittest.TestCase):
+
+    def test_square_with_hole(self):
+        d = PolygonVascularDomain([(0, 0), (10, 0), (10, 10), (0, 10)], [[(4, 4), (6, 4), (6, 6), (4, 6)]])
+        self.assertEqual(d.area, 96.0)
+        self.assertTrue(d.contains(Vec2D(1.0, 1.0)))
+        self.assertFalse(d.contains(Vec2D(5.0, 5.0)))
+        self.assertFalse(d.contains(Vec2D(11.0, 5.0)))
+        self.assertFalse(d.contains(Vec2D(5.0, -1.0)))
+
+    def test_contains_many(self):
+        random.seed(1637682152)
+        hole = [(190.0, 190.0), (210.0, 190.0), (210.0, 210.0), (190.0, 210.0)]
+        d = star(500, [hole])
+        self.assertAlmostEqual(d.area, np.pi * (100.0 ** 2 + 30.0 ** 2 / 2) - 400.0, delta=20.0)
+        rings = [d.outline.tolist(), hole]
+        edges = [(ring[k - 1], ring[k]) for ring in rings for k in range(len(ring))]
+        points = np.array([(random.uniform(50.0, 350.0), random.uniform(50.0, 350.0)) for _ in range(2000)])
+        expected = [crossings(edges, x, y) % 2 == 1 for x, y in points.tolist()]
+        self.assertEqual(d.contains_many(points).tolist(), expected)
+        self.assertEqual([d.contains(Vec2D(x, y)) for x, y in points[:100].tolist()], expected[:100])
+
+    def test_long_edges_and_holes(self):
+        # A square whose left and right sides are single long edges, while the bottom is a fine zigzag of short ones.
+        # The holes are a circle of short edges and a long thin sliver.
+        zigzag = [(x, 0.0 if k % 2 == 0 else 1.0) for k, x in enumerate(np.linspace(1000.0, 0.0, 3001).tolist())]
+        outline = [(0.0, 1000.0), (1000.0, 1000.0)] + zigzag
+        theta = np.linspace(0.0, 2 * np.pi, 400, endpoint=False)
+        circle = np.column_stack((300.0 + 50.0 * np.cos(theta), 300.0 + 50.0 * np.sin(theta))).tolist()
+        sliver = [(600.0, 50.0), (610.0, 50.0), (605.0, 950.0)]
+        d = PolygonVascularDomain(outline, [circle, sliver])
+        rings = [outline, circle, sliver]
+        edges = [(ring[k - 1], ring[k]) for ring in rings for k in range(len(ring))]
+        self.assertLessEqual(len(d._slab_edges), 3 * len(d._edges))
+        rng = np.random.default_rng(1637682154)
+        points = rng.uniform(-10.0, 1010.0, size=(1000, 2))
+        expected = [crossings(edges, x, y) % 2 == 1 for x, y in points.tolist()]
+        self.assertEqual(d.contains_many(points).tolist(), expected)
+        self.assertFalse(d.contains(Vec2D(300.0, 300.0)))
+        self.assertFalse(d.contains(Vec2D(605.0, 500.0)))
+        self.assertTrue(d.contains(Vec2D(500.0, 500.0)))
+
+    def test_generate_points(self):
+        d = star(2000)
+        points = d.generate_points(3000, np.random.default_rng(1637682153))
+        self.assertEqual(points.shape, (3000, 2))
+        self.assertTrue(d.contains_many(points).all())
+        self.assertTrue(d.contains(d.generate_point()))
+        points, inside = d.grid_array(40)
+        self.assertEqual([tuple(p) for p in d.point_grid(40)], [tuple(p) for p in points[inside].tolist()])
+
+
+class TestMaskVascularDomain(unittest.TestCase):
+
+    def test_mask(self):
+        mask = np.random.default_rng(1637682154).random((30, 20)) < 0.4
+        d = MaskVascularDomain(mask, cell_size=2.0, origin=(10.0, 5.0))
+        self.assertEqual(d.area, mask.sum() * 4.0)
+        for i, j in ((0, 0), (7, 3), (29, 19)):
+            self.assertEqual(d.contains(Vec2D(10.0 + 2.0 * i + 1.0, 5.0 + 2.0 * j + 1.0)), mask[i, j])
+        self.assertFalse(d.contains(Vec2D(9.0, 6.0)))
+        self.assertFalse(d.contains(Vec2D(11.0, 46.0)))
+        points = d.generate_points(5000, np.random.default_rng(1637682155))
+        self.assertTrue(d.contains_many(points).all())
+        # Every pixel is equally likely.
+        i, j = ((points - (10.0, 5.0)) // 2.0).astype(int).T
+        counts = np.bincount(np.ravel_multi_index((i, j), mask.shape), minlength=mask.size)[mask.ravel()]
+        self.assertAlmostEqual(counts.mean(), 5000 / mask.sum())
+        self.assertLess(counts.max(), 3 * counts.mean())
+        self.assertTrue(d.contains(d.generate_point()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,247 @@
+import gc
+import pickle
+import random
+import unittest
+from math import pi
+
+from BloodVessel import Origin
+from LinAlg import Vec2D
+from PointSampleHeuristic import PointSampleHeuristic
+from VesselTree import VesselTree
+
+
+def make_tree():
+    t = VesselTree(1.0, Vec2D(0.0, 0.0))
+    root = t.create_child(VesselTree.ORIGIN, 1.0, Vec2D(10.0, 0.0))
+    t.bifurcate(root, Vec2D(5.0, 5.0))
+    t.bifurcate(root, Vec2D(9.0, -3.0))
+    return t, root
+
+
+class TestVesselTree(unittest.TestCase):
+
+    def test_create_child(self):
+        t = VesselTree(1.0, Vec2D(0.0, 0.0))
+        root = t.create_child(VesselTree.ORIGIN, 1.0, Vec2D(3.0, 4.0))
+        self.assertEqual(t.root, root)
+        self.assertEqual(t.parent_of(root), VesselTree.ORIGIN)
+        self.assertEqual(t.children_of(VesselTree.ORIGIN), (root,))
+        self.assertEqual(t.point_of(root), Vec2D(3.0, 4.0))
+        self.assertEqual(t.proximal_point_of(root), Vec2D(0.0, 0.0))
+        self.assertEqual(t.length_of(root), 5.0)
+        self.assertEqual(len(t), 1)
+
+    def test_bifurcate(self):
+        t = VesselTree(1.0, Vec2D(0.0, 0.0))
+        root = t.create_child(VesselTree.ORIGIN, 1.0, Vec2D(10.0, 0.0))
+        a, b = t.bifurcate(root, Vec2D(5.0, 5.0))
+        self.assertEqual(t.root, a)
+        self.assertEqual(t.children_of(a), (root, b))
+        self.assertEqual(t.parent_of(root), a)
+        self.assertEqual(t.point_of(a), Vec2D(5.0, 0.0))
+        self.assertEqual(t.num_terminals_of(VesselTree.ORIGIN), 2)
+        self.assertEqual(list(t.descendants_of(a)), [a, root, b])
+        self.assertAlmostEqual(t.scaling_factor_of(root) ** 3 + t.scaling_factor_of(b) ** 3, 1.0)
+
+    def test_remove_bifurcation_reuses_indices(self):
+        t, root = make_tree()
+        n = len(t)
+        a = t.parent_of(root)
+        t.remove_bifurcation(root)
+        self.assertEqual(len(t), n - 2)
+        self.assertNotIn(a, t.descendants_of(VesselTree.ORIGIN))
+        a2, _ = t.bifurcate(root, Vec2D(9.0, -3.0))
+        self.assertEqual(len(t), n)
+        self.assertLess(a2, t.points.shape[0])
+
+    def test_cost(self):
+        t, _ = make_tree()
+        expected = sum(pi * t.radius_of(i) ** 2 * t.length_of(i) for i in t.descendants_of(t.root))
+        self.assertAlmostEqual(t.cost_of(VesselTree.ORIGIN), expected)
+
+    def test_cost_is_kept_up_to_date(self):
+        t, root = make_tree()
+
+        def full_cost():
+            return sum(pi * t.radius_of(i) ** 2 * t.length_of(i) for i in t.descendants_of(t.root))
+
+        t.geometrically_optimise(root)
+        self.assertAlmostEqual(t.cost_of(VesselTree.ORIGIN), full_cost())
+        t.set_point(t.parent_of(root), Vec2D(6.0, 1.0))
+        self.assertAlmostEqual(t.cost_of(VesselTree.ORIGIN), full_cost())
+        t.remove_bifurcation(root)
+        self.assertAlmostEqual(t.cost_of(VesselTree.ORIGIN), full_cost())
+
+    def test_caches_in_debug_mode(self):
+        VesselTree.DEBUG = True
+        try:
+            t, root = make_tree()
+            t.geometrically_optimise(root)
+            a, b = t.bifurcate(t.parent_of(root), Vec2D(2.0, -4.0))
+            t.geometrically_optimise(t.children_of(a)[0])
+            self.assertEqual(t.num_terminals_of(VesselTree.ORIGIN), 4)
+            self.assertEqual(t.num_terminals_of(a), 3)
+            t.remove_bifurcation(root)
+            self.assertEqual(t.num_terminals_of(VesselTree.ORIGIN), 3)
+            t.set_scaling_factor(b, 0.5)
+            self.assertEqual(t.radius_of(b), 0.5 * t.radius_of(a))
+        finally:
+            VesselTree.DEBUG = False
+        t._num_terminals[b] = 7
+        self.assertRaises(AssertionError, t.check_caches)
+
+    def test_evaluate_bifurcation(self):
+        random.seed(1637682142)
+        t = VesselTree(2.0, Vec2D(50.0, 0.0))
+        t.create_child(VesselTree.ORIGIN, 1.0, Vec2D(50.0, 50.0))
+        for _ in range(40):
+            terminal = Vec2D(random.uniform(0.0, 100.0), random.uniform(0.0, 100.0))
+            for i in list(t.descendants_of(t.root)):
+                before = t.points.copy(), t.scaling_factors.copy(), t.cost_of(VesselTree.ORIGIN)
+                e = t.evaluate_bifurcation(i, terminal)
+                # Nothing has changed
+                self.assertTrue((t.points == before[0]).all())
+                self.assertTrue((t.scaling_factors == before[1]).all())
+                self.assertEqual(t.cost_of(VesselTree.ORIGIN), before[2])
+                # And the result is the same as if we had made the bifurcation.
+                c = t.copy()
+                c.bifurcate(i, terminal)
+                c.geometrically_optimise(i)
+                a = c.parent_of(i)
+                self.assertEqual(e.cost, c.cost_of(VesselTree.ORIGIN))
+                self.assertEqual(e.point, c.point_of(a))
+                self.assertEqual(e.valid, all(c.radius_of(v) <= c.length_of(v) for v in (a, *c.children_of(a))))
+            t.bifurcate(random.choice(list(t.descendants_of(t.root))), terminal)
+
+    def test_refine_bifurcation(self):
+        random.seed(1637682143)
+        t, root = make_tree()
+        for i in list(t.descendants_of(t.root)):
+            terminal = Vec2D(random.uniform(-5.0, 15.0), random.uniform(-5.0, 15.0))
+            e = t.evaluate_bifurcation(i, terminal)
+            refined = t.evaluate_bifurcation(i, terminal, refine=True)
+            self.assertLessEqual(refined.cost, e.cost)
+            c = t.copy()
+            c.bifurcate(i, terminal)
+            c.geometrically_optimise(i, refine=True)
+            self.assertEqual(refined.cost, c.cost_of(VesselTree.ORIGIN))
+            self.assertEqual(refined.point, c.point_of(c.parent_of(i)))
+
+    def test_sample_point_array(self):
+        random.seed(1637682144)
+        for _ in range(20):
+            p, q, r = (Vec2D(random.uniform(-100.0, 100.0), random.uniform(-100.0, 100.0)) for _ in range(3))
+            sample = PointSampleHeuristic(p, q, r, VesselTree.INTERVALS)
+            # Exactly the same points, so that the vectorised optimisation makes the same choices.
+            self.assertEqual([tuple(x) for x in sample.points], [tuple(x) for x in sample.point_array.tolist()])
+
+    def test_copy(self):
+        t, root = make_tree()
+        c = t.copy()
+        self.assertEqual(list(c.descendants_of(VesselTree.ORIGIN)), list(t.descendants_of(VesselTree.ORIGIN)))
+        # Copies keep the resistance coefficients, so the copy has exactly the same cost.
+        self.assertEqual(c.cost_of(VesselTree.ORIGIN), t.cost_of(VesselTree.ORIGIN))
+        c.bifurcate(root, Vec2D(1.0, 1.0))
+        self.assertEqual(len(c), len(t) + 2)
+        self.assertEqual(t.num_terminals_of(VesselTree.ORIGIN), 3)
+
+    def test_snapshot(self):
+        random.seed(1637682145)
+        t, root = make_tree()
+        snapshots = []
+        copies = []
+        for _ in range(30):
+            snapshots.append(t.snapshot())
+            copies.append(t.copy())
+            vessels = list(t.descendants_of(t.root))
+            if len(vessels) > 3 and random.random() < 0.3:
+                t.remove_bifurcation(random.choice([i for i in vessels if t.parent_of(i) != VesselTree.ORIGIN]))
+            else:
+                terminal = Vec2D(random.uniform(-5.0, 15.0), random.uniform(-5.0, 15.0))
+                i = random.choice(vessels)
+                t.bifurcate(i, terminal)
+                t.geometrically_optimise(i)
+        # Fill the snapshots in out of order, after all the changes have been made.
+        order = list(range(len(snapshots)))
+        random.shuffle(order)
+        for k in order:
+            s, c = snapshots[k], copies[k]
+            self.assertEqual(list(s.descendants_of(VesselTree.ORIGIN)), list(c.descendants_of(VesselTree.ORIGIN)))
+            self.assertTrue((s.points == c.points).all())
+            self.assertTrue((s.scaling_factors == c.scaling_factors).all())
+            self.assertEqual(s.cost_of(VesselTree.ORIGIN), c.cost_of(VesselTree.ORIGIN))
+            self.assertEqual(s.num_terminals_of(VesselTree.ORIGIN), c.num_terminals_of(VesselTree.ORIGIN))
+            s.check_caches()
+        # A snapshot can be changed without changing the tree.
+        cost = t.cost_of(VesselTree.ORIGIN)
+        s = t.snapshot()
+        s.bifurcate(s.root, Vec2D(1.0, 1.0))
+        self.assertEqual(t.cost_of(VesselTree.ORIGIN), cost)
+        self.assertIsNone(pickle.loads(pickle.dumps(t))._journal)
+
+    def test_journal_is_trimmed(self):
+        random.seed(1637682145)
+        t, root = make_tree()
+
+        def grow(snapshots):
+            for _ in range(snapshots):
+                yield t.snapshot()
+                t.bifurcate(random.choice(list(t.descendants_of(t.root))),
+                            Vec2D(random.uniform(-5.0, 15.0), random.uniform(-5.0, 15.0)))
+
+        snapshots = list(grow(10))
+        self.assertEqual(len(t._journal), 10)
+        # Filling in a snapshot drops its claim on the journal, so the changes from before the oldest snapshot that is
+        # still waiting are dropped.
+        snapshots[0].points
+        snapshots[1].points
+        self.assertEqual(len(t._journal), 8)
+        snapshots[5].points  # Not the oldest, so nothing can be dropped yet.
+        self.assertEqual(len(t._journal), 8)
+        snapshots.append(t.snapshot())
+        self.assertEqual(len(t._journal), 9)
+        # Throwing the snapshots away releases the journal altogether.
+        del snapshots
+        gc.collect()
+        t.bifurcate(t.root, Vec2D(2.0, 2.0))
+        self.assertIsNone(t._journal)
+        # Snapshots that are filled in straight away, as generate_trees does, never leave more than one dict.
+        for s in grow(20):
+            s.points
+            self.assertLessEqual(len(t._journal or ()), 1)
+        # Nor do snapshots that are thrown away without being used, once the next one is taken.
+        for s in grow(20):
+            Origin.from_tree(s)
+            self.assertLessEqual(len(t._journal), 2)
+        # The snapshots taken after the journal was released are still right.
+        c = t.copy()
+        s = t.snapshot()
+        t.remove_bifurcation(t.children_of(t.root)[0])
+        self.assertTrue((s.points == c.points).all())
+        self.assertEqual(s.cost_of(VesselTree.ORIGIN), c.cost_of(VesselTree.ORIGIN))
+
+    def test_pickle(self):
+        t, root = make_tree()
+        t.geometrically_optimise(root)
+        c = pickle.loads(pickle.dumps(t))
+        self.assertEqual(c.views, {})
+        self.assertEqual(len(c), len(t))
+        self.assertEqual(c.cost_of(VesselTree.ORIGIN), t.cost_of(VesselTree.ORIGIN))
+        self.assertEqual(c.evaluate_bifurcation(root, Vec2D(2.0, 8.0)), t.evaluate_bifurcation(root, Vec2D(2.0, 8.0)))
+        # Only the vessels in use are sent, but the snapshot can still grow.
+        self.assertEqual(len(c._points), len(t) + 1)
+        c.bifurcate(root, Vec2D(1.0, 1.0))
+        self.assertEqual(c.num_terminals_of(VesselTree.ORIGIN), 4)
+
+    def test_grow(self):
+        t = VesselTree(1.0, Vec2D(0.0, 0.0), capacity=2)
+        v = t.create_child(VesselTree.ORIGIN, 1.0, Vec2D(100.0, 0.0))
+        for i in range(20):
+            t.bifurcate(v, Vec2D(float(i), 10.0 + i))
+        self.assertEqual(len(t), 41)
+        self.assertEqual(t.num_terminals_of(VesselTree.ORIGIN), 21)
+        self.assertEqual(t.point_of(v), Vec2D(100.0, 0.0))
+
+
+if __name__ == '__main__':
+    unittest.main()